@@ -1,10 +1,19 @@
 from django.contrib import admin
-from .models import BotConfig, BotState
+from .models import BotConfig, BotOrder, BotState
 
 @admin.register(BotConfig)
 class BotConfigAdmin(admin.ModelAdmin):
-    list_display = ("id","qty","avg","grid_step","levels_up","levels_down","stop_from_avg","interval","telegram_enabled","created_at")
+    list_display = ("id","symbol","qty","avg","grid_step","levels_up","levels_down","stop_from_avg","interval","telegram_enabled","auto_trade","created_at")
+
+    def get_readonly_fields(self, request, obj=None):
+        # com auto trade, qty/avg são da posição dos fills
+        return ("qty", "avg") if obj is not None and obj.auto_trade else ()
 
 @admin.register(BotState)
 class BotStateAdmin(admin.ModelAdmin):
     list_display = ("id","running","ref_price","trailing_high","last_level_idx","updated_at")
+
+@admin.register(BotOrder)
+class BotOrderAdmin(admin.ModelAdmin):
+    list_display = ("id","symbol","side","kind","qty","price","status","filled_qty","avg_fill_price","created_at")
+    list_filter = ("symbol","status","side")
@@ -1,6 +1,45 @@
 from django.apps import AppConfig
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+
+
+def _sqlite_pragmas(sender, connection, **kwargs):
+    # WAL: leituras do painel não bloqueiam as gravações do runner (e vice-versa)
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cur:
+            cur.execute("PRAGMA journal_mode=WAL;")
+            cur.execute("PRAGMA synchronous=NORMAL;")
+            cur.execute("PRAGMA busy_timeout=5000;")
+
+
+def _config_saved(sender, instance, **kwargs):
+    # config nova chega ao bot sem reinício: runbot (socket) e/ou bot rodando neste processo
+    from .runner_registry import BotRegistry
+    from .supervisor import notify_config_change
+
+    def send():
+        notify_config_change(instance)
+        BotRegistry.reload(instance)
+    transaction.on_commit(send)
+
+
+def _triggers_changed(sender, instance, **kwargs):
+    from .runner_registry import BotRegistry
+    from .supervisor import notify_triggers_change
+
+    def send():
+        notify_triggers_change(instance.symbol)
+        BotRegistry.reload_triggers(instance.symbol)
+    transaction.on_commit(send)
 
 
 class GridbotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gridbot'
+
+    def ready(self):
+        connection_created.connect(_sqlite_pragmas, dispatch_uid="gridbot_sqlite_pragmas")
+        post_save.connect(_config_saved, sender="gridbot.BotConfig", dispatch_uid="gridbot_config_saved")
+        post_save.connect(_triggers_changed, sender="gridbot.PriceTrigger", dispatch_uid="gridbot_trigger_saved")
+        post_delete.connect(_triggers_changed, sender="gridbot.PriceTrigger", dispatch_uid="gridbot_trigger_deleted")
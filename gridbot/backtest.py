@@ -0,0 +1,251 @@
+import csv, json, time
+import numpy as np
+from .bot_runner import GridBotThread, INTERVAL_SEC, pct
+from .metrics import NULL
+
+COLS = ("t", "o", "h", "l", "c")
+
+def as_arrays(candles):
+    # lista de dicts (formato get_klines) ou dict de colunas → dict de np.ndarray
+    if isinstance(candles, dict):
+        return {k: np.ascontiguousarray(candles[k], dtype=np.int64 if k == "t" else np.float64) for k in COLS}
+    n = len(candles)
+    return {k: np.fromiter((c[k] for c in candles), dtype=np.int64 if k == "t" else np.float64, count=n)
+            for k in COLS}
+
+def load_candles(path):
+    # .npz (colunas t,o,h,l,c), .json (lista de dicts ou klines crus) ou .csv (t,o,h,l,c[,...])
+    if path.endswith(".npz"):
+        with np.load(path) as z:
+            return as_arrays({k: z[k] for k in COLS})
+    if path.endswith(".json"):
+        rows = json.load(open(path, "r", encoding="utf-8"))
+        if rows and not isinstance(rows[0], dict):
+            rows = [{"t": r[0], "o": r[1], "h": r[2], "l": r[3], "c": r[4]} for r in rows]
+        return as_arrays({k: [float(r[k]) for r in rows] for k in COLS})
+    rows = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for r in csv.reader(f):
+            try:
+                rows.append([float(x) for x in r[:5]])
+            except ValueError:
+                continue  # cabeçalho
+    a = np.array(rows, dtype=np.float64).reshape(-1, 5)
+    return as_arrays({k: a[:, i] for i, k in enumerate(COLS)})
+
+def store_candles(symbol, interval, start=None, end=None, store=None):
+    # colunas direto do CandleStore (fatias de memmap, sem cópia)
+    from .candle_store import default_store
+    return (store or default_store()).read(symbol, interval, start=start, end=end)
+
+def base_step_ms(t):
+    # intervalo das velas de entrada (menor diferença entre aberturas)
+    d = np.diff(t)
+    d = d[d > 0]
+    return int(d.min()) if len(d) else 60_000
+
+
+class CandleFeed:
+    """Velas visíveis em cada tick do replay, em qualquer timeframe múltiplo do
+    timeframe base; a última vela devolvida é a que está em formação no tick."""
+
+    def __init__(self, arr, step_ms=None):
+        self.a = arr
+        self.step_ms = step_ms or base_step_ms(arr["t"])
+        self._tf = {}
+        self._rows = None
+
+    def _base_rows(self):
+        # colunas como listas Python: montar dicts a partir delas é bem mais barato
+        if self._rows is None:
+            self._rows = [self.a[k].tolist() for k in COLS]
+        return self._rows
+
+    def _buckets(self, tf_ms):
+        if tf_ms not in self._tf:
+            a = self.a
+            b = a["t"] // tf_ms
+            starts = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+            self._tf[tf_ms] = (starts, {
+                "t": b[starts] * tf_ms,
+                "o": a["o"][starts],
+                "h": np.maximum.reduceat(a["h"], starts),
+                "l": np.minimum.reduceat(a["l"], starts),
+                "c": a["c"][np.r_[starts[1:] - 1, len(b) - 1]],
+            })
+        return self._tf[tf_ms]
+
+    def klines(self, i, tf_ms, limit):
+        a = self.a
+        if tf_ms <= self.step_ms:
+            t, o, h, l, c = self._base_rows()
+            return [{"t": t[j], "o": o[j], "h": h[j], "l": l[j], "c": c[j]} for j in range(max(0, i - limit + 1), i + 1)]
+        starts, agg = self._buckets(tf_ms)
+        k = int(np.searchsorted(starts, i, "right")) - 1
+        out = [{"t": int(agg["t"][j]), "o": float(agg["o"][j]), "h": float(agg["h"][j]),
+                "l": float(agg["l"][j]), "c": float(agg["c"][j])} for j in range(max(0, k - limit + 1), k)]
+        s = starts[k]
+        out.append({"t": int(agg["t"][k]), "o": float(a["o"][s]), "h": float(a["h"][s:i + 1].max()),
+                    "l": float(a["l"][s:i + 1].min()), "c": float(a["c"][i])})
+        return out
+
+
+class BacktestBot(GridBotThread):
+    """GridBotThread com relógio e I/O injetados: sem rede, sem DB, sem sleep.
+    Os sinais vão para `signals` no mesmo formato que o bot gravaria."""
+
+    def __init__(self, cfg, candles: CandleFeed):
+        super().__init__(cfg, None)
+        self.candles = candles
+        self.tf_ms = INTERVAL_SEC.get(cfg.atr_interval, 60) * 1000
+        self.signals = []
+        self.i = 0
+        self.now_ms = 0
+        self.clock = lambda: self.now_ms / 1000.0
+        self.metrics = NULL
+        self._t = candles._base_rows()[0]
+
+    def set_tick(self, i):
+        # tick no fechamento da vela i
+        self.i = i
+        self.now_ms = self._t[i] + self.candles.step_ms
+
+    def maybe_alert(self, key, msg, cooldown=120, digest=False): pass
+    def _update_state(self, **fields): pass
+    def _load_json(self): return {}
+    def _save_json(self): pass
+    def _load_triggers(self): return []
+    def _update_trigger(self, tid, **fields): pass
+
+    def _fetch_klines(self, limit):
+        return self.candles.klines(self.i, self.tf_ms, limit)
+
+    def _post_signal(self, kind, msg, price=None, pnl_pct=None, now=None):
+        self.signals.append({"t": self.now_ms, "kind": kind, "message": msg, "price": price, "pnl_pct": pnl_pct})
+
+
+def replay(cfg, candles, start=0):
+    # caminho de referência: tick a tick pelo GridBotThread real
+    feed = candles if isinstance(candles, CandleFeed) else CandleFeed(as_arrays(candles))
+    c = feed.a["c"]
+    bot = BacktestBot(cfg, feed)
+    bot.set_tick(start)
+    bot.start_bot(float(c[start]))
+    for i in range(start + 1, len(c)):
+        bot.set_tick(i)
+        bot.on_tick(float(c[i]))
+    return bot.signals
+
+
+def run_backtest(cfg, candles, start=0, texts=True):
+    """Mesmo fluxo de sinais de `replay`, com o laço quente vetorizado.
+
+    A grade é fixa depois do startup, então máximo móvel, linha de stop e
+    célula de cada tick saem em NumPy; só os refreshes de ATR (na cadência de
+    atr_refresh_sec) e os ticks que podem mudar o estado dos sinais (stop, rearme,
+    troca de célula) passam pelo código do bot, com o mesmo latch e a mesma deduplicação.
+    Com texts=False os sinais saem sem mensagem (grid traz "up"), para varreduras.
+    """
+    feed = candles if isinstance(candles, CandleFeed) else CandleFeed(as_arrays(candles))
+    c = feed.a["c"]
+    n = len(c)
+    bot = BacktestBot(cfg, feed)
+    bot.set_tick(start)
+    bot.start_bot(float(c[start]))
+    if n <= start + 1:
+        return bot.signals
+
+    ticks = np.arange(start + 1, n)
+    price = c[start + 1:]
+    th = np.maximum(np.maximum.accumulate(price), bot.trailing_high)
+    now_s = (feed.a["t"][start + 1:] + feed.step_ms) / 1000.0
+
+    # refreshes de ATR: cada um pelo próprio _update_atr_and_effective_params
+    seg_i = [start]
+    seg = [(bot.atr_value, bot.atr_trailing_stop is not None, bot.eff_grid_step, bot.eff_step_down)]
+    if cfg.use_atr:
+        k, m = 0, len(ticks)
+        price_l, th_l, now_l = price.tolist(), th.tolist(), now_s.tolist()
+        while True:
+            # mesma regra do bot: sem ATR válido, tenta de novo no próximo tick
+            if bot.atr_value is not None and bot.eff_grid_step is not None and k < m \
+                    and now_l[k] < bot.atr_next_ts:
+                k = int(np.searchsorted(now_s, bot.atr_next_ts, "left"))
+            if k >= m:
+                break
+            bot.set_tick(start + 1 + k)
+            bot._update_atr_and_effective_params(price_l[k], th_l[k])
+            seg_i.append(start + 1 + k)
+            seg.append((bot.atr_value, bot.atr_trailing_stop is not None, bot.eff_grid_step, bot.eff_step_down))
+            k += 1
+    else:
+        seg = [(None, False, cfg.grid_step, None)]
+    which = np.searchsorted(np.array(seg_i), ticks, "right") - 1
+    atr = np.array([s[0] if s[0] is not None else np.nan for s in seg])[which]
+    trail = np.array([s[1] for s in seg])[which]
+    eff = [s[2:] for s in seg]
+
+    # stop (PM e trailing por ATR) e célula da grade, tudo de uma vez
+    stop_pm = cfg.avg * (1 - cfg.stop_from_avg/100.0)
+    stop_line = np.where(trail, np.maximum(stop_pm, th - cfg.atr_n_stop * atr), stop_pm)
+    # o latch do stop só muda abaixo da linha e no primeiro tick de rearme depois disso
+    stop_hit = price <= stop_line
+    hits = np.flatnonzero(stop_hit)
+    clears = np.flatnonzero(~stop_hit & (price >= stop_line * (1 + bot.stop_latch.rearm)))
+    nxt = np.searchsorted(clears, hits, "right")
+    stop_k = stop_hit.copy()
+    stop_k[clears[nxt[nxt < len(clears)]]] = True
+
+    lv = np.frombuffer(bot.levels, dtype=np.float64)
+    cell_of = lambda x: np.clip(np.searchsorted(lv, x, "right") - 1, 0, bot.grid.cells - 1)
+    band = bot._band()
+    if band > 0:
+        # histerese: a célula só pode mudar onde uma das bordas muda
+        lo, hi = cell_of(price / (1 + band)), cell_of(price / (1 - band))
+        cand = np.flatnonzero(np.r_[True, (lo[1:] != lo[:-1]) | (hi[1:] != hi[:-1])])
+        last, vals = bot.last_idx, []
+        for a, b in zip(lo[cand].tolist(), hi[cand].tolist()):
+            last = max(a, min(last, b))
+            vals.append(last)
+        idx = np.repeat(vals, np.diff(np.r_[cand, len(price)]))
+    else:
+        idx = cell_of(price)
+    prev = np.r_[bot.last_idx, idx[:-1]]
+    moved = idx != prev
+
+    post = bot._post_signal
+    for k in np.flatnonzero(stop_k | moved):
+        i, p = int(ticks[k]), float(price[k])
+        bot.set_tick(i)
+        bot.eff_grid_step, bot.eff_step_down = eff[which[k]]
+        pnl_pct = pct(p, cfg.avg)
+        if stop_k[k] and bot._stop_event(p, float(stop_line[k])):
+            pnl_val = (p - cfg.avg) * cfg.qty
+            post("stop", bot._stop_text(p, float(stop_line[k]), pnl_pct, pnl_val) if texts else None,
+                 price=p, pnl_pct=pnl_pct)
+        if moved[k]:
+            a, b = int(prev[k]), int(idx[k])
+            for cell in bot.grid.cells_between(a, b):
+                if not bot._grid_event(cell, b > a):
+                    continue
+                post("grid", bot._grid_text(b > a, cell, p, pnl_pct) if texts else None, price=p, pnl_pct=pnl_pct)
+                if not texts:
+                    bot.signals[-1]["up"] = b > a
+    return bot.signals
+
+
+def summarize(signals, elapsed=None, ticks=None):
+    out = {"signals": len(signals)}
+    for s in signals:
+        out[s["kind"]] = out.get(s["kind"], 0) + 1
+    if elapsed is not None:
+        out["elapsed_s"] = round(elapsed, 3)
+        if ticks:
+            out["ticks_per_s"] = int(ticks / max(elapsed, 1e-9))
+    return out
+
+
+def timed_backtest(cfg, candles, start=0):
+    t0 = time.perf_counter()
+    sig = run_backtest(cfg, candles, start)
+    return sig, time.perf_counter() - t0
@@ -0,0 +1,232 @@
+import os, json, time, platform, subprocess, tempfile
+import numpy as np
+from .backtest import BacktestBot, CandleFeed
+from .bot_runner import Grid, GridBotThread, calc_atr
+from .checkpoint import Checkpoint
+from .indicators import StreamingATR, StreamingIndicators, latest
+from .metrics import Registry
+from .notify import Notifier
+
+CASES = []   # (nome, {param: [valores]}, fábrica, precisa_de_banco)
+ROWS_MAX = 1_000_000    # casos com uma lista de dicts por vela: acima disso são GBs de memória
+
+def case(name, db=False, **grid):
+    """Registra um caso. A fábrica recebe os parâmetros e devolve (ops, run):
+    `run()` é o trecho cronometrado e `ops` quantas operações ele faz;
+    `run.cleanup()`, se existir, roda depois das repetições."""
+    def deco(fn):
+        CASES.append((name, grid, fn, db))
+        return fn
+    return deco
+
+
+# --- dados sintéticos (determinísticos pela seed) ---
+def synthetic_prices(n, seed=7, start=0.25, vol=0.0015):
+    rnd = np.random.default_rng(seed)
+    return start * np.exp(np.cumsum(rnd.normal(0, vol, n)))
+
+def synthetic_candles(n, seed=7, step_ms=60_000):
+    c = synthetic_prices(n, seed)
+    o = np.r_[c[0], c[:-1]]
+    wick = np.abs(np.random.default_rng(seed + 1).normal(0, 0.0008, n)) * c
+    return {"t": 1_700_000_040_000 + np.arange(n, dtype=np.int64) * step_ms, "o": o,
+            "h": np.maximum(o, c) + wick, "l": np.minimum(o, c) - wick, "c": c, "v": np.ones(n)}
+
+def _rows(ticks):
+    # velas no formato de get_klines, limitadas a ROWS_MAX (o caso mede len(rows) operações)
+    n = min(ticks, ROWS_MAX)
+    a = synthetic_candles(n)
+    return [{"t": int(a["t"][i]), "o": float(a["o"][i]), "h": float(a["h"][i]),
+             "l": float(a["l"][i]), "c": float(a["c"][i])} for i in range(n)]
+
+
+# --- casos ---
+@case("calc_atr", ticks="ticks")
+def _calc_atr(ticks):
+    rows = _rows(ticks)
+    return len(rows), lambda: calc_atr(rows, 14)
+
+@case("streaming_atr", ticks="ticks")
+def _streaming_atr(ticks):
+    rows = _rows(ticks)
+
+    def run():
+        st = StreamingATR(14)
+        for r in rows:
+            st.update(r)
+    return len(rows), run
+
+@case("indicators_batch", symbols=[100, 500], window=[200])
+def _indicators_batch(symbols, window):
+    # fechamento de vela em lote: uma linha por símbolo
+    a = synthetic_candles(symbols * window)
+    cols = {k: a[k].reshape(symbols, window) for k in ("h", "l", "c")}
+    return symbols, lambda: latest(cols)
+
+@case("streaming_indicators", ticks="ticks")
+def _streaming_indicators(ticks):
+    rows = _rows(ticks)
+
+    def run():
+        st = StreamingIndicators()
+        for r in rows:
+            st.update(r)
+    return len(rows), run
+
+@case("grid_build", levels="levels")
+def _grid_build(levels):
+    return 100, lambda: [Grid(0.25, 0.6, levels, levels) for _ in range(100)]
+
+@case("grid_index", levels="levels", ticks="ticks")
+def _grid_index(levels, ticks):
+    g = Grid(0.25, 0.6, levels, levels)
+    prices = synthetic_prices(ticks).tolist()
+    return ticks, lambda: [g.index(p) for p in prices]
+
+@case("checkpoint_save", ticks=[500])
+def _checkpoint(ticks):
+    tmp = tempfile.TemporaryDirectory(prefix="bench-cp-")
+    cp = Checkpoint(os.path.join(tmp.name, "grid_state.json"))
+
+    def run():
+        for i in range(ticks):
+            cp.put("POLUSDT", {"ref_price": 0.25, "last_level_idx": i % 16, "trailing_high": 0.26})
+            cp.save()
+    run.cleanup = tmp.cleanup
+    return ticks, run
+
+@case("state_update", db=True, mode=["direct", "writer"], ticks=[1000])
+def _state_update(mode, ticks):
+    from .models import BotState
+    from .persistence import StateWriter
+    st = BotState.objects.create(symbol="BENCH")
+    bot = GridBotThread(_bench_cfg(), st)
+    bot.metrics = Registry()
+
+    def run():
+        w = None
+        if mode == "writer":
+            w = bot.writer = StateWriter()
+            w.start()
+        for i in range(ticks):
+            bot._update_state(last_price=0.25 + i * 1e-6, last_level_idx=i % 16)
+        if w is not None:
+            w.stop()
+    return ticks, run
+
+@case("e2e_loop", db=True, ticks="e2e_ticks", use_atr=[False, True])
+def _e2e(ticks, use_atr):
+    from .models import BotState
+    from .persistence import StateWriter
+    candles = CandleFeed(synthetic_candles(ticks + 200))
+    tmp = tempfile.TemporaryDirectory(prefix="bench-e2e-")
+
+    def run():
+        bot = SimBot(_bench_cfg(use_atr=use_atr), candles, BotState.objects.create(symbol="BENCH"))
+        bot.checkpoint = Checkpoint(os.path.join(tmp.name, f"{time.perf_counter_ns()}.json"))
+        bot.writer = StateWriter()
+        bot.writer.start()
+        c = candles.a["c"]
+        bot.set_tick(200)
+        bot.start_bot(float(c[200]))
+        for i in range(201, 200 + ticks):
+            bot.set_tick(i)
+            bot.on_tick(float(c[i]))
+        bot.finish()
+        bot.writer.stop()
+    run.cleanup = tmp.cleanup
+    return ticks, run
+
+
+def _bench_cfg(use_atr=False):
+    from .models import BotConfig
+    return BotConfig(symbol="BENCH", qty=1000, avg=0.25, grid_step=0.3, levels_up=12, levels_down=12,
+                     stop_from_avg=50.0, use_atr=use_atr, atr_refresh_sec=60)
+
+
+class SimBot(BacktestBot):
+    """Loop completo com relógio falso e corretora de mentira (velas
+    sintéticas): estado, sinais e checkpoint passam pelo caminho real
+    (StateWriter, Checkpoint, Notifier só enfileirando)."""
+
+    _update_state = GridBotThread._update_state
+    _post_signal = GridBotThread._post_signal
+    _save_json = GridBotThread._save_json
+    _load_json = GridBotThread._load_json
+    maybe_alert = GridBotThread.maybe_alert
+
+    def __init__(self, cfg, candles, state):
+        super().__init__(cfg, candles)
+        self.state_model = state
+        self.metrics = Registry()
+        self.notifier = Notifier([("bench", "0")], api="http://127.0.0.1:9", max_queue=50)
+
+
+# --- execução ---
+def _expand(grid, sizes):
+    keys = list(grid)
+    combos = [{}]
+    for k in keys:
+        vals = sizes[grid[k]] if isinstance(grid[k], str) else grid[k]
+        combos = [{**c, k: v} for c in combos for v in vals]
+    return combos
+
+def run_cases(sizes, repeat=3, only=None, db=True, log=print):
+    results = []
+    for name, grid, factory, needs_db in CASES:
+        if (only and name not in only) or (needs_db and not db):
+            continue
+        for params in _expand(grid, sizes):
+            ops, fn = factory(**params)
+            best = float("inf")
+            try:
+                for _ in range(repeat):
+                    t0 = time.perf_counter()
+                    fn()
+                    best = min(best, time.perf_counter() - t0)
+            finally:
+                getattr(fn, "cleanup", lambda: None)()
+            r = {"case": name, "params": params, "ops": ops, "best_s": round(best, 6),
+                 "ns_per_op": round(best / ops * 1e9, 1)}
+            results.append(r)
+            log(r)
+    return results
+
+
+def git_commit(cwd=None):
+    try:
+        rev = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=cwd, text=True,
+                                      stderr=subprocess.DEVNULL).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"],
+                                             cwd=cwd, text=True, stderr=subprocess.DEVNULL).strip())
+        return rev, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+def record(results, path, commit=None, dirty=False):
+    # uma linha por execução: resultados comparáveis entre commits
+    entry = {"commit": commit, "dirty": dirty, "ts": int(time.time()), "python": platform.python_version(),
+             "machine": platform.machine(), "cpus": os.cpu_count(), "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+    return entry
+
+def history(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+def compare(results, baseline, threshold=1.25):
+    """(caso, params, ns antes, ns agora, razão, regrediu?) para cada caso presente nos dois."""
+    key = lambda r: (r["case"], json.dumps(r["params"], sort_keys=True))
+    base = {key(r): r for r in baseline["results"]}
+    out = []
+    for r in results:
+        b = base.get(key(r))
+        if b and b["ns_per_op"]:
+            ratio = r["ns_per_op"] / b["ns_per_op"]
+            out.append((r["case"], r["params"], b["ns_per_op"], r["ns_per_op"], ratio, ratio > threshold))
+    return out
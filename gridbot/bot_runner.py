@@ -1,12 +1,33 @@
-import os, time, json, threading, requests
+import os, math, time, json, threading
+from array import array
+from bisect import bisect_right
 from datetime import datetime, timezone
 from django.conf import settings
 from django.db import close_old_connections
-from .models import BotSignal, BotState, BotConfig
+from .models import BotSignal, BotState, BotConfig, PriceTrigger
+from .indicators import StreamingATR, StreamingIndicators, shape_grid
+from .checkpoint import Checkpoint
+from .execution import BUY, SELL, OrderIntent
+from .triggers import ABOVE, KIND_LABEL, Trigger, TriggerBook
+from .hysteresis import ARMED, REARM, Dedup, StopLatch
+from .scheduler import PollScheduler
+from .metrics import REGISTRY
+from .exchange import RateLimited, RequestError, default_client, klines_weight, shared_session
 
-BINANCE_HOSTS = ["https://api.binance.com", "https://api1.binance.com", "https://api2.binance.com"]
 DEFAULT_SYMBOL = "POLUSDT"
+INTERVAL_SEC = {"1m": 60, "3m": 180, "5m": 300, "15m": 900, "30m": 1800,
+                "1h": 3600, "2h": 7200, "4h": 14400, "6h": 21600, "12h": 43200, "1d": 86400}
+STREAM_MIN_GAP = 1.0  # com stream: no máximo uma avaliação por segundo
+PRICE_WINDOW_SEC = 2.0  # janela do ticker compartilhado pelos workers do runbot (mdcache)
 STATE_JSON = os.path.join(os.path.dirname(__file__), "grid_state.json")
+_checkpoint = None
+
+def default_checkpoint():
+    # um arquivo para todos os bots do processo
+    global _checkpoint
+    if _checkpoint is None:
+        _checkpoint = Checkpoint(STATE_JSON, legacy_symbol=DEFAULT_SYMBOL)
+    return _checkpoint
 
 def now_iso():
     return datetime.now(timezone.utc).astimezone().strftime("%Y-%m-%d %H:%M:%S")
@@ -26,33 +47,53 @@ def tg_send(text):
         return
     try:
         url = f"https://api.telegram.org/bot{token}/sendMessage"
-        requests.post(url, data={"chat_id": chat_id, "text": text}, timeout=10)
+        shared_session().post(url, data={"chat_id": chat_id, "text": text}, timeout=10)
     except Exception as e:
         print(f"[{now_iso()}] Telegram falhou: {e}")
 
-def get_price(symbol=DEFAULT_SYMBOL):
-    for host in BINANCE_HOSTS:
-        try:
-            r = requests.get(f"{host}/api/v3/ticker/price", params={"symbol": symbol}, timeout=8)
-            r.raise_for_status()
-            return float(r.json()["price"])
-        except Exception:
-            continue
-    raise RuntimeError("Falha ao obter preço (rede bloqueada?)")
+def _exchange(path, params, weight, what):
+    # cliente compartilhado: keep-alive, host mais saudável primeiro, breaker e peso
+    try:
+        return default_client().get_json(path, params, weight=weight)
+    except (RateLimited, RequestError):
+        raise
+    except Exception as e:
+        raise RuntimeError(f"Falha ao obter {what} (rede bloqueada?)") from e
 
-def get_klines(symbol=DEFAULT_SYMBOL, interval="1m", limit=300):
+def get_price(symbol=DEFAULT_SYMBOL):
+    return float(_exchange("/api/v3/ticker/price", {"symbol": symbol}, 2, "preço")["price"])
+
+def get_prices(symbols):
+    # um único ticker em lote para todos os símbolos: {symbol: price}
+    symbols = sorted(set(symbols))
+    params = {"symbols": json.dumps(symbols, separators=(",", ":"))} if symbols else {}
+    rows = _exchange("/api/v3/ticker/price", params, 4, "preços")
+    return {row["symbol"]: float(row["price"]) for row in rows}
+
+def shared_price(symbol, cache=None, clock=time.time):
+    """Preço pelo ticker completo guardado no cache de mercado da máquina: na mesma
+    janela de PRICE_WINDOW_SEC, um único request (peso 4) serve todos os workers."""
+    from .mdcache import default_market_cache
+    window = getattr(settings, "PRICE_WINDOW_SEC", PRICE_WINDOW_SEC)
+    key = ("ticker", int(clock() // window))
+    prices = (cache or default_market_cache()).get_or_fill(key, window, lambda: get_prices([]))
+    p = (prices or {}).get(symbol)
+    return p if p is not None else get_price(symbol)
+
+def window_wait(delay, clock=time.time):
+    # espera até a primeira borda de janela depois de `delay`: os workers leem o ticker juntos
+    window = getattr(settings, "PRICE_WINDOW_SEC", PRICE_WINDOW_SEC)
+    now = clock()
+    return math.ceil((now + delay) / window) * window - now
+
+def get_klines(symbol=DEFAULT_SYMBOL, interval="1m", limit=300, start_time=None):
     limit = max(5, min(limit, 1000))
-    for host in BINANCE_HOSTS:
-        try:
-            r = requests.get(f"{host}/api/v3/klines",
-                             params={"symbol": symbol, "interval": interval, "limit": limit},
-                             timeout=8)
-            r.raise_for_status()
-            data = r.json()
-            return [{"t": k[0], "o": float(k[1]), "h": float(k[2]), "l": float(k[3]), "c": float(k[4])} for k in data]
-        except Exception:
-            continue
-    raise RuntimeError("Falha ao obter klines (rede bloqueada?)")
+    params = {"symbol": symbol, "interval": interval, "limit": limit}
+    if start_time is not None:
+        params["startTime"] = int(start_time)
+    data = _exchange("/api/v3/klines", params, klines_weight(limit), "klines")
+    return [{"t": k[0], "o": float(k[1]), "h": float(k[2]), "l": float(k[3]), "c": float(k[4]),
+             "v": float(k[5])} for k in data]
 
 def calc_atr(ohlc, length=14):
     # ATR clássico: TR com SMA inicial e depois EMA(TR)
@@ -74,199 +115,609 @@ def calc_atr(ohlc, length=14):
         atr_val = tr * k + atr_val * (1 - k)
     return atr_val
 
+class Grid:
+    """Níveis ref*(1+i*step) guardados num array compacto; com `step_down_pct`
+    os níveis abaixo da ref usam outro passo (grade moldada pelas bandas).
+
+    `index(price)` acha a célula em O(1) pela aritmética do passo (com ajuste
+    fino contra os próprios níveis); passos degenerados caem no bisect.
+    """
+    __slots__ = ("ref", "step", "step_down", "down", "levels")
+
+    def __init__(self, ref_price, step_pct, up, down, step_down_pct=None):
+        self.ref = ref_price
+        self.step = step_pct / 100.0
+        self.down = down
+        if step_down_pct is None or step_down_pct == step_pct:
+            self.step_down = self.step
+            self.levels = array("d", sorted(ref_price * (1 + (i * step_pct / 100.0)) for i in range(-down, up + 1)))
+        else:
+            self.step_down = step_down_pct / 100.0
+            self.levels = array("d", sorted([ref_price * (1 - i * step_down_pct / 100.0) for i in range(1, down + 1)]
+                                            + [ref_price * (1 + i * step_pct / 100.0) for i in range(up + 1)]))
+
+    def __len__(self):
+        return len(self.levels)
+
+    @property
+    def cells(self):
+        return max(1, len(self.levels) - 1)
+
+    def index(self, price):
+        # célula i com levels[i] <= price < levels[i+1], presa em [0, cells-1]
+        lv, last = self.levels, self.cells - 1
+        if self.step > 0 and self.step_down > 0 and self.ref > 0:
+            if price >= self.ref or self.step_down == self.step:
+                i = math.floor((price / self.ref - 1) / self.step) + self.down
+            else:
+                i = self.down - math.ceil((1 - price / self.ref) / self.step_down)
+            i = max(0, min(i, last))
+            while i > 0 and lv[i] > price:
+                i -= 1
+            while i < last and lv[i + 1] <= price:
+                i += 1
+            return i
+        return max(0, min(bisect_right(lv, price) - 1, last))
+
+    def settle(self, price, last_idx, band=0.0):
+        # célula com histerese: só troca depois de passar `band` (fração) além do nível
+        if band <= 0:
+            return self.index(price)
+        return max(self.index(price / (1 + band)), min(last_idx, self.index(price / (1 - band))))
+
+    def cells_between(self, from_idx, to_idx):
+        # células visitadas, uma por nível cruzado, na ordem do movimento
+        if to_idx > from_idx:
+            return list(range(from_idx + 1, to_idx + 1))
+        return list(range(from_idx - 1, to_idx - 1, -1))
+
+    def crossed(self, p0, p1):
+        # índices dos níveis cruzados indo de p0 para p1
+        a, b = self.index(p0), self.index(p1)
+        if b > a:
+            return list(range(a + 1, b + 1))
+        return list(range(a, b, -1))
+
 def build_grid(ref_price, step_pct, up, down):
-    levels = [ref_price * (1 + (i * step_pct / 100.0)) for i in range(-down, up + 1)]
-    levels.sort()
-    def idx_for(price):
-        for i in range(len(levels)-1):
-            if levels[i] <= price < levels[i+1]:
-                return i
-        return max(0, len(levels)-2)
-    return levels, idx_for
+    g = Grid(ref_price, step_pct, up, down)
+    return g.levels, g.index
 
 class GridBotThread(threading.Thread):
-    def __init__(self, cfg: BotConfig, state_model: BotState):
+    def __init__(self, cfg: BotConfig, state_model: BotState, feed=None, writer=None, notifier=None,
+                 executor=None, candle_hub=None, journal=None):
         super().__init__(daemon=True)
         self.cfg = cfg
         self.state_model = state_model
+        self.feed = feed        # MarketStream opcional; REST é o fallback
+        self.writer = writer    # StateWriter opcional (write-behind); sem ele grava direto
+        self.notifier = notifier  # Notifier opcional: Telegram fora do loop de preço
+        self.executor = executor  # Executor opcional: ordens de verdade com cfg.auto_trade
+        self.candle_hub = candle_hub  # CandleHub opcional: todos os timeframes do stream de 1m
+        self.journal = journal  # Journal opcional: diário binário de preços/velas/sinais para replay
+        self._feed_seq = 0
         self._stop_evt = threading.Event()
+        self.clock = time.time  # injetável (backtest/replay)
+        self.metrics = REGISTRY  # tempos por etapa; o backtest troca por metrics.NULL
+        self._tick_t0 = None
+        self._pending_cfg = None  # config nova (reload_config), aplicada no próximo tick
+        self._pending_pos = None  # (qty, avg) dos fills do Executor, aplicados no próximo tick
+        self._triggers_dirty = False  # gatilhos mudaram no painel: recarrega no próximo tick
+        self.triggers = TriggerBook()
+        self._fired = set()       # gatilhos disparados cujo active=False pode não ter saído do writer ainda
+        self.checkpoint = None    # Checkpoint próprio (benchmark/testes); padrão: default_checkpoint()
         self.cooldowns = {}
+        self.stop_latch = StopLatch(cfg.stop_rearm_pct, cfg.stop_repeat_sec)
+        self.dedup = Dedup(cfg.signal_dedup_sec)  # sinais de grade repetidos: nem banco nem alerta
+        # poll por REST adaptativo; orçamento padrão: o do default_client()
+        self.poll = PollScheduler(cfg.poll_min_sec, cfg.poll_max_sec, share=getattr(settings, "POLL_WEIGHT_SHARE", 0.5),
+                                  clock=lambda: self.clock())
+        self._poll_at = None      # (preço, linha de stop) do último tick
         self.eff_grid_step = None
+        self.eff_step_down = None    # grade moldada pelas bandas: step e níveis de cada lado
+        self.eff_levels_up = None
+        self.eff_levels_down = None
         self.atr_value = None
         self.atr_next_ts = 0
         self.atr_trailing_stop = None
+        self.atr_state = None   # StreamingATR (ou StreamingIndicators) semeado uma vez, depois só velas novas
+        self.atr_key = None     # parâmetros do atr_state
+        self.grid = None
         self.levels = None
         self.idx_for = None
+        self.j = {}
+        self.ref = None
+        self.trailing_high = None
+        self.last_idx = None
+        if executor is not None:
+            executor.attach(self)
+
+    @property
+    def symbol(self):
+        return self.cfg.symbol or DEFAULT_SYMBOL
 
     def stop(self): self._stop_evt.set()
     def stopped(self): return self._stop_evt.is_set()
 
-    def maybe_alert(self, key, msg, cooldown=120):
-        now = time.time()
-        last = self.cooldowns.get(key, 0)
-        if now - last >= cooldown and self.cfg.telegram_enabled:
-            tg_send(msg)
-            self.cooldowns[key] = now
+    def reload_config(self, cfg):
+        # chamado de outra thread (notificação do painel); o loop aplica entre ticks
+        self._pending_cfg = cfg
 
-    def _post_signal(self, kind, msg, price=None, pnl_pct=None):
+    def reload_triggers(self):
+        # chamado de outra thread (painel); o loop relê do banco entre ticks
+        self._triggers_dirty = True
+
+    def _load_triggers(self):
+        close_old_connections()
+        return [Trigger.from_model(t) for t in PriceTrigger.objects.filter(symbol=self.symbol, active=True)]
+
+    def _trigger_book(self):
+        # o banco pode ainda ter active=True de um disparo na fila do writer: não dispara de novo
+        rows = self._load_triggers()
+        self._fired &= {t.id for t in rows}     # os que já saíram do banco não precisam mais do filtro
+        return TriggerBook([t for t in rows if t.id not in self._fired])
+
+    def _update_trigger(self, tid, **fields):
+        if self.writer is not None:
+            self.writer.update_state(PriceTrigger, tid, **fields)
+            return
+        PriceTrigger.objects.filter(pk=tid).update(**fields)
+
+    def _check_triggers(self, price, pnl_pct, now=None):
+        now = self.clock() if now is None else now
+        if self._triggers_dirty:
+            self._triggers_dirty = False
+            self.triggers = self._trigger_book()
+            if self.journal is not None:
+                self.journal.triggers(now, self.triggers.by_id.values())
+        for t in self.triggers.crossed(price):
+            txt = self._trigger_text(t, price, pnl_pct)
+            self.maybe_alert(f"trigger{t.id}", txt, cooldown=0)
+            self._post_signal("trigger", txt, price=price, pnl_pct=pnl_pct, now=now)
+            if t.kind in ("take_profit", "stop") and t.qty:
+                self._order(SELL, t.qty, None, t.kind)
+            self._fired.add(t.id)
+            self._update_trigger(t.id, active=False, fired_price=price,
+                                 fired_at=datetime.fromtimestamp(now, timezone.utc))
+
+    def set_position(self, qty, avg):
+        # chamado do thread do Executor a cada fill
+        self._pending_pos = (qty, avg)
+
+    def _order(self, side, qty, price, reason):
+        if self.executor is None or not self.cfg.auto_trade:
+            return
+        self.executor.submit(OrderIntent(self.symbol, side, qty, price, reason, ts=self.clock()))
+
+    def _order_qty(self):
+        # uma fatia por nível, a mesma regra do sweep
+        return self.cfg.qty / max(1, min(self.cfg.levels_up, self.cfg.levels_down))
+
+    def _apply_config(self, price, now=None):
+        cfg, self._pending_cfg = self._pending_cfg, None
+        if cfg is None:
+            return
+        now = self.clock() if now is None else now
+        if self.journal is not None:
+            self.journal.config(now, cfg)
+        old, self.cfg = self.cfg, cfg
+        if self.executor is not None and cfg.auto_trade:
+            if old.auto_trade:
+                cfg.qty, cfg.avg = old.qty, old.avg     # posição dos fills, não a do form
+            else:
+                self.executor.reset_position(self.symbol, cfg.qty, cfg.avg)   # ligou agora: parte do painel
+        self.stop_latch.configure(cfg.stop_rearm_pct, cfg.stop_repeat_sec)
+        self.dedup.window = cfg.signal_dedup_sec
+        self.poll.configure(cfg.poll_min_sec, cfg.poll_max_sec)
+        grid_fields = ("grid_step", "levels_up", "levels_down", "use_atr", "atr_len", "atr_k_grid",
+                       "atr_n_stop", "atr_interval", "grid_shape", "bands_len", "bands_k")
+        if any(getattr(old, f) != getattr(cfg, f) for f in grid_fields):
+            # recalcula o step já e remonta a grade na ref atual, sem sinal de cruzamento falso
+            self.atr_next_ts = 0
+            self._update_atr_and_effective_params(price, self.trailing_high, now)
+            if self.eff_grid_step is None:
+                self.eff_grid_step = cfg.grid_step
+            self._rebuild_grid(self.ref)
+            self.dedup.clear()
+            self.last_idx = self.idx_for(price)
+            self._update_state(last_level_idx=self.last_idx)
+        print(f"[{now_iso()}] {self.symbol}: config #{cfg.pk} aplicada")
+
+    def maybe_alert(self, key, msg, cooldown=120, digest=False):
+        if not self.cfg.telegram_enabled:
+            return
+        # rajadas de grade viram um único resumo no Notifier, sem cooldown
+        with self.metrics.timer("gridbot_stage_seconds", stage="alert", symbol=self.symbol):
+            if digest and self.notifier is not None:
+                self.notifier.notify(msg, digest_key=f"{self.symbol} {key}")
+                return
+            now = self.clock()
+            last = self.cooldowns.get(key, 0)
+            if now - last >= cooldown:
+                if self.notifier is not None:
+                    self.notifier.notify(msg)
+                else:
+                    tg_send(msg)
+                self.cooldowns[key] = now
+
+    def _post_signal(self, kind, msg, price=None, pnl_pct=None, now=None):
+        self.metrics.inc("gridbot_signals_total", symbol=self.symbol, kind=kind)
+        if self._tick_t0 is not None:
+            # do preço recebido até o sinal sair do loop
+            self.metrics.observe("gridbot_tick_to_signal_seconds", time.perf_counter() - self._tick_t0,
+                                 symbol=self.symbol)
+        with self.metrics.timer("gridbot_stage_seconds", stage="db", symbol=self.symbol):
+            self._write_signal(kind, msg, price, pnl_pct)
+        if self.journal is not None:
+            self.journal.signal(self.clock() if now is None else now, kind, msg, price, pnl_pct)
+
+    def _write_signal(self, kind, msg, price, pnl_pct):
+        if self.writer is not None:
+            self.writer.add_signal(symbol=self.symbol, kind=kind, message=msg, price=price, pnl_pct=pnl_pct)
+            self._update_state(last_kind=kind, last_message=msg, last_price=price, last_pnl_pct=pnl_pct)
+            return
         try:
             close_old_connections()
-            BotSignal.objects.create(kind=kind, message=msg, price=price, pnl_pct=pnl_pct)
-            type(self.state_model).objects.filter(pk=self.state_model.pk).update(
-                last_kind=kind, last_message=msg, last_price=price, last_pnl_pct=pnl_pct
-            )
+            BotSignal.objects.create(symbol=self.symbol, kind=kind, message=msg, price=price, pnl_pct=pnl_pct)
+            self._update_state(last_kind=kind, last_message=msg, last_price=price, last_pnl_pct=pnl_pct)
         except Exception as e:
             print(f"[{now_iso()}] Falha ao salvar sinal: {e}")
 
+    def _band(self):
+        return max(0.0, self.cfg.grid_hysteresis_pct or 0.0) / 100.0
+
+    def _stop_event(self, price, stop_line, now=None):
+        # armado/disparado/rearmado: um evento por stop, não um por tick
+        ev = self.stop_latch.update(price, stop_line, self.clock() if now is None else now)
+        if ev is None and price <= stop_line:
+            self.metrics.inc("gridbot_signals_suppressed_total", symbol=self.symbol, kind="stop")
+        return ev not in (None, REARM)
+
+    def _grid_event(self, cell, up, now=None):
+        if self.dedup.allow((cell, up), self.clock() if now is None else now):
+            return True
+        self.metrics.inc("gridbot_signals_suppressed_total", symbol=self.symbol, kind="grid")
+        return False
+
+    def next_delay(self):
+        # espera até o próximo preço sem stream: adaptativa ou cfg.interval fixo
+        if not self.cfg.adaptive_poll or self._poll_at is None:
+            return self.cfg.interval
+        if self.poll.budget is None:
+            self.poll.budget = default_client().budget
+        price, stop_line = self._poll_at
+        targets = [stop_line, *self.triggers.nearest()]
+        if self.grid is not None:
+            # onde a célula troca de fato (com a banda); as pontas da grade não trocam
+            i, band = self.last_idx, self._band()
+            if i > 0:
+                targets.append(self.levels[i] * (1 - band))
+            if i < self.grid.cells - 1:
+                targets.append(self.levels[i + 1] * (1 + band))
+        delay = self.poll.delay(price, targets, self.atr_value, INTERVAL_SEC.get(self.cfg.atr_interval, 60),
+                                fallback=self.cfg.interval)
+        self.metrics.observe("gridbot_poll_delay_seconds", delay, symbol=self.symbol)
+        return delay
+
     def _rebuild_grid(self, ref_price):
-        self.levels, self.idx_for = build_grid(ref_price, self.eff_grid_step, self.cfg.levels_up, self.cfg.levels_down)
+        self.grid = Grid(ref_price, self.eff_grid_step, self.eff_levels_up or self.cfg.levels_up,
+                         self.eff_levels_down or self.cfg.levels_down, self.eff_step_down)
+        self.levels, self.idx_for = self.grid.levels, self.grid.index
+
+    def _fetch_klines(self, limit):
+        # stream de 1m reamostrado; sem ele (ou parado), store local + cauda pela rede
+        if self.candle_hub is not None:
+            rows = self.candle_hub.klines(self.symbol, self.cfg.atr_interval, limit)
+            if rows:
+                return rows
+        from .candle_store import store_klines
+        return store_klines(self.symbol, self.cfg.atr_interval, limit)
+
+    def _klines(self, limit, now):
+        # velas do ATR; com diário, as linhas recebidas (ou a falha) ficam gravadas para o replay
+        if self.journal is None:
+            return self._fetch_klines(limit)
+        try:
+            rows = self._fetch_klines(limit)
+        except Exception:
+            self.journal.klines(now, limit, None)
+            raise
+        self.journal.klines(now, limit, rows)
+        return rows
+
+    def _refresh_atr(self, now=None):
+        # semeia o ATR uma vez; nos refreshes busca só as velas que fecharam desde então
+        now = self.clock() if now is None else now
+        st = self.atr_state
+        step_ms = INTERVAL_SEC.get(self.cfg.atr_interval, 60) * 1000
+        shaped = self.cfg.grid_shape == "bands"
+        key = (self.cfg.atr_len, self.cfg.atr_interval, shaped, self.cfg.bands_len, self.cfg.bands_k)
+        missing = None
+        if st is not None and st.last_t is not None and self.atr_key == key:
+            missing = int(now * 1000 - st.last_t) // step_ms
+        if missing is None or missing >= 999:
+            ohlc = self._klines(max(100, self.cfg.atr_len + 30, self.cfg.bands_len + 30 if shaped else 0), now)
+            st = (StreamingIndicators(self.cfg.atr_len, bands_len=self.cfg.bands_len, bands_k=self.cfg.bands_k)
+                  if shaped else StreamingATR(self.cfg.atr_len))
+            st.seed(ohlc[:-1])
+            self.atr_state, self.atr_key = st, key
+        else:
+            ohlc = self._klines(max(2, missing + 1), now)
+            for c in ohlc[:-1]:
+                if c["t"] > st.last_t:
+                    st.update(c)
+        # última vela ainda em formação: entra só como estimativa
+        return st.estimate(ohlc[-1] if ohlc else None)
+
+    def _shape(self, price):
+        # bandas das velas fechadas → step/níveis por lado; vale na próxima montagem da grade
+        st = self.atr_state
+        if self.cfg.grid_shape != "bands" or not isinstance(st, StreamingIndicators) or st.bands.value is None:
+            self.eff_step_down = self.eff_levels_up = self.eff_levels_down = None
+            return
+        (self.eff_grid_step, self.eff_step_down,
+         self.eff_levels_up, self.eff_levels_down) = shape_grid(price, self.eff_grid_step, self.cfg.levels_up,
+                                                                self.cfg.levels_down, st.bands.value)
 
-    def _update_atr_and_effective_params(self, price, trailing_high):
+    def _update_atr_and_effective_params(self, price, trailing_high, now=None):
         # Sem ATR → usa step fixo
         if not self.cfg.use_atr:
             self.atr_value = None
             self.eff_grid_step = self.cfg.grid_step
             self.atr_trailing_stop = None
+            self.eff_step_down = self.eff_levels_up = self.eff_levels_down = None
             return
 
         # Refresh por janela
-        now = time.time()
+        now = self.clock() if now is None else now
         if now < self.atr_next_ts and self.atr_value is not None and self.eff_grid_step is not None:
             return
         try:
-            ohlc = get_klines(DEFAULT_SYMBOL, self.cfg.atr_interval, limit=max(100, self.cfg.atr_len + 30))
-            atr = calc_atr(ohlc, self.cfg.atr_len)
+            with self.metrics.timer("gridbot_stage_seconds", stage="atr", symbol=self.symbol):
+                atr = self._refresh_atr(now)
             if atr:
                 self.atr_value = atr
                 eff = self.cfg.atr_k_grid * (atr / price) * 100.0   # %
                 eff = max(0.15, min(eff, 2.5))                      # clamp
                 self.eff_grid_step = eff
                 self.atr_trailing_stop = trailing_high - self.cfg.atr_n_stop * atr
+                self._shape(price)
             else:
                 self.eff_grid_step = self.cfg.grid_step
                 self.atr_trailing_stop = None
+                self.eff_step_down = self.eff_levels_up = self.eff_levels_down = None
         except Exception as e:
             print(f"[{now_iso()}] ATR falhou: {e}")
             self.eff_grid_step = self.cfg.grid_step
             self.atr_trailing_stop = None
+            self.eff_step_down = self.eff_levels_up = self.eff_levels_down = None
 
         self.atr_next_ts = now + max(10, self.cfg.atr_refresh_sec)
+        if self.journal is not None:
+            self.journal.atr(now, self.atr_value, self.eff_grid_step, self.atr_trailing_stop)
 
         # grava diagnóstico
         try:
-            close_old_connections()
-            type(self.state_model).objects.filter(pk=self.state_model.pk).update(
+            self._update_state(
                 atr=self.atr_value, eff_grid_step=self.eff_grid_step, atr_trailing_stop=self.atr_trailing_stop
             )
         except Exception:
             pass
 
-    def run(self):
-        close_old_connections()
+    def _load_json(self):
+        return (self.checkpoint or default_checkpoint()).get(self.symbol)
+
+    def _save_json(self):
+        # só grava quando o estado mudou (troca atômica do arquivo)
+        with self.metrics.timer("gridbot_stage_seconds", stage="json", symbol=self.symbol):
+            cp = self.checkpoint or default_checkpoint()
+            cp.put(self.symbol, self.j)
+            cp.save()
+
+    def _update_state(self, **fields):
+        with self.metrics.timer("gridbot_stage_seconds", stage="db", symbol=self.symbol):
+            if self.writer is not None:
+                self.writer.update_state(type(self.state_model), self.state_model.pk, **fields)
+                return
+            close_old_connections()
+            type(self.state_model).objects.filter(pk=self.state_model.pk).update(**fields)
 
+    # --- textos dos sinais (compartilhados com o backtest) ---
+    def _startup_text(self, stop_pm):
+        txt_start = (
+            f"PM {human(self.cfg.avg)} | Qtd {self.cfg.qty}\n"
+            f"Ref {human(self.ref)} | Grade efetiva @ {self.eff_grid_step:.2f}% (modo {'ATR' if self.cfg.use_atr else 'fixo'})\n"
+        )
+        if self.cfg.use_atr and self.atr_value:
+            txt_start += f"ATR({self.cfg.atr_len},{self.cfg.atr_interval}) ~ {human(self.atr_value)} | Stop ATR≈ {human(self.atr_trailing_stop)}\n"
+        if self.eff_step_down is not None:
+            txt_start += (f"Bandas({self.cfg.bands_len}): ⬆️ {self.eff_levels_up} níveis @ {self.eff_grid_step:.2f}% | "
+                          f"⬇️ {self.eff_levels_down} níveis @ {self.eff_step_down:.2f}%\n")
+        txt_start += f"Stop mínimo por PM ({self.cfg.stop_from_avg:.1f}%): {human(stop_pm)}"
+        return txt_start
+
+    def _stop_text(self, price, stop_line, pnl_pct, pnl_val):
+        return (f"🛑 STOP! {human(price)} <= {human(stop_line)} "
+                f"(PM {human(self.cfg.avg)} | {pnl_pct:.2f}% | ~{human(pnl_val)} USDT).")
+
+    def _grid_text(self, up, cell, price, pnl_pct):
+        direction = "⬆️" if up else "⬇️"
+        sug = "venda parcial" if up else "compra parcial"
+        lower, upper = self.levels[cell], self.levels[cell+1]
+        step = self.eff_step_down if self.eff_step_down is not None and cell < self.grid.down else self.eff_grid_step
+        return (f"📊 {direction} Cruzou nível @ step {step:.2f}%\n"
+                f"Faixa {human(lower)} – {human(upper)}\n"
+                f"Preço {human(price)} | PM {human(self.cfg.avg)} | PnL {pnl_pct:.2f}%\n"
+                f"Sugestão: {sug}.")
+
+    def _trigger_text(self, t, price, pnl_pct):
+        txt = (f"{KIND_LABEL.get(t.kind, t.kind)} {self.symbol} @ {human(t.price)}\n"
+               f"Preço {human(price)} {'≥' if t.direction == ABOVE else '≤'} {human(t.price)} | "
+               f"PM {human(self.cfg.avg)} | PnL {pnl_pct:.2f}%")
+        if t.qty and t.kind != "alert":
+            txt += f"\nSugestão: vender {t.qty:g}."
+        return txt + (f"\n{t.note}" if t.note else "")
+
+    def start_bot(self, price):
+        # um relógio só para o startup inteiro: o replay do diário refaz com o mesmo instante
+        now = self.clock()
         # estado leve
-        try:
-            j = json.load(open(STATE_JSON,"r",encoding="utf-8")) if os.path.exists(STATE_JSON) else {}
-        except Exception:
-            j = {}
-
-        # preço inicial
-        try:
-            price = get_price()
-        except Exception as e:
-            print(f"[{now_iso()}] Falha preço inicial: {e}")
-            return
+        self.j = self._load_json()
+        self.triggers = self._trigger_book()
+        if self.journal is not None:
+            self.journal.start(now, price, self.cfg, self.j, self.triggers.by_id.values())
+        if self.candle_hub is not None:
+            self.candle_hub.track(self.symbol)
 
-        ref = j.get("ref_price") or price
-        trailing_high = j.get("trailing_high", ref)
+        self.ref = self.j.get("ref_price") or price
+        self.trailing_high = self.j.get("trailing_high", self.ref)
 
         # ATR / step efetivo / grade
-        self._update_atr_and_effective_params(price, trailing_high)
+        self._update_atr_and_effective_params(price, self.trailing_high, now)
         if self.eff_grid_step is None:
             self.eff_grid_step = self.cfg.grid_step
-        self._rebuild_grid(ref)
-        last_idx = j.get("last_level_idx", self.idx_for(price))
+        self._rebuild_grid(self.ref)
+        self.last_idx = self.j.get("last_level_idx", self.idx_for(price))
+        self.last_idx = max(0, min(self.last_idx, self.grid.cells - 1))
+        self.stop_latch.state = self.j.get("stop_state", ARMED)
 
         # stop por PM e por ATR
         stop_pm = self.cfg.avg * (1 - self.cfg.stop_from_avg/100.0)
-        stop_line = max(stop_pm, self.atr_trailing_stop) if self.atr_trailing_stop is not None else stop_pm
 
         # state inicial
-        close_old_connections()
-        type(self.state_model).objects.filter(pk=self.state_model.pk).update(
-            running=True, ref_price=ref, trailing_high=trailing_high, last_level_idx=last_idx,
+        self._update_state(
+            running=True, ref_price=self.ref, trailing_high=self.trailing_high, last_level_idx=self.last_idx,
             atr=self.atr_value, eff_grid_step=self.eff_grid_step, atr_trailing_stop=self.atr_trailing_stop
         )
 
         # startup
-        txt_start = (
-            f"PM {human(self.cfg.avg)} | Qtd {self.cfg.qty}\n"
-            f"Ref {human(ref)} | Grade efetiva @ {self.eff_grid_step:.2f}% (modo {'ATR' if self.cfg.use_atr else 'fixo'})\n"
+        txt_start = self._startup_text(stop_pm)
+        self.maybe_alert("startup", f"🚀 GRID+STOP ON ({self.symbol})\n{txt_start}", cooldown=3)
+        self._post_signal("startup", txt_start, now=now)
+
+    def on_tick(self, price):
+        self._tick_t0 = t0 = time.perf_counter()
+        # relógio lido uma vez: janelas (ATR, dedup, stop) e o diário usam o mesmo instante do tick
+        now = self.clock()
+        self.metrics.inc("gridbot_ticks_total", symbol=self.symbol)
+        if self.journal is not None:
+            self.journal.tick(now, price)
+        if self._pending_cfg is not None:
+            self._apply_config(price, now)
+        if self._pending_pos is not None:
+            (self.cfg.qty, self.cfg.avg), self._pending_pos = self._pending_pos, None
+            if self.journal is not None:
+                self.journal.position(now, self.cfg.qty, self.cfg.avg)
+        if self.executor is not None:
+            self.executor.mark(self.symbol, price)
+        if price > self.trailing_high:
+            self.trailing_high = price
+
+        # ATR update por janela + trail stop
+        self._update_atr_and_effective_params(price, self.trailing_high, now)
+        stop_pm = self.cfg.avg * (1 - self.cfg.stop_from_avg/100.0)
+        if self.atr_trailing_stop is not None and self.atr_value is not None:
+            self.atr_trailing_stop = self.trailing_high - self.cfg.atr_n_stop * self.atr_value
+            stop_line = max(stop_pm, self.atr_trailing_stop)
+        else:
+            stop_line = stop_pm
+
+        pnl_pct = pct(price, self.cfg.avg)
+        pnl_val = (price - self.cfg.avg) * self.cfg.qty
+        self.poll.observe(price)
+        self._poll_at = (price, stop_line)
+
+        # STOP: dispara uma vez e só volta depois de rearmar
+        if self._stop_event(price, stop_line, now):
+            txt = self._stop_text(price, stop_line, pnl_pct, pnl_val)
+            self.maybe_alert("stop", txt)
+            self._post_signal("stop", txt, price=price, pnl_pct=pnl_pct, now=now)
+            self._order(SELL, self.cfg.qty, None, "stop")
+
+        # GRID cross: um sinal por nível cruzado, mesmo em movimento rápido; a célula
+        # só troca depois da banda de histerese e o mesmo cruzamento na janela não repete
+        with self.metrics.timer("gridbot_stage_seconds", stage="grid", symbol=self.symbol):
+            idx = self.grid.settle(price, self.last_idx, self._band())
+            if idx != self.last_idx:
+                up = idx > self.last_idx
+                for cell in self.grid.cells_between(self.last_idx, idx):
+                    if not self._grid_event(cell, up, now):
+                        continue    # duplicado na janela: nem sinal nem ordem
+                    txt = self._grid_text(up, cell, price, pnl_pct)
+                    self.maybe_alert("grid", txt, digest=True)
+                    self._post_signal("grid", txt, price=price, pnl_pct=pnl_pct, now=now)
+                    # sobe: vende no nível cruzado; desce: compra no nível cruzado
+                    self._order(SELL if up else BUY, self._order_qty(),
+                                self.levels[cell] if up else self.levels[cell + 1], "grid")
+                self.last_idx = idx
+
+        # gatilhos do usuário (alertas, take profit, stops parciais)
+        if self.triggers or self._triggers_dirty:
+            with self.metrics.timer("gridbot_stage_seconds", stage="triggers", symbol=self.symbol):
+                self._check_triggers(price, pnl_pct, now)
+
+        # persistência leve
+        self.j.update({"ref_price": self.ref, "last_level_idx": self.last_idx, "trailing_high": self.trailing_high,
+                       "stop_state": self.stop_latch.state})
+        self._save_json()
+        self._tick_t0 = None
+        self.metrics.observe("gridbot_stage_seconds", time.perf_counter() - t0, stage="tick", symbol=self.symbol)
+
+        # atualizar DB state
+        self._update_state(
+            ref_price=self.ref, trailing_high=self.trailing_high, last_level_idx=self.last_idx,
+            atr=self.atr_value, eff_grid_step=self.eff_grid_step, atr_trailing_stop=stop_line
         )
-        if self.cfg.use_atr and self.atr_value:
-            txt_start += f"ATR({self.cfg.atr_len},{self.cfg.atr_interval}) ~ {human(self.atr_value)} | Stop ATR≈ {human(self.atr_trailing_stop)}\n"
-        txt_start += f"Stop mínimo por PM ({self.cfg.stop_from_avg:.1f}%): {human(stop_pm)}"
-        self.maybe_alert("startup", f"🚀 GRID+STOP ON (POLUSDT)\n{txt_start}", cooldown=3)
-        self._post_signal("startup", txt_start)
+
+    def _next_price(self):
+        # stream primeiro: espera o próximo tick até cfg.interval; sem tick → REST
+        if self.feed is not None:
+            got = self.feed.wait_price(self.symbol, self._feed_seq, timeout=self.cfg.interval)
+            if got:
+                price, self._feed_seq = got
+                return price
+        with self.metrics.timer("gridbot_stage_seconds", stage="price", symbol=self.symbol):
+            return shared_price(self.symbol)
+
+    def finish(self):
+        self._update_state(running=False)
+        if self.writer is not None:
+            self.writer.flush()
+        if self.j:
+            self._save_json()
+        if self.journal is not None:
+            self.journal.close()
+
+    def run(self):
+        close_old_connections()
+
+        # preço inicial
+        try:
+            price = self._next_price()
+        except Exception as e:
+            print(f"[{now_iso()}] Falha preço inicial: {e}")
+            return
+        self.start_bot(price)
 
         # loop
+        last, planned = time.monotonic(), self.cfg.interval
         while not self.stopped():
             try:
-                close_old_connections()
-
-                price = get_price()
-                if price > trailing_high:
-                    trailing_high = price
-
-                # ATR update por janela + trail stop
-                self._update_atr_and_effective_params(price, trailing_high)
-                stop_pm = self.cfg.avg * (1 - self.cfg.stop_from_avg/100.0)
-                if self.atr_trailing_stop is not None and self.atr_value is not None:
-                    self.atr_trailing_stop = trailing_high - self.cfg.atr_n_stop * self.atr_value
-                    stop_line = max(stop_pm, self.atr_trailing_stop)
-                else:
-                    stop_line = stop_pm
-
-                pnl_pct = pct(price, self.cfg.avg)
-                pnl_val = (price - self.cfg.avg) * self.cfg.qty
-
-                # STOP
-                if price <= stop_line:
-                    txt = (f"🛑 STOP! {human(price)} <= {human(stop_line)} "
-                           f"(PM {human(self.cfg.avg)} | {pnl_pct:.2f}% | ~{human(pnl_val)} USDT).")
-                    self.maybe_alert("stop", txt)
-                    self._post_signal("stop", txt, price=price, pnl_pct=pnl_pct)
-
-                # GRID cross
-                idx = self.idx_for(price)
-                if idx != last_idx:
-                    lower, upper = self.levels[idx], self.levels[idx+1]
-                    direction = "⬆️" if idx > last_idx else "⬇️"
-                    sug = "venda parcial" if idx > last_idx else "compra parcial"
-                    txt = (f"📊 {direction} Cruzou nível @ step {self.eff_grid_step:.2f}%\n"
-                           f"Faixa {human(lower)} – {human(upper)}\n"
-                           f"Preço {human(price)} | PM {human(self.cfg.avg)} | PnL {pnl_pct:.2f}%\n"
-                           f"Sugestão: {sug}.")
-                    self.maybe_alert("grid", txt)
-                    self._post_signal("grid", txt, price=price, pnl_pct=pnl_pct)
-                    last_idx = idx
-
-                # persistência leve
-                j.update({"ref_price": ref, "last_level_idx": last_idx, "trailing_high": trailing_high})
-                with open(STATE_JSON,"w",encoding="utf-8") as f:
-                    json.dump(j, f, ensure_ascii=False, indent=2)
-
-                # atualizar DB state
-                close_old_connections()
-                type(self.state_model).objects.filter(pk=self.state_model.pk).update(
-                    ref_price=ref, trailing_high=trailing_high, last_level_idx=last_idx,
-                    atr=self.atr_value, eff_grid_step=self.eff_grid_step, atr_trailing_stop=stop_line
-                )
-
+                self.on_tick(self._next_price())
             except Exception as e:
+                self.metrics.inc("gridbot_loop_errors_total", symbol=self.symbol)
                 print(f"[{now_iso()}] Loop erro: {e}")
+            # atraso além da espera planejada entre ticks (loop ficando para trás)
+            now = time.monotonic()
+            self.metrics.observe("gridbot_loop_drift_seconds", max(0.0, now - last - planned),
+                                 symbol=self.symbol)
+            last = now
+            self.metrics.flush_every()
+
+            if self.feed is None:
+                planned = window_wait(self.next_delay())
+                self._stop_evt.wait(planned)
+            else:
+                planned = self.cfg.interval
+                self._stop_evt.wait(STREAM_MIN_GAP)
 
-            time.sleep(self.cfg.interval)
-
-        close_old_connections()
-        type(self.state_model).objects.filter(pk=self.state_model.pk).update(running=False)
+        self.finish()
@@ -0,0 +1,152 @@
+import os, time, fcntl
+from contextlib import contextmanager
+import numpy as np
+from django.conf import settings
+from .bot_runner import INTERVAL_SEC, get_klines
+
+# uma coluna por arquivo, append-only; t é gravado por último (ver append)
+COLUMNS = (("o", np.float64), ("h", np.float64), ("l", np.float64), ("c", np.float64),
+           ("v", np.float64), ("t", np.int64))
+PAGE = 1000
+
+
+class CandleStore:
+    """Cache local de klines: arquivos binários colunares por símbolo/intervalo
+    (`<root>/<SYMBOL>/<interval>/<col>.bin`), lidos via np.memmap.
+
+    Só velas fechadas são gravadas. `sync()` busca apenas a cauda que falta
+    desde a última abertura gravada e devolve a vela em formação à parte.
+    """
+
+    def __init__(self, root=None):
+        self.root = str(root or getattr(settings, "CANDLE_STORE_DIR", None)
+                        or os.path.join(settings.BASE_DIR, "candles"))
+
+    def _dir(self, symbol, interval):
+        return os.path.join(self.root, symbol.upper(), interval)
+
+    def _file(self, symbol, interval, col):
+        return os.path.join(self._dir(symbol, interval), f"{col}.bin")
+
+    @contextmanager
+    def _lock(self, symbol, interval):
+        # runner e web podem sincronizar o mesmo par ao mesmo tempo
+        d = self._dir(symbol, interval)
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def count(self, symbol, interval):
+        # linhas completas: a menor coluna manda (append interrompido no meio)
+        sizes = []
+        for col, dt in COLUMNS:
+            p = self._file(symbol, interval, col)
+            sizes.append(os.path.getsize(p) // np.dtype(dt).itemsize if os.path.exists(p) else 0)
+        return min(sizes)
+
+    def last_t(self, symbol, interval):
+        n = self.count(symbol, interval)
+        if not n:
+            return None
+        return int(np.memmap(self._file(symbol, interval, "t"), dtype=np.int64, mode="r", offset=(n - 1) * 8)[0])
+
+    def _repair(self, symbol, interval, n):
+        for col, dt in COLUMNS:
+            p = self._file(symbol, interval, col)
+            if os.path.exists(p) and os.path.getsize(p) > n * np.dtype(dt).itemsize:
+                os.truncate(p, n * np.dtype(dt).itemsize)
+
+    def append(self, symbol, interval, rows):
+        # rows: dicts em ordem crescente de t; ignora o que já está gravado
+        with self._lock(symbol, interval):
+            n = self.count(symbol, interval)
+            self._repair(symbol, interval, n)
+            last = self.last_t(symbol, interval)
+            rows = [r for r in rows if last is None or r["t"] > last]
+            if not rows:
+                return 0
+            for col, dt in COLUMNS:
+                with open(self._file(symbol, interval, col), "ab") as f:
+                    f.write(np.array([r.get(col, 0) for r in rows], dtype=dt).tobytes())
+            return len(rows)
+
+    def read(self, symbol, interval, start=None, end=None, limit=None):
+        """Colunas {t,o,h,l,c,v} como fatias de memmap (sem cópia).
+        start/end em ms de abertura (end exclusivo); limit pega as últimas."""
+        n = self.count(symbol, interval)
+        if not n:
+            return {col: np.empty(0, dtype=dt) for col, dt in COLUMNS}
+        cols = {col: np.memmap(self._file(symbol, interval, col), dtype=dt, mode="r", shape=(n,))
+                for col, dt in COLUMNS}
+        t = cols["t"]
+        lo = int(np.searchsorted(t, start, "left")) if start is not None else 0
+        hi = int(np.searchsorted(t, end, "left")) if end is not None else n
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return {col: a[lo:hi] for col, a in cols.items()}
+
+    def tail(self, symbol, interval, limit):
+        # últimas `limit` velas fechadas no formato de get_klines
+        a = self.read(symbol, interval, limit=limit)
+        return [{"t": t, "o": o, "h": h, "l": l, "c": c, "v": v} for t, o, h, l, c, v in
+                zip(a["t"].tolist(), a["o"].tolist(), a["h"].tolist(), a["l"].tolist(),
+                    a["c"].tolist(), a["v"].tolist())]
+
+    def sync(self, symbol, interval, backfill=PAGE, now_ms=None, fetch=get_klines):
+        """Baixa só as velas desde a última gravada (ou as últimas `backfill`
+        se vazio, paginando se passar de uma página).
+        Devolve (velas novas gravadas, vela em formação ou None)."""
+        step = INTERVAL_SEC.get(interval, 60) * 1000
+        now_ms = now_ms or int(time.time() * 1000)
+        added, live = 0, None
+        while True:
+            last = self.last_t(symbol, interval)
+            if last is None and backfill <= PAGE:
+                rows = fetch(symbol, interval, limit=backfill)
+            elif last is None:
+                # backfill longo: pagina a partir do início em vez de só a última página
+                rows = fetch(symbol, interval, limit=PAGE, start_time=now_ms - backfill * step)
+            else:
+                missing = (now_ms - last) // step
+                rows = fetch(symbol, interval, limit=min(PAGE, max(2, missing + 1)), start_time=last + step)
+            closed = [r for r in rows if r["t"] + step <= now_ms]
+            if rows and rows[-1]["t"] + step > now_ms:
+                live = rows[-1]
+            added += self.append(symbol, interval, closed)
+            # página cheia e ainda atrasado: continua
+            if (last is None and backfill <= PAGE) or len(rows) < PAGE or live is not None or not closed:
+                return added, live
+
+
+_default = None
+
+def default_store():
+    global _default
+    if _default is None:
+        _default = CandleStore()
+    return _default
+
+SYNC_TTL = 2.0
+
+def shared_sync(symbol, interval, backfill=PAGE, store=None, cache=None):
+    """store.sync() passando pelo cache de mercado da máquina: runner e workers
+    web pedindo o mesmo par juntos fazem uma busca só na corretora; os outros
+    leem do mesmo store em disco. Com o store vazio o backfill entra na chave."""
+    from .mdcache import default_market_cache
+    store = store or default_store()
+    cache = cache or default_market_cache()
+    key = f"sync:{store.root}:{symbol.upper()}:{interval}"
+    if store.last_t(symbol, interval) is None:
+        key += f":{backfill}"
+    return cache.get_or_fill(key, SYNC_TTL, lambda: store.sync(symbol, interval, backfill=backfill))
+
+def store_klines(symbol, interval, limit, store=None):
+    # velas fechadas do store + a vela em formação (mesmo formato de get_klines)
+    store = store or default_store()
+    _, live = shared_sync(symbol, interval, backfill=max(limit, 2), store=store)
+    rows = store.tail(symbol, interval, limit - 1 if live else limit)
+    return rows + [live] if live else rows
@@ -0,0 +1,88 @@
+import os, json, fcntl, threading
+
+class Checkpoint:
+    """Estado leve de todos os bots num único arquivo JSON compacto.
+
+    `put()` só marca sujo quando o estado do símbolo muda de fato; `save()`
+    grava em arquivo temporário, faz fsync e troca com os.replace, então um
+    crash no meio deixa o snapshot anterior intacto. Vários processos
+    (um worker por símbolo) podem dividir o arquivo: a gravação relê o disco
+    sob flock e só sobrescreve os símbolos deste processo.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, legacy_symbol=None):
+        self.path = path
+        self.legacy_symbol = legacy_symbol  # formato antigo (plano, um bot só)
+        self._lock = threading.Lock()
+        self._bots = None
+        self._dirty = False
+        self._mine = set()   # símbolos gravados por este processo
+        self.writes = 0
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            from .bot_runner import now_iso     # bot_runner importa este módulo
+            print(f"[{now_iso()}] Checkpoint ilegível ({self.path}): {e}")
+            return {}
+        if isinstance(data, dict) and "bots" in data:
+            return data["bots"]
+        if isinstance(data, dict) and self.legacy_symbol and "ref_price" in data:
+            return {self.legacy_symbol: data}
+        return {}
+
+    def _ensure(self):
+        if self._bots is None:
+            self._bots = self._load()
+
+    def get(self, symbol):
+        with self._lock:
+            self._ensure()
+            return dict(self._bots.get(symbol, {}))
+
+    def put(self, symbol, state):
+        with self._lock:
+            self._ensure()
+            if self._bots.get(symbol) != state:
+                self._bots[symbol] = dict(state)
+                self._mine.add(symbol)
+                self._dirty = True
+
+    def save(self, force=False):
+        with self._lock:
+            if not (self._dirty or force) or self._bots is None:
+                return False
+            with open(f"{self.path}.lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    # o que os outros processos gravaram + os nossos símbolos
+                    bots = self._load()
+                    bots.update({s: self._bots[s] for s in self._mine if s in self._bots})
+                    self._bots = bots
+                    payload = json.dumps({"version": self.VERSION, "bots": bots},
+                                         ensure_ascii=False, separators=(",", ":"))
+                    tmp = f"{self.path}.tmp.{os.getpid()}"
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        f.write(payload)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp, self.path)
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+            try:
+                fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+                try:
+                    os.fsync(fd)  # garante a troca de nome no disco
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+            self._dirty = False
+            self.writes += 1
+            return True
@@ -0,0 +1,139 @@
+import time, threading
+from collections import deque
+from django.db import close_old_connections
+from .bot_runner import get_prices, now_iso
+from .metrics import REGISTRY
+
+FETCH_BACKOFF_MAX = 60.0   # teto da espera entre tentativas com o ticker em lote falhando
+MAX_WAIT = 5.0             # volta pelo menos a cada 5s: bots adicionados não esperam o mais lento
+
+class MultiGridEngine(threading.Thread):
+    """Um único loop para N bots (um por símbolo).
+
+    A cada volta busca, num só request de ticker em lote, o preço de todos os
+    símbolos cujo intervalo venceu e despacha para a lógica de grade/stop de
+    cada bot. O custo por volta é de um round trip HTTP, não de um por bot.
+    Cada bot decide quando vence de novo (`next_delay`): perto do stop ou de
+    um nível volta logo, longe de tudo espaça.
+    """
+
+    def __init__(self, bots, feed=None, clock=time.time):
+        super().__init__(daemon=True)
+        self.bots = {b.symbol: b for b in bots}
+        self.feed = feed        # MarketStream opcional: preços frescos dispensam o REST
+        self.clock = clock      # injetável (simulação)
+        self._stop_evt = threading.Event()
+        self.next_due = {}
+        self.fetch_failures = 0
+        self._new = deque()     # bots adicionados com o loop rodando (símbolo novo no painel)
+
+    def _prices(self, symbols):
+        prices = {}
+        if self.feed is not None:
+            for sym in symbols:
+                p = self.feed.latest(sym, max_age=self.bots[sym].cfg.interval)
+                if p is not None:
+                    prices[sym] = p
+        missing = [s for s in symbols if s not in prices]
+        if missing:
+            with REGISTRY.timer("gridbot_stage_seconds", stage="price", symbol="batch"):
+                prices.update(get_prices(missing))
+        return prices
+
+    def stop(self): self._stop_evt.set()
+    def stopped(self): return self._stop_evt.is_set()
+
+    def add(self, bot):
+        # chamado de outra thread; o loop inicia o bot na próxima volta
+        self._new.append(bot)
+
+    def _start_bots(self, bots=None):
+        bots = list(self.bots.values()) if bots is None else bots
+        self.bots.update((b.symbol, b) for b in bots)
+        try:
+            prices = self._prices([b.symbol for b in bots])
+        except Exception:
+            for b in bots:
+                del self.bots[b.symbol]
+            raise
+        now = self.clock()
+        for bot in bots:
+            sym = bot.symbol
+            if sym not in prices:
+                print(f"[{now_iso()}] {sym}: sem preço inicial, bot ignorado")
+                del self.bots[sym]
+                continue
+            try:
+                bot.start_bot(prices[sym])
+                self.next_due[sym] = now + bot.cfg.interval
+            except Exception as e:
+                print(f"[{now_iso()}] {sym}: falha no startup: {e}")
+                del self.bots[sym]
+
+    def _start_new(self):
+        bots = [self._new.popleft() for _ in range(len(self._new))]
+        bots = [b for b in bots if b.symbol not in self.bots]
+        try:
+            self._start_bots(bots)
+        except Exception as e:
+            print(f"[{now_iso()}] Falha preço inicial ({', '.join(b.symbol for b in bots)}): {e}")
+            self._new.extend(bots)      # tenta de novo na próxima volta
+
+    def tick(self, now=None):
+        # uma volta: preços em lote só para os símbolos vencidos
+        now = self.clock() if now is None else now
+        due = [sym for sym, t in self.next_due.items() if t <= now]
+        if not due:
+            return 0
+        try:
+            prices = self._prices(due)
+        except Exception as e:
+            # corretora/rede fora: adia os vencidos com backoff em vez de repetir a cada volta
+            self.fetch_failures += 1
+            REGISTRY.inc("gridbot_loop_errors_total", symbol="batch")
+            for sym in due:
+                base = self.bots[sym].cfg.interval
+                self.next_due[sym] = now + max(base, min(FETCH_BACKOFF_MAX, base * 2 ** (self.fetch_failures - 1)))
+            print(f"[{now_iso()}] Falha preços em lote ({self.fetch_failures}x): {e}")
+            return len(due)
+        self.fetch_failures = 0
+        for sym in due:
+            bot = self.bots[sym]
+            # quanto passou do vencimento (loop ficando para trás)
+            REGISTRY.observe("gridbot_loop_drift_seconds", max(0.0, now - self.next_due[sym]), symbol=sym)
+            self.next_due[sym] = now + bot.cfg.interval
+            if sym not in prices:
+                continue
+            try:
+                bot.on_tick(prices[sym])
+                self.next_due[sym] = now + bot.next_delay()
+            except Exception as e:
+                REGISTRY.inc("gridbot_loop_errors_total", symbol=sym)
+                print(f"[{now_iso()}] {sym}: loop erro: {e}")
+        return len(due)
+
+    def run(self):
+        close_old_connections()
+        try:
+            self._start_bots()
+        except Exception as e:
+            print(f"[{now_iso()}] Falha preço inicial: {e}")
+            return
+
+        while not self.stopped() and (self.bots or self._new):
+            try:
+                close_old_connections()
+                if self._new:
+                    self._start_new()
+                self.tick()
+            except Exception as e:
+                print(f"[{now_iso()}] Loop erro: {e}")
+            REGISTRY.flush_every()
+            wait = min(self.next_due.values(), default=self.clock() + MAX_WAIT) - self.clock()
+            self._stop_evt.wait(max(0.2, min(wait, MAX_WAIT)))
+
+        for bot in self.bots.values():
+            try:
+                bot.finish()
+            except Exception:
+                pass
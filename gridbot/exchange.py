@@ -0,0 +1,221 @@
+import time, threading
+import requests
+from requests.adapters import HTTPAdapter
+from .metrics import REGISTRY
+
+BINANCE_HOSTS = ["https://api.binance.com", "https://api1.binance.com", "https://api2.binance.com"]
+USER_AGENT = "polgrid-bot/1.0"
+
+
+class RateLimited(RuntimeError):
+    pass
+
+
+class RequestError(RuntimeError):
+    # 4xx (fora 418/429): o pedido está errado (ex.: símbolo inválido), não o host
+    pass
+
+
+def klines_weight(limit):
+    # tabela de peso do /api/v3/klines
+    if limit < 100: return 1
+    if limit < 500: return 2
+    if limit <= 1000: return 5
+    return 10
+
+
+class HostHealth:
+    """Latência (EWMA) e erros de um host, com circuit breaker: após
+    `fail_threshold` falhas seguidas o host fica aberto por um cooldown que
+    dobra a cada reabertura (até `max_cooldown`)."""
+
+    def __init__(self, host, fail_threshold=3, base_cooldown=15, max_cooldown=300):
+        self.host = host
+        self.fail_threshold = fail_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.latency = None
+        self.requests = 0
+        self.errors = 0
+        self.consecutive = 0
+        self.trips = 0
+        self.open_until = 0.0
+
+    def is_open(self, now):
+        return now < self.open_until
+
+    def ok(self, elapsed):
+        self.requests += 1
+        self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+        self.consecutive = 0
+        self.trips = 0
+
+    def fail(self, now):
+        self.requests += 1
+        self.errors += 1
+        self.consecutive += 1
+        if self.consecutive >= self.fail_threshold:
+            self.open_until = now + min(self.max_cooldown, self.base_cooldown * (2 ** self.trips))
+            self.trips += 1
+            self.consecutive = 0
+
+    def score(self):
+        # menor é melhor: latência penalizada pela taxa de erro; host sem histórico vai no meio
+        lat = self.latency if self.latency is not None else 0.5
+        return lat * (1 + 4 * self.errors / max(1, self.requests))
+
+    def snapshot(self, now):
+        return {"host": self.host, "latency_ms": round((self.latency or 0) * 1000, 1),
+                "requests": self.requests, "errors": self.errors, "open": self.is_open(now)}
+
+
+class WeightBudget:
+    """Orçamento de peso por minuto. O header X-MBX-USED-WEIGHT-1M é o peso
+    usado pelo IP inteiro, então runner e web (mesmo IP) enxergam o mesmo
+    total; entre respostas, a conta local adianta o que foi gasto."""
+
+    def __init__(self, limit=1000):
+        self.limit = limit
+        self.minute = None
+        self.used = 0
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _roll(self, now):
+        m = int(now // 60)
+        if m != self.minute:
+            self.minute, self.used = m, 0
+
+    def acquire(self, weight, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            if now < self.blocked_until:
+                raise RateLimited(f"bloqueado pela corretora por {self.blocked_until - now:.0f}s")
+            self._roll(now)
+            if self.used + weight > self.limit:
+                raise RateLimited(f"orçamento de peso esgotado ({self.used}/{self.limit})")
+            self.used += weight
+
+    def sync(self, used, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._roll(now)
+            self.used = max(self.used, used)
+
+    def block(self, seconds, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def remaining(self, now=None):
+        with self._lock:
+            self._roll(time.time() if now is None else now)
+            return self.limit - self.used
+
+
+def _error_detail(r):
+    # {"code": -1121, "msg": "Invalid symbol."} da Binance, ou o começo do corpo
+    try:
+        body = r.json()
+    except ValueError:
+        body = None
+    return (body.get("msg") if isinstance(body, dict) else None) or r.text[:200]
+
+
+def _session(pool_size=10):
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    s.headers["User-Agent"] = USER_AGENT
+    return s
+
+
+class ExchangeClient:
+    """Cliente compartilhado da Binance: sessão keep-alive única, hosts
+    ordenados pela saúde medida, breaker por host e orçamento de peso."""
+
+    def __init__(self, hosts=BINANCE_HOSTS, timeout=(3, 8), budget=None, session=None):
+        self.hosts = [HostHealth(h) for h in hosts]
+        self.timeout = timeout
+        self.budget = budget or WeightBudget()
+        self.session = session or _session()
+        self._lock = threading.Lock()
+
+    def ordered_hosts(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            closed = sorted((h for h in self.hosts if not h.is_open(now)), key=HostHealth.score)
+            if closed:
+                return closed
+            # todos abertos: tenta o que reabre primeiro (meio-aberto)
+            return [min(self.hosts, key=lambda h: h.open_until)]
+
+    def get_json(self, path, params=None, weight=1):
+        try:
+            self.budget.acquire(weight)
+        except RateLimited:
+            REGISTRY.inc("gridbot_http_requests_total", host="budget", outcome="rate_limited")
+            raise
+        last_err = None
+        for h in self.ordered_hosts():
+            t0 = time.monotonic()
+            try:
+                r = self.session.get(f"{h.host}{path}", params=params, timeout=self.timeout)
+                used = r.headers.get("X-MBX-USED-WEIGHT-1M")
+                if used and used.isdigit():
+                    self.budget.sync(int(used))
+                if r.status_code in (418, 429):
+                    # limite do IP: não adianta trocar de host
+                    self.budget.block(float(r.headers.get("Retry-After") or 60))
+                    REGISTRY.inc("gridbot_http_requests_total", host=h.host, outcome="rate_limited")
+                    raise RateLimited(f"HTTP {r.status_code} em {h.host}")
+                if 400 <= r.status_code < 500:
+                    # o host respondeu: trocar de host não conserta o pedido
+                    with self._lock:
+                        h.ok(time.monotonic() - t0)
+                    REGISTRY.inc("gridbot_http_requests_total", host=h.host, outcome="client_error")
+                    raise RequestError(f"HTTP {r.status_code} em {path}: {_error_detail(r)}")
+                r.raise_for_status()
+                data = r.json()
+            except (RateLimited, RequestError):
+                raise
+            except Exception as e:
+                with self._lock:
+                    h.fail(time.time())
+                REGISTRY.inc("gridbot_http_requests_total", host=h.host, outcome="error")
+                last_err = e
+                continue
+            elapsed = time.monotonic() - t0
+            with self._lock:
+                h.ok(elapsed)
+            REGISTRY.inc("gridbot_http_requests_total", host=h.host, outcome="ok")
+            REGISTRY.observe("gridbot_http_seconds", elapsed, host=h.host)
+            return data
+        raise RuntimeError(f"todos os hosts falharam: {last_err}")
+
+    def stats(self):
+        now = time.time()
+        return {"hosts": [h.snapshot(now) for h in self.hosts],
+                "weight_used": self.budget.used, "weight_limit": self.budget.limit}
+
+
+_client = None
+_shared = None
+_init_lock = threading.Lock()
+
+def default_client():
+    global _client
+    with _init_lock:
+        if _client is None:
+            from django.conf import settings
+            _client = ExchangeClient(budget=WeightBudget(getattr(settings, "BINANCE_WEIGHT_LIMIT", 1000)))
+        return _client
+
+def shared_session():
+    # sessão keep-alive para as demais APIs (Telegram etc.)
+    global _shared
+    with _init_lock:
+        if _shared is None:
+            _shared = _session()
+        return _shared
@@ -0,0 +1,359 @@
+import time, threading, itertools
+from collections import deque
+from django.conf import settings
+from django.db import close_old_connections
+from .metrics import REGISTRY
+
+BUY, SELL = "buy", "sell"
+OPEN = ("new", "open", "partial")
+EPS = 1e-12
+STOP_TIMEOUT = 5.0      # espera pelo thread do Executor na parada
+
+def _now():
+    from .bot_runner import now_iso     # bot_runner importa este módulo
+    return now_iso()
+
+
+class OrderRejected(RuntimeError):
+    pass
+
+
+class OrderIntent:
+    """Ordem que o bot quer: lado, quantidade e preço limite (None = a mercado)."""
+    __slots__ = ("symbol", "side", "qty", "price", "reason", "client_id", "ts")
+    _seq = itertools.count(1)
+
+    def __init__(self, symbol, side, qty, price=None, reason="grid", client_id=None, ts=None):
+        self.symbol = symbol
+        self.side = side
+        self.qty = qty
+        self.price = price
+        self.reason = reason
+        self.ts = time.time() if ts is None else ts
+        self.client_id = client_id or f"gb-{int(self.ts * 1000)}-{next(self._seq)}"
+
+
+class Fill:
+    __slots__ = ("client_id", "qty", "price", "ts")
+
+    def __init__(self, client_id, qty, price, ts=None):
+        self.client_id = client_id
+        self.qty = qty
+        self.price = price
+        self.ts = time.time() if ts is None else ts
+
+
+class Position:
+    """Quantidade e preço médio: compras refazem o PM, vendas realizam o PnL."""
+
+    def __init__(self, qty=0.0, avg=0.0):
+        self.qty = qty
+        self.avg = avg
+        self.realized = 0.0
+
+    def apply(self, side, qty, price):
+        if side == BUY:
+            total = self.qty + qty
+            self.avg = (self.qty * self.avg + qty * price) / total if total > 0 else self.avg
+            self.qty = total
+        else:
+            q = min(qty, self.qty)
+            self.realized += q * (price - self.avg)
+            self.qty = self.qty - q if self.qty - q > EPS else 0.0
+        return self
+
+
+class ExchangeAdapter:
+    """Interface das corretoras.
+
+    `place()` devolve o id da ordem na corretora (ou levanta OrderRejected),
+    `fills()` devolve os Fill desde a última chamada e `mark()` recebe o
+    preço que o bot viu (só o simulador usa). Chamadas só do thread do Executor.
+    """
+
+    def place(self, intent):
+        raise NotImplementedError
+
+    def cancel(self, client_id):
+        raise NotImplementedError
+
+    def fills(self):
+        raise NotImplementedError
+
+    def mark(self, symbol, price, ts=None):
+        pass
+
+
+class PaperExchange(ExchangeAdapter):
+    """Casamento local de ordens contra velas (gravadas ou ao vivo).
+
+    Limite de compra executa quando a mínima alcança o preço, de venda
+    quando a máxima alcança; gap a favor executa na abertura. A mercado sai
+    na abertura da próxima vela. Com `max_volume_pct`, cada vela executa no
+    máximo essa fração do volume dela (fills parciais, ordem de chegada).
+    """
+
+    def __init__(self, max_volume_pct=None):
+        self.max_volume_pct = max_volume_pct
+        self.book = {}          # symbol -> {client_id: [intent, restante]}
+        self._fills = deque()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def place(self, intent):
+        if intent.qty <= 0 or (intent.price is not None and intent.price <= 0):
+            raise OrderRejected(f"ordem inválida: {intent.qty} @ {intent.price}")
+        with self._lock:
+            self.book.setdefault(intent.symbol, {})[intent.client_id] = [intent, intent.qty]
+        return f"paper-{next(self._ids)}"
+
+    def cancel(self, client_id):
+        with self._lock:
+            for orders in self.book.values():
+                if orders.pop(client_id, None) is not None:
+                    return True
+        return False
+
+    def on_candle(self, symbol, c):
+        cap = float("inf")
+        if self.max_volume_pct and c.get("v") is not None:
+            cap = c["v"] * self.max_volume_pct
+        ts = c.get("t", time.time() * 1000) / 1000.0
+        with self._lock:
+            orders = self.book.get(symbol, {})
+            for cid, item in list(orders.items()):
+                intent, left = item
+                if intent.price is None:
+                    px = c["o"]
+                elif intent.side == BUY and c["l"] <= intent.price:
+                    px = min(intent.price, c["o"])
+                elif intent.side == SELL and c["h"] >= intent.price:
+                    px = max(intent.price, c["o"])
+                else:
+                    continue
+                q = min(left, cap)
+                if q <= EPS:
+                    break
+                cap -= q
+                item[1] = left - q
+                self._fills.append(Fill(cid, q, px, ts))
+                if item[1] <= EPS:
+                    del orders[cid]
+
+    def replay(self, symbol, candles):
+        for c in candles:
+            self.on_candle(symbol, c)
+
+    def mark(self, symbol, price, ts=None):
+        t = (time.time() if ts is None else ts) * 1000
+        self.on_candle(symbol, {"t": t, "o": price, "h": price, "l": price, "c": price})
+
+    def fills(self):
+        with self._lock:
+            out, self._fills = list(self._fills), deque()
+        return out
+
+
+class Executor(threading.Thread):
+    """Execução fora do loop de preço.
+
+    `submit()` e `mark()` só enfileiram. O thread manda as ordens pelo
+    adapter, coleta os fills e mantém a posição (qty/PM) de cada símbolo:
+    grava BotOrder e qty/avg do BotConfig, e entrega a posição ao bot, que a
+    aplica entre ticks. Vendas nunca passam da posição livre (descontadas as
+    vendas em aberto), então stops repetidos não viram ordens repetidas. O
+    stop cancela antes as ordens abertas do símbolo (vendas da grade prendem
+    quantidade, compras abaixo recomprariam) e vende a posição inteira.
+    """
+
+    def __init__(self, adapter, poll_interval=1.0, max_queue=500, persist=True):
+        super().__init__(daemon=True)
+        self.adapter = adapter
+        self.poll_interval = poll_interval
+        self.max_queue = max_queue
+        self.persist = persist
+        self.bots = {}
+        self.positions = {}
+        self.orders = {}        # client_id -> {"intent", "filled", "cost", "status", "pk"}
+        self._intents = deque()
+        self._marks = {}
+        self._resets = {}       # symbol -> (qty, avg) do painel ao ligar o auto trade
+        self._cond = threading.Condition()
+        self._stop_evt = threading.Event()
+        self.placed = self.rejected = self.skipped = self.fills_seen = self.dropped = 0
+
+    # --- produtores (loop do bot) ---
+    def attach(self, bot):
+        self.bots[bot.symbol] = bot
+        self.positions.setdefault(bot.symbol, Position(bot.cfg.qty or 0.0, bot.cfg.avg or 0.0))
+
+    def submit(self, intent):
+        with self._cond:
+            if len(self._intents) >= self.max_queue:
+                self._intents.popleft()
+                self.dropped += 1
+            self._intents.append(intent)
+            self._cond.notify()
+
+    def mark(self, symbol, price):
+        with self._cond:
+            self._marks[symbol] = (price, time.time())
+
+    def reset_position(self, symbol, qty, avg):
+        # aplicado no thread do Executor, antes das ordens novas
+        with self._cond:
+            self._resets[symbol] = (qty or 0.0, avg or 0.0)
+            self._cond.notify()
+
+    # --- observabilidade ---
+    def metrics(self):
+        with self._cond:
+            depth = len(self._intents)
+        return {"queue_depth": depth, "open_orders": sum(o["status"] in OPEN for o in self.orders.values()),
+                "placed": self.placed, "rejected": self.rejected, "skipped": self.skipped,
+                "fills": self.fills_seen, "dropped": self.dropped}
+
+    # --- thread ---
+    def _open_sells(self, symbol):
+        return sum(o["intent"].qty - o["filled"] for o in self.orders.values()
+                   if o["status"] in OPEN and o["intent"].symbol == symbol and o["intent"].side == SELL)
+
+    def _cancel_open(self, symbol):
+        # fills já executados entram antes: o que foi cancelado não conta na posição
+        for f in self.adapter.fills():
+            self._fill(f)
+        for cid, o in self.orders.items():
+            if o["status"] not in OPEN or o["intent"].symbol != symbol:
+                continue
+            try:
+                self.adapter.cancel(cid)
+            except Exception as e:
+                print(f"[{_now()}] Cancelamento falhou ({symbol} {cid}): {e}")
+                continue
+            o["status"] = "canceled"
+            REGISTRY.inc("gridbot_orders_total", symbol=symbol, side=o["intent"].side, status="canceled")
+            if self.persist:
+                from .models import BotOrder
+                BotOrder.objects.filter(pk=o["pk"]).update(status="canceled")
+
+    def _place(self, intent):
+        pos = self.positions.setdefault(intent.symbol, Position())
+        if intent.reason == "stop":
+            self._cancel_open(intent.symbol)
+            intent.qty = pos.qty - self._open_sells(intent.symbol)
+        elif intent.side == SELL:
+            intent.qty = min(intent.qty, pos.qty - self._open_sells(intent.symbol))
+        if intent.qty <= EPS:
+            self.skipped += 1
+            return
+        o = self.orders[intent.client_id] = {"intent": intent, "filled": 0.0, "cost": 0.0, "status": "new",
+                                             "pk": None}
+        fields = {}
+        try:
+            fields["exchange_id"] = self.adapter.place(intent)
+            o["status"] = "open"
+            self.placed += 1
+        except Exception as e:
+            o["status"] = "rejected"
+            fields["error"] = str(e)[:500]
+            self.rejected += 1
+            print(f"[{_now()}] Ordem rejeitada ({intent.symbol} {intent.side} {intent.qty}): {e}")
+        REGISTRY.inc("gridbot_orders_total", symbol=intent.symbol, side=intent.side, status=o["status"])
+        if self.persist:
+            from .models import BotOrder
+            o["pk"] = BotOrder.objects.create(
+                symbol=intent.symbol, client_id=intent.client_id, side=intent.side, kind=intent.reason,
+                qty=intent.qty, price=intent.price, status=o["status"], **fields).pk
+
+    def _fill(self, f):
+        o = self.orders.get(f.client_id)
+        if o is None or o["status"] not in OPEN:
+            return
+        intent = o["intent"]
+        o["filled"] += f.qty
+        o["cost"] += f.qty * f.price
+        o["status"] = "filled" if intent.qty - o["filled"] <= EPS else "partial"
+        pos = self.positions.setdefault(intent.symbol, Position()).apply(intent.side, f.qty, f.price)
+        self.fills_seen += 1
+        REGISTRY.inc("gridbot_fills_total", symbol=intent.symbol, side=intent.side)
+        bot = self.bots.get(intent.symbol)
+        if self.persist:
+            from .models import BotConfig, BotOrder
+            BotOrder.objects.filter(pk=o["pk"]).update(status=o["status"], filled_qty=o["filled"],
+                                                       avg_fill_price=o["cost"] / o["filled"])
+            if bot is not None and bot.cfg.pk:
+                BotConfig.objects.filter(pk=bot.cfg.pk).update(qty=pos.qty, avg=pos.avg)
+        if bot is not None:
+            bot.set_position(pos.qty, pos.avg)
+
+    def step(self):
+        # ordens novas primeiro: casam já contra o preço que as gerou
+        with self._cond:
+            intents, self._intents = list(self._intents), deque()
+            marks, self._marks = self._marks, {}
+            resets, self._resets = self._resets, {}
+        if self.persist:
+            close_old_connections()
+        for symbol, (qty, avg) in resets.items():
+            self.positions[symbol] = Position(qty, avg)
+        for intent in intents:
+            self._place(intent)
+        for symbol, (price, ts) in marks.items():
+            self.adapter.mark(symbol, price, ts)
+        for f in self.adapter.fills():
+            self._fill(f)
+        return len(intents)
+
+    def run(self):
+        while not self._stop_evt.is_set():
+            try:
+                self.step()
+            except Exception as e:
+                print(f"[{_now()}] Executor erro: {e}")
+            with self._cond:
+                if not self._intents and not self._stop_evt.is_set():
+                    self._cond.wait(self.poll_interval)
+
+    def stop(self):
+        self._stop_evt.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout=STOP_TIMEOUT)
+        if self.is_alive():
+            # ainda dentro de um step(): drenar aqui seriam dois threads na mesma fila
+            print(f"[{_now()}] Executor não parou em {STOP_TIMEOUT:.0f}s; ordens na fila ficam sem envio")
+            return
+        try:
+            self.step()     # o que chegou depois da última volta
+        except Exception as e:
+            print(f"[{_now()}] Executor erro: {e}")
+
+
+def make_adapter(spec):
+    # "paper" ou caminho pontuado de uma subclasse de ExchangeAdapter
+    if spec == "paper":
+        return PaperExchange()
+    from django.utils.module_loading import import_string
+    return import_string(spec)()
+
+
+_executor = None
+_lock = threading.Lock()
+
+def current_executor():
+    # o Executor do processo, se houver, sem criar outro
+    return _executor
+
+def default_executor():
+    """Executor do processo, ou None sem EXECUTION_ADAPTER (só sugestões no Telegram)."""
+    global _executor
+    spec = getattr(settings, "EXECUTION_ADAPTER", "")
+    if not spec:
+        return None
+    with _lock:
+        if _executor is None or not _executor.is_alive():
+            _executor = Executor(make_adapter(spec))
+            _executor.start()
+            REGISTRY.collector("gridbot_executor", _executor.metrics)
+        return _executor
@@ -1,14 +1,66 @@
 from django import forms
-from .models import BotConfig
+from .models import BotConfig, PriceTrigger
 
 class BotConfigForm(forms.ModelForm):
     class Meta:
         model = BotConfig
-        fields = ["qty","avg","grid_step","levels_up","levels_down","stop_from_avg","interval","telegram_enabled"]
+        fields = ["qty","avg","grid_step","levels_up","levels_down","stop_from_avg","interval","telegram_enabled",
+                  "auto_trade","grid_shape","bands_len","bands_k",
+                  "stop_rearm_pct","stop_repeat_sec","grid_hysteresis_pct","signal_dedup_sec",
+                  "adaptive_poll","poll_min_sec","poll_max_sec"]
         widgets = {
             "qty": forms.NumberInput(attrs={"step":"0.0001"}),
             "avg": forms.NumberInput(attrs={"step":"0.0001"}),
             "grid_step": forms.NumberInput(attrs={"step":"0.1"}),
             "stop_from_avg": forms.NumberInput(attrs={"step":"0.1"}),
             "interval": forms.NumberInput(attrs={"min":"5"}),
+            "bands_len": forms.NumberInput(attrs={"min":"2"}),
+            "bands_k": forms.NumberInput(attrs={"step":"0.1","min":"0.1"}),
+            "stop_rearm_pct": forms.NumberInput(attrs={"step":"0.01","min":"0"}),
+            "stop_repeat_sec": forms.NumberInput(attrs={"min":"0"}),
+            "grid_hysteresis_pct": forms.NumberInput(attrs={"step":"0.01","min":"0"}),
+            "signal_dedup_sec": forms.NumberInput(attrs={"min":"0"}),
+            "poll_min_sec": forms.NumberInput(attrs={"step":"0.5","min":"1"}),
+            "poll_max_sec": forms.NumberInput(attrs={"step":"0.5","min":"1"}),
         }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.auto_trade:
+            # com auto trade a posição vem dos fills (Executor): o painel só mostra
+            for f in ("qty", "avg"):
+                self.fields[f].disabled = True
+
+    def clean(self):
+        data = super().clean()
+        lo, hi = data.get("poll_min_sec"), data.get("poll_max_sec")
+        if lo is not None and hi is not None and lo > hi:
+            raise forms.ValidationError("Poll mínimo maior que o máximo.")
+        return data
+
+
+class PriceTriggerForm(forms.ModelForm):
+    direction = forms.ChoiceField(choices=[("", "automático")] + PriceTrigger.DIRECTIONS, required=False)
+
+    class Meta:
+        model = PriceTrigger
+        fields = ["kind","direction","price","qty","note"]
+        widgets = {
+            "price": forms.NumberInput(attrs={"step":"0.0001"}),
+            "qty": forms.NumberInput(attrs={"step":"0.0001"}),
+        }
+
+    def clean_price(self):
+        p = self.cleaned_data["price"]
+        if p is None or p <= 0:
+            raise forms.ValidationError("Preço deve ser positivo.")
+        return p
+
+    def direction_for(self, last_price):
+        # automático: nível acima do último preço dispara subindo; sem preço, take profit/alerta acima e stop abaixo
+        p = self.cleaned_data["price"]
+        if self.cleaned_data.get("direction"):
+            return self.cleaned_data["direction"]
+        if last_price:
+            return "above" if p > last_price else "below"
+        return "below" if self.cleaned_data["kind"] == "stop" else "above"
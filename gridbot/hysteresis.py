@@ -0,0 +1,57 @@
+ARMED, TRIGGERED = "armed", "triggered"
+TRIGGER, REPEAT, REARM = "trigger", "repeat", "rearm"
+
+
+class StopLatch:
+    """Stop como máquina de estados: armado -> disparado -> rearmado.
+
+    Armado, o primeiro tick com preço <= linha dispara (um evento). Disparado,
+    os ticks seguintes abaixo da linha não geram nada, a não ser um lembrete a
+    cada `repeat_sec` (0 = nunca). Só rearma quando o preço volta
+    `rearm_pct`% acima da linha, então oscilar em cima dela não repete o stop.
+    """
+    __slots__ = ("rearm", "repeat", "state", "fired_at")
+
+    def __init__(self, rearm_pct=0.0, repeat_sec=0, state=ARMED):
+        self.configure(rearm_pct, repeat_sec)
+        self.state = state if state in (ARMED, TRIGGERED) else ARMED
+        self.fired_at = None
+
+    def configure(self, rearm_pct, repeat_sec):
+        self.rearm = max(0.0, rearm_pct or 0.0) / 100.0
+        self.repeat = max(0, repeat_sec or 0)
+
+    def update(self, price, stop_line, now):
+        if price <= stop_line:
+            if self.state == ARMED:
+                self.state, self.fired_at = TRIGGERED, now
+                return TRIGGER
+            if self.repeat and (self.fired_at is None or now - self.fired_at >= self.repeat):
+                self.fired_at = now
+                return REPEAT
+            return None
+        if self.state == TRIGGERED and price >= stop_line * (1 + self.rearm):
+            self.state = ARMED
+            return REARM
+        return None
+
+
+class Dedup:
+    """Janela de deduplicação por chave: o mesmo evento dentro de `window`
+    segundos do anterior não vira linha no banco nem alerta."""
+
+    def __init__(self, window=0):
+        self.window = window
+        self.seen = {}          # chave -> ts do último evento que passou
+        self.suppressed = 0
+
+    def allow(self, key, now):
+        last = self.seen.get(key)
+        if self.window and last is not None and now - last < self.window:
+            self.suppressed += 1
+            return False
+        self.seen[key] = now
+        return True
+
+    def clear(self):
+        self.seen.clear()
@@ -0,0 +1,288 @@
+import math
+from collections import deque
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+EMA_BLOCK = 256     # EMA vetorizada em blocos: matmul dentro do bloco, carry entre blocos
+STEP_MIN, STEP_MAX = 0.15, 2.5   # mesmos limites do step por ATR (%)
+
+
+class StreamingATR:
+    """ATR incremental com a mesma conta de `calc_atr` (SMA inicial do TR e
+    depois EMA), alimentado uma vela fechada por vez.
+
+    `value` é o ATR das velas fechadas; `estimate(vela)` devolve o ATR como se
+    a vela em formação fechasse agora, sem alterar o estado.
+    """
+
+    def __init__(self, length=14):
+        self.length = length
+        self.k = 2 / (length + 1)
+        self.n = 0              # velas vistas
+        self.prev_close = None
+        self.tr_sum = 0
+        self.atr = None         # válido após `length` TRs
+        self.last_t = None
+
+    def _next(self, c):
+        # (n, tr_sum, atr) depois de incluir a vela c
+        tr = max(c["h"] - c["l"], abs(c["h"] - self.prev_close), abs(c["l"] - self.prev_close))
+        n = self.n + 1
+        trs = n - 1
+        tr_sum, atr = self.tr_sum, self.atr
+        if trs <= self.length:
+            tr_sum += tr
+            if trs == self.length:
+                atr = tr_sum / self.length
+        else:
+            atr = tr * self.k + atr * (1 - self.k)
+        return n, tr_sum, atr
+
+    def _ready(self, n, atr):
+        # calc_atr exige length+2 velas
+        return atr if n >= self.length + 2 else None
+
+    def update(self, c):
+        if self.prev_close is not None:
+            self.n, self.tr_sum, self.atr = self._next(c)
+        else:
+            self.n = 1
+        self.prev_close = c["c"]
+        self.last_t = c.get("t", self.last_t)
+        return self.value
+
+    def seed(self, ohlc):
+        for c in ohlc:
+            self.update(c)
+        return self.value
+
+    @property
+    def value(self):
+        return self._ready(self.n, self.atr)
+
+    def estimate(self, c):
+        if c is None or self.prev_close is None:
+            return self.value
+        n, _, atr = self._next(c)
+        return self._ready(n, atr)
+
+
+# --- vetorizado: colunas 1D (uma série) ou 2D (símbolos x velas) ---
+def _ema_run(x, alpha, y0):
+    # y[t] = alpha*x[t] + (1-alpha)*y[t-1], com y[-1] = y0, ao longo do último eixo
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[-1]
+    if n == 0:
+        return x.copy()
+    b = min(EMA_BLOCK, n)
+    nb = -(-n // b)
+    if nb * b != n:
+        x = np.concatenate([x, np.zeros(x.shape[:-1] + (nb * b - n,))], axis=-1)
+    xb = x.reshape(x.shape[:-1] + (nb, b))
+    p = (1 - alpha) ** np.arange(b + 1)
+    i = np.arange(b)
+    w = np.where(i[:, None] >= i[None, :], alpha * p[np.abs(i[:, None] - i[None, :])], 0.0)
+    y = xb @ w.T            # contribuição das velas do próprio bloco
+    prev = np.asarray(y0, dtype=np.float64)
+    for k in range(nb):
+        y[..., k, :] += p[1:] * prev[..., None]
+        prev = y[..., k, -1]
+    return y.reshape(x.shape)[..., :n]
+
+def ema(x, length, alpha=None):
+    """EMA com semente SMA dos `length` primeiros valores (a conta do
+    calc_atr); NaN antes disso. `alpha` padrão 2/(length+1)."""
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(x.shape, np.nan)
+    if x.shape[-1] < length:
+        return out
+    seed = x[..., :length].sum(axis=-1) / length
+    out[..., length - 1] = seed
+    out[..., length:] = _ema_run(x[..., length:], alpha or 2 / (length + 1), seed)
+    return out
+
+def true_range(h, l, c):
+    # TR da vela t (t >= 1) contra o fechamento anterior; tamanho n-1
+    h, l, c = (np.asarray(v, dtype=np.float64) for v in (h, l, c))
+    pc = c[..., :-1]
+    h1, l1 = h[..., 1:], l[..., 1:]
+    return np.maximum(h1 - l1, np.maximum(np.abs(h1 - pc), np.abs(l1 - pc)))
+
+def atr(h, l, c, length=14):
+    # out[t] = calc_atr(velas[:t+1], length): NaN até ter length+2 velas
+    tr = true_range(h, l, c)
+    out = np.full(np.shape(c), np.nan)
+    out[..., 1:] = ema(tr, length)
+    out[..., :length + 1] = np.nan
+    return out
+
+def rsi(c, length=14):
+    # RSI de Wilder (médias com alpha 1/length, semente SMA)
+    d = np.diff(np.asarray(c, dtype=np.float64), axis=-1)
+    up = ema(np.maximum(d, 0.0), length, alpha=1 / length)
+    dn = ema(np.maximum(-d, 0.0), length, alpha=1 / length)
+    out = np.full(np.shape(c), np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = 100.0 - 100.0 / (1.0 + up / dn)
+    out[..., 1:] = np.where(dn == 0, np.where(up == 0, 50.0, 100.0), r)
+    return out
+
+def _rolling(x, length, fn):
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(x.shape, np.nan)
+    if x.shape[-1] >= length:
+        out[..., length - 1:] = fn(sliding_window_view(x, length, axis=-1), axis=-1)
+    return out
+
+def bollinger(c, length=20, k=2.0):
+    # (média, banda de cima, banda de baixo); desvio populacional
+    c = np.asarray(c, dtype=np.float64)
+    mid = _rolling(c, length, np.sum) / length
+    var = np.maximum(_rolling(c * c, length, np.sum) / length - mid * mid, 0.0)
+    sd = np.sqrt(var)
+    return mid, mid + k * sd, mid - k * sd
+
+def donchian(h, l, length=20):
+    return _rolling(h, length, np.max), _rolling(l, length, np.min)
+
+def compute(a, atr_len=14, ema_len=20, rsi_len=14, bands_len=20, bands_k=2.0):
+    """Todos os indicadores de uma vez sobre colunas {h,l,c}. Com colunas 2D
+    (um símbolo por linha, mesma janela) avalia centenas de símbolos numa
+    chamada, sem laço Python por símbolo."""
+    h, l, c = (np.asarray(a[k], dtype=np.float64) for k in ("h", "l", "c"))
+    mid, upper, lower = bollinger(c, bands_len, bands_k)
+    dc_high, dc_low = donchian(h, l, bands_len)
+    return {"atr": atr(h, l, c, atr_len), "ema": ema(c, ema_len), "rsi": rsi(c, rsi_len),
+            "bb_mid": mid, "bb_upper": upper, "bb_lower": lower, "dc_high": dc_high, "dc_low": dc_low}
+
+def latest(a, **params):
+    # só a última vela de cada série (fechamento de vela em lote)
+    return {k: v[..., -1] for k, v in compute(a, **params).items()}
+
+
+# --- incremental: uma vela fechada por vez, mesma conta do vetorizado ---
+class StreamingEMA:
+    def __init__(self, length, alpha=None):
+        self.length = length
+        self.alpha = alpha or 2 / (length + 1)
+        self.n = 0
+        self.total = 0.0
+        self.value = None
+
+    def update(self, x):
+        self.n += 1
+        if self.n < self.length:
+            self.total += x
+        elif self.n == self.length:
+            self.value = (self.total + x) / self.length
+        else:
+            self.value = self.alpha * x + (1 - self.alpha) * self.value
+        return self.value
+
+
+class StreamingRSI:
+    def __init__(self, length=14):
+        self.up = StreamingEMA(length, 1 / length)
+        self.dn = StreamingEMA(length, 1 / length)
+        self.prev = None
+        self.value = None
+
+    def update(self, c):
+        if self.prev is not None:
+            d = c - self.prev
+            up, dn = self.up.update(max(d, 0.0)), self.dn.update(max(-d, 0.0))
+            if up is not None:
+                self.value = (50.0 if up == 0 else 100.0) if dn == 0 else 100.0 - 100.0 / (1.0 + up / dn)
+        self.prev = c
+        return self.value
+
+
+class StreamingBands:
+    """Bollinger e Donchian sobre as últimas `length` velas fechadas."""
+
+    def __init__(self, length=20, k=2.0):
+        self.length = length
+        self.k = k
+        self.c = deque(maxlen=length)
+        self.h = deque(maxlen=length)
+        self.l = deque(maxlen=length)
+
+    def update(self, c):
+        self.c.append(c["c"])
+        self.h.append(c["h"])
+        self.l.append(c["l"])
+        return self.value
+
+    @property
+    def value(self):
+        if len(self.c) < self.length:
+            return None
+        mid = sum(self.c) / self.length
+        sd = math.sqrt(max(sum(x * x for x in self.c) / self.length - mid * mid, 0.0))
+        return {"bb_mid": mid, "bb_upper": mid + self.k * sd, "bb_lower": mid - self.k * sd,
+                "dc_high": max(self.h), "dc_low": min(self.l)}
+
+
+class StreamingIndicators:
+    """ATR + EMA + RSI + bandas alimentados juntos. Mesma interface do
+    StreamingATR (update/seed/last_t/value/estimate, com o ATR), para o bot
+    trocar um pelo outro quando a grade é moldada pelas bandas."""
+
+    def __init__(self, atr_len=14, ema_len=20, rsi_len=14, bands_len=20, bands_k=2.0):
+        self.atr = StreamingATR(atr_len)
+        self.ema = StreamingEMA(ema_len)
+        self.rsi = StreamingRSI(rsi_len)
+        self.bands = StreamingBands(bands_len, bands_k)
+
+    @property
+    def last_t(self):
+        return self.atr.last_t
+
+    @property
+    def value(self):
+        return self.atr.value
+
+    def update(self, c):
+        self.ema.update(c["c"])
+        self.rsi.update(c["c"])
+        self.bands.update(c)
+        return self.atr.update(c)
+
+    def seed(self, ohlc):
+        for c in ohlc:
+            self.update(c)
+        return self.value
+
+    def estimate(self, c):
+        return self.atr.estimate(c)
+
+    def values(self):
+        out = {"atr": self.atr.value, "ema": self.ema.value, "rsi": self.rsi.value}
+        out.update(self.bands.value or {})
+        return out
+
+
+def shape_grid(price, step, up, down, bands, min_step=STEP_MIN, max_step=STEP_MAX):
+    """Grade assimétrica pelas bandas de volatilidade.
+
+    O espaço até a borda de cima (maior entre Bollinger e Donchian) e até a de
+    baixo divide os níveis (up+down total, 25%–75% por lado); o step de cada
+    lado cobre sua faixa, limitado a metade/dobro do step base e ao clamp do
+    ATR. Devolve (step_up, step_down, levels_up, levels_down); sem bandas,
+    a grade simétrica de sempre.
+    """
+    if not bands or price <= 0 or bands.get("bb_upper") is None:
+        return step, step, up, down
+    room_up = max(max(bands["bb_upper"], bands["dc_high"]) / price - 1.0, 0.0) * 100.0
+    room_dn = max(1.0 - min(bands["bb_lower"], bands["dc_low"]) / price, 0.0) * 100.0
+    total = up + down
+    if room_up + room_dn <= 0 or total < 2:
+        return step, step, up, down
+    frac = min(0.75, max(0.25, room_up / (room_up + room_dn)))
+    n_up = min(total - 1, max(1, round(total * frac)))
+    n_dn = total - n_up
+
+    def side(room, n):
+        s = min(max(room / n, step / 2), step * 2) if room > 0 else step
+        return max(min_step, min(s, max_step))
+    return side(room_up, n_up), side(room_dn, n_dn), n_up, n_dn
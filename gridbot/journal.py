@@ -0,0 +1,311 @@
+import os, json, glob, math, struct, time
+from collections import deque
+from django.conf import settings
+from .bot_runner import GridBotThread
+from .metrics import NULL
+from .models import BotConfig
+from .triggers import Trigger
+
+MAGIC = b"GBJ1"
+TICK, START, CONFIG, KLINES, ATR, POSITION, TRIGGERS, SIGNAL = range(1, 9)
+NAMES = {TICK: "tick", START: "start", CONFIG: "config", KLINES: "klines", ATR: "atr", POSITION: "position",
+         TRIGGERS: "triggers", SIGNAL: "signal"}
+
+_HEAD = struct.Struct("<Bd")        # tipo, ts (s, o relógio do bot)
+_F64 = struct.Struct("<d")
+_F64x2 = struct.Struct("<dd")
+_F64x3 = struct.Struct("<ddd")
+_LEN = struct.Struct("<I")
+_KLINES = struct.Struct("<HI")      # limite pedido, linhas (ERR = a busca falhou)
+_ROW = struct.Struct("<q5d")        # t, o, h, l, c, v
+_SIGNAL = struct.Struct("<ddBI")    # preço, pnl, len(kind), len(msg)
+ERR = 0xFFFFFFFF
+NAN = float("nan")
+
+
+def _f(v):
+    return NAN if v is None else float(v)
+
+def _none(v):
+    return None if math.isnan(v) else v
+
+def config_dict(cfg):
+    return {f.attname: getattr(cfg, f.attname) for f in cfg._meta.concrete_fields if f.name != "created_at"}
+
+def _trigger_rows(triggers):
+    return [[t.id, t.kind, t.direction, t.price, t.qty, t.note] for t in triggers]
+
+
+class Journal:
+    """Diário binário append-only de um símbolo: cada preço recebido, cada
+    busca de velas do ATR e cada sinal, com o relógio do bot.
+
+    Um arquivo por dia UTC (`<root>/<SYMBOL>/<AAAA-MM-DD>.gbj`), registros de
+    tamanho fixo para ticks (17 bytes) e com comprimento para o resto. O
+    arquivo fica bufferizado e vai para o disco a cada sinal ou `flush_every`
+    segundos; um final truncado (queda) é ignorado na leitura. START, CONFIG,
+    POSITION e TRIGGERS guardam o que o bot leu de fora, o bastante para
+    `replay` refazer os mesmos sinais sem banco nem rede.
+    """
+
+    def __init__(self, root, symbol, flush_every=1.0):
+        self.root = str(root)
+        self.symbol = symbol.upper()
+        self.flush_every = flush_every
+        self.f = None
+        self.day = None
+        self.path = None
+        self.records = self.bytes = 0
+        self._flushed = 0.0
+
+    def _open(self, ts):
+        day = int(ts // 86400)
+        if day == self.day:
+            return
+        self.close()
+        d = os.path.join(self.root, self.symbol)
+        os.makedirs(d, exist_ok=True)
+        self.path = os.path.join(d, time.strftime("%Y-%m-%d.gbj", time.gmtime(ts)))
+        self.f = open(self.path, "ab")
+        if self.f.tell() == 0:
+            self.f.write(MAGIC)
+        self.day = day
+
+    def _write(self, kind, ts, payload=b"", flush=False):
+        self._open(ts)
+        rec = _HEAD.pack(kind, ts) + payload
+        self.f.write(rec)
+        self.records += 1
+        self.bytes += len(rec)
+        if flush or ts - self._flushed >= self.flush_every:
+            self.f.flush()
+            self._flushed = ts
+
+    def _json(self, kind, ts, obj):
+        data = json.dumps(obj, separators=(",", ":"), default=str).encode()
+        self._write(kind, ts, _LEN.pack(len(data)) + data, flush=True)
+
+    def tick(self, ts, price):
+        self._write(TICK, ts, _F64.pack(price))
+
+    def start(self, ts, price, cfg, state, triggers):
+        self._json(START, ts, {"price": price, "config": config_dict(cfg), "state": state,
+                               "triggers": _trigger_rows(triggers)})
+
+    def config(self, ts, cfg):
+        self._json(CONFIG, ts, config_dict(cfg))
+
+    def klines(self, ts, limit, rows):
+        if rows is None:
+            self._write(KLINES, ts, _KLINES.pack(limit, ERR))
+            return
+        self._write(KLINES, ts, _KLINES.pack(limit, len(rows)) + b"".join(
+            _ROW.pack(int(r["t"]), r["o"], r["h"], r["l"], r["c"], r.get("v", 0.0)) for r in rows))
+
+    def atr(self, ts, atr, step, stop):
+        self._write(ATR, ts, _F64x3.pack(_f(atr), _f(step), _f(stop)))
+
+    def position(self, ts, qty, avg):
+        self._write(POSITION, ts, _F64x2.pack(qty, avg))
+
+    def triggers(self, ts, triggers):
+        self._json(TRIGGERS, ts, _trigger_rows(triggers))
+
+    def signal(self, ts, kind, msg, price, pnl_pct):
+        k, m = kind.encode(), (msg or "").encode()
+        self._write(SIGNAL, ts, _SIGNAL.pack(_f(price), _f(pnl_pct), len(k), len(m)) + k + m, flush=True)
+
+    def flush(self):
+        if self.f is not None:
+            self.f.flush()
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+            self.day = None
+
+    def metrics(self):
+        return {"records": self.records, "bytes": self.bytes}
+
+
+# --- leitura ---
+def read(path):
+    """(tipo, ts, dados) de cada registro completo do arquivo."""
+    with open(path, "rb") as f:
+        buf = f.read()
+    if buf[:4] != MAGIC:
+        raise ValueError(f"{path}: não é um diário")
+    off, n = 4, len(buf)
+    while off + _HEAD.size <= n:
+        kind, ts = _HEAD.unpack_from(buf, off)
+        p = off + _HEAD.size
+        try:
+            if kind == TICK:
+                data, = _F64.unpack_from(buf, p)
+                p += 8
+            elif kind in (START, CONFIG, TRIGGERS):
+                size, = _LEN.unpack_from(buf, p)
+                if p + 4 + size > n:
+                    return
+                data = json.loads(buf[p + 4:p + 4 + size])
+                p += 4 + size
+            elif kind == KLINES:
+                limit, rows = _KLINES.unpack_from(buf, p)
+                p += _KLINES.size
+                data = None
+                if rows != ERR:
+                    if p + rows * _ROW.size > n:
+                        return
+                    data = [dict(zip(("t", "o", "h", "l", "c", "v"), r)) for r in _ROW.iter_unpack(
+                        buf[p:p + rows * _ROW.size])]
+                    p += rows * _ROW.size
+                data = (limit, data)
+            elif kind == ATR:
+                data = tuple(_none(v) for v in _F64x3.unpack_from(buf, p))
+                p += _F64x3.size
+            elif kind == POSITION:
+                data = _F64x2.unpack_from(buf, p)
+                p += _F64x2.size
+            elif kind == SIGNAL:
+                price, pnl, kl, ml = _SIGNAL.unpack_from(buf, p)
+                p += _SIGNAL.size
+                if p + kl + ml > n:
+                    return
+                data = {"kind": buf[p:p + kl].decode(), "message": buf[p + kl:p + kl + ml].decode(),
+                        "price": _none(price), "pnl_pct": _none(pnl)}
+                p += kl + ml
+            else:
+                raise ValueError(f"{path}: registro desconhecido {kind} em {off}")
+        except struct.error:
+            return      # registro cortado no fim (queda no meio da gravação)
+        yield kind, ts, data
+        off = p
+
+
+def files(root, symbol, start=None, end=None):
+    # arquivos do símbolo em ordem de dia; start/end no formato AAAA-MM-DD (inclusivos)
+    out = []
+    for p in sorted(glob.glob(os.path.join(str(root), symbol.upper(), "*.gbj"))):
+        day = os.path.basename(p)[:-4]
+        if (start is None or day >= start) and (end is None or day <= end):
+            out.append(p)
+    return out
+
+
+def records(paths):
+    for p in paths:
+        yield from read(p)
+
+
+# --- replay ---
+class ReplayBot(GridBotThread):
+    """GridBotThread alimentado pelo diário: relógio, velas do ATR, config,
+    posição e gatilhos saem dos registros; sem banco, rede nem Telegram."""
+
+    def __init__(self, start):
+        super().__init__(BotConfig(**start["config"]), None)
+        self.session = start
+        self.now = 0.0
+        self.clock = lambda: self.now
+        self.metrics = NULL
+        self.signals = []
+        self.pending_klines = deque()
+        self.next_triggers = start["triggers"]
+
+    def maybe_alert(self, key, msg, cooldown=120, digest=False): pass
+    def _update_state(self, **fields): pass
+    def _load_json(self): return dict(self.session["state"])
+    def _save_json(self): pass
+    def _update_trigger(self, tid, **fields): pass
+
+    def _load_triggers(self):
+        return [Trigger(*row) for row in self.next_triggers]
+
+    def _fetch_klines(self, limit):
+        if not self.pending_klines:
+            raise ReplayError(f"{self.now}: o bot buscou velas que o diário não tem")
+        _, rows = self.pending_klines.popleft()
+        if rows is None:
+            raise RuntimeError("busca de velas falhou (gravado)")
+        return rows
+
+    def _post_signal(self, kind, msg, price=None, pnl_pct=None, now=None):
+        self.signals.append({"t": self.now, "kind": kind, "message": msg, "price": price, "pnl_pct": pnl_pct})
+
+
+class ReplayError(RuntimeError):
+    pass
+
+
+def _steps(recs):
+    # START/TICK + o que o bot gravou durante ele (config, posição, velas, sinais...)
+    head, rest = None, []
+    for rec in recs:
+        if rec[0] in (START, TICK):
+            if head is not None:
+                yield head, rest
+            head, rest = rec, []
+        elif head is not None:
+            rest.append(rec)
+    if head is not None:
+        yield head, rest
+
+
+def replay(recs):
+    """Refaz cada sessão do diário (de um START em diante) no GridBotThread
+    real, com o relógio gravado. Devolve {"ticks", "sessions", "errors",
+    "recorded", "replayed"}: sinais gravados e refeitos, no mesmo formato."""
+    out = {"ticks": 0, "sessions": 0, "errors": 0, "recorded": [], "replayed": []}
+    bot = None
+    for (kind, ts, data), rest in _steps(recs):
+        if kind == START:
+            if bot is not None:
+                out["replayed"] += bot.signals
+            bot = ReplayBot(data)
+            out["sessions"] += 1
+        elif bot is None:
+            continue        # ticks antes do primeiro START: sem o estado inicial, não dá para refazer
+        for k, t, d in rest:
+            if k == CONFIG:
+                bot._pending_cfg = BotConfig(**d)
+            elif k == POSITION:
+                bot._pending_pos = tuple(d)
+            elif k == TRIGGERS:
+                bot._triggers_dirty, bot.next_triggers = True, d
+            elif k == KLINES:
+                bot.pending_klines.append(d)
+            elif k == SIGNAL:
+                out["recorded"].append({"t": t, **d})
+        bot.now = ts
+        try:
+            if kind == START:
+                bot.start_bot(data["price"])
+            else:
+                out["ticks"] += 1
+                bot.on_tick(data)
+        except ReplayError:
+            raise
+        except Exception:
+            out["errors"] += 1  # o loop ao vivo também segue depois de um erro no tick
+        if bot.pending_klines:
+            raise ReplayError(f"{ts}: velas gravadas que o bot não buscou")
+    if bot is not None:
+        out["replayed"] += bot.signals
+    return out
+
+
+def diff(recorded, replayed):
+    """Primeira divergência entre sinais gravados e refeitos: (i, gravado, refeito) ou None."""
+    for i in range(max(len(recorded), len(replayed))):
+        a = recorded[i] if i < len(recorded) else None
+        b = replayed[i] if i < len(replayed) else None
+        if a != b:
+            return i, a, b
+    return None
+
+
+def default_journal(symbol):
+    """Diário do símbolo em JOURNAL_DIR, ou None se desligado (JOURNAL_DIR vazio)."""
+    root = getattr(settings, "JOURNAL_DIR", "")
+    return Journal(root, symbol) if root else None
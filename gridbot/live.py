@@ -0,0 +1,157 @@
+import asyncio, json, time
+from collections import deque
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .bot_runner import now_iso
+from .models import BotSignal, panel_symbol, state_for
+
+STATE_FIELDS = ("running", "ref_price", "trailing_high", "last_level_idx", "last_kind", "last_message",
+                "last_price", "last_pnl_pct", "atr", "eff_grid_step", "atr_trailing_stop")
+KEEPALIVE = 15.0
+
+def state_payload(st):
+    return {f: getattr(st, f) for f in STATE_FIELDS}
+
+def signal_payload(s):
+    return {"id": s.id, "t": s.created_at.strftime("%H:%M:%S"), "kind": s.kind,
+            "message": s.message, "price": s.price, "pnl_pct": s.pnl_pct}
+
+def sse(event, data, id=None):
+    head = f"id: {id}\n" if id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+# --- leituras (rodam fora do event loop via sync_to_async) ---
+def db_state():
+    return state_payload(state_for(panel_symbol()))
+
+def db_signals(after_id=None, limit=20):
+    # sem cursor: os `limit` mais recentes; com cursor: tudo depois dele, em ordem
+    if after_id is None:
+        return [signal_payload(s) for s in reversed(BotSignal.objects.order_by("-id")[:limit])]
+    return [signal_payload(s) for s in BotSignal.objects.filter(id__gt=after_id).order_by("id")[:200]]
+
+def store_candles(symbol, interval):
+    from .candle_store import store_klines
+    return [{"t": k["t"], "close": k["c"]} for k in store_klines(symbol, interval, 2)]
+
+
+class LiveHub:
+    """Um poller por processo web, repassado a todos os clientes conectados.
+
+    Cada cliente é uma asyncio.Queue de mensagens SSE já formatadas. O poller
+    só roda enquanto houver cliente: lê o BotState e os BotSignal novos a cada
+    `poll` segundos (a vela a cada `candle_every`) e publica apenas o que
+    mudou. Cliente lento que enche a fila é desconectado e, ao reconectar com
+    Last-Event-ID, recebe o snapshot e os sinais que perdeu.
+    """
+
+    def __init__(self, poll=1.0, candle_every=5.0, symbol="POLUSDT", interval="1m", queue_size=64,
+                 fetch_state=db_state, fetch_signals=db_signals, fetch_candles=store_candles):
+        self.poll = poll
+        self.candle_every = candle_every
+        self.symbol = symbol
+        self.interval = interval
+        self.queue_size = queue_size
+        self.fetch_state = fetch_state
+        self.fetch_signals = fetch_signals
+        self.fetch_candles = fetch_candles
+        self.clients = set()
+        self.state = None
+        self.signals = deque(maxlen=20)
+        self.last_id = None
+        self.candles = {}        # t -> close das últimas velas enviadas
+        self.loop = None
+        self._task = None
+        self.polls = self.published = self.dropped = 0
+
+    # --- clientes ---
+    def subscribe(self, last_id=None):
+        self.loop = asyncio.get_running_loop()
+        q = asyncio.Queue(self.queue_size)
+        # snapshot do cache: conectar não custa consulta ao banco
+        if self.state is not None:
+            q.put_nowait(sse("state", self.state))
+        for s in self.signals:
+            if last_id is None or s["id"] > last_id:
+                q.put_nowait(sse("signal", s, id=s["id"]))
+        for t, close in sorted(self.candles.items()):
+            q.put_nowait(sse("candle", {"t": t, "close": close}))
+        self.clients.add(q)
+        if self._task is None or self._task.done():
+            self._task = self.loop.create_task(self._run())
+        return q
+
+    def unsubscribe(self, q):
+        self.clients.discard(q)
+        if not self.clients and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def publish(self, msg):
+        self.published += 1
+        for q in list(self.clients):
+            try:
+                q.put_nowait(msg)
+            except asyncio.QueueFull:
+                # descarta o atrasado e fecha o stream dele (None); o navegador reconecta
+                self.clients.discard(q)
+                self.dropped += 1
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait(None)
+
+    # --- poller ---
+    async def poll_once(self, candles=True):
+        self.polls += 1
+        st = await sync_to_async(self.fetch_state)()
+        changed = {k: v for k, v in st.items() if self.state is None or self.state.get(k) != v}
+        self.state = st
+        if changed:
+            self.publish(sse("state", changed))
+
+        for s in await sync_to_async(self.fetch_signals)(self.last_id):
+            self.signals.append(s)
+            self.last_id = max(self.last_id or 0, s["id"])
+            self.publish(sse("signal", s, id=s["id"]))
+        if self.last_id is None:
+            self.last_id = 0
+
+        if candles:
+            rows = await sync_to_async(self.fetch_candles, thread_sensitive=False)(self.symbol, self.interval)
+            for r in rows:
+                if self.candles.get(r["t"]) != r["close"]:
+                    self.candles[r["t"]] = r["close"]
+                    self.publish(sse("candle", r))
+            for t in sorted(self.candles)[:-2]:
+                del self.candles[t]
+
+    async def _run(self):
+        next_candle = 0.0
+        while self.clients:
+            now = time.monotonic()
+            due = now >= next_candle
+            try:
+                await self.poll_once(candles=due)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[{now_iso()}] Live poller falhou: {e}")
+            if due:
+                next_candle = now + self.candle_every
+            await asyncio.sleep(self.poll)
+
+    def metrics(self):
+        return {"clients": len(self.clients), "polls": self.polls,
+                "published": self.published, "dropped": self.dropped}
+
+
+_hub = None
+
+def default_hub():
+    # um hub por processo (e por event loop: o ASGI server tem um só)
+    global _hub
+    loop = asyncio.get_running_loop()
+    if _hub is None or (_hub.loop is not None and _hub.loop is not loop):
+        _hub = LiveHub(poll=getattr(settings, "LIVE_POLL_SEC", 1.0))
+    return _hub
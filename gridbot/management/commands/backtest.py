@@ -0,0 +1,38 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from gridbot.models import BotConfig
+from gridbot.backtest import load_candles, store_candles, timed_backtest, summarize
+
+
+def load_source(opts):
+    if opts.get("store"):
+        symbol, _, interval = opts["store"].partition(":")
+        return store_candles(symbol.upper(), interval or "1m")
+    if not opts.get("file"):
+        raise CommandError("informe um arquivo ou --store SYMBOL:INTERVAL")
+    return load_candles(opts["file"])
+
+
+class Command(BaseCommand):
+    help = "Roda um BotConfig sobre velas gravadas (csv/json/npz) com a mesma lógica de grade/stop do bot."
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", nargs="?", help="velas t,o,h,l,c (.csv, .json ou .npz)")
+        parser.add_argument("--store", metavar="SYMBOL:INTERVAL", help="lê as velas do store local")
+        parser.add_argument("--config", type=int, help="id do BotConfig (padrão: o mais recente)")
+        parser.add_argument("--start", type=int, default=0, help="índice da vela onde o bot liga")
+        parser.add_argument("--signals", action="store_true", help="imprime cada sinal (jsonl)")
+
+    def handle(self, *args, **opts):
+        cfg = BotConfig.objects.filter(pk=opts["config"]).first() if opts["config"] \
+            else BotConfig.objects.order_by("-id").first()
+        if cfg is None:
+            raise CommandError("BotConfig não encontrado")
+        candles = load_source(opts)
+        if len(candles["c"]) <= opts["start"]:
+            raise CommandError("velas insuficientes")
+        signals, elapsed = timed_backtest(cfg, candles, opts["start"])
+        if opts["signals"]:
+            for s in signals:
+                self.stdout.write(json.dumps(s, ensure_ascii=False))
+        self.stdout.write(json.dumps(summarize(signals, elapsed, len(candles["c"]) - opts["start"])))
@@ -0,0 +1,67 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from gridbot import bench
+
+
+def _ints(spec):
+    return [int(x) for x in spec.split(",") if x.strip()]
+
+
+class Command(BaseCommand):
+    help = ("Benchmark dos caminhos quentes (ATR, grade, estado, checkpoint, loop completo) sobre séries "
+            "sintéticas. Grava uma linha por execução com o commit e compara com o commit anterior.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ticks", default="1000,100000",
+                            help=f"tamanhos das séries (até 10000000; calc_atr e streaming_* param em "
+                                 f"{bench.ROWS_MAX} velas, uma lista de dicts em memória)")
+        parser.add_argument("--levels", default="10,100,1000", help="níveis por lado da grade")
+        parser.add_argument("--e2e-ticks", default="5000", help="ticks do loop completo (usa banco)")
+        parser.add_argument("--case", action="append", help="só estes casos (repetível)")
+        parser.add_argument("--repeat", type=int, default=3, help="melhor de N execuções")
+        parser.add_argument("--no-db", action="store_true", help="pula casos que gravam no banco")
+        parser.add_argument("--out", help="arquivo de resultados (padrão: BENCH_DIR/results.jsonl)")
+        parser.add_argument("--threshold", type=float, default=1.25, help="razão que conta como regressão")
+        parser.add_argument("--fail-on-regression", action="store_true")
+
+    def handle(self, *args, **opts):
+        names = {c[0] for c in bench.CASES}
+        if opts["case"] and not set(opts["case"]) <= names:
+            raise CommandError(f"casos: {', '.join(sorted(names))}")
+        sizes = {"ticks": _ints(opts["ticks"]), "levels": _ints(opts["levels"]),
+                 "e2e_ticks": _ints(opts["e2e_ticks"])}
+        out = opts["out"] or os.path.join(getattr(settings, "BENCH_DIR", settings.BASE_DIR / "benchmarks"),
+                                          "results.jsonl")
+        commit, dirty = bench.git_commit(settings.BASE_DIR)
+
+        log = lambda r: self.stdout.write(f"{r['case']:<16} {r['params']!s:<40} {r['ns_per_op']:>12.1f} ns/op "
+                                          f"({r['best_s']:.4f}s)")
+        db = not opts["no_db"]
+        old_name = None
+        if db:
+            # banco descartável: nada de BotState de benchmark no banco real
+            old_name = connection.settings_dict["NAME"]
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = bench.run_cases(sizes, repeat=opts["repeat"], only=opts["case"], db=db, log=log)
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        # linha de base: a última execução de outro estado do código (commit ou mudanças locais)
+        previous = [h for h in bench.history(out) if (h.get("commit"), h.get("dirty")) != (commit, dirty)]
+        bench.record(results, out, commit, dirty)
+        self.stdout.write(f"gravado em {out} (commit {commit or '?'}{' +mudanças' if dirty else ''})")
+        if not previous:
+            return
+        base = previous[-1]
+        regressions = 0
+        self.stdout.write(f"comparado com {base.get('commit') or '?'}:")
+        for name, params, before, now, ratio, bad in bench.compare(results, base, opts["threshold"]):
+            regressions += bad
+            flag = "  REGRESSÃO" if bad else ""
+            self.stdout.write(f"  {name:<16} {params!s:<40} {before:>10.1f} -> {now:>10.1f} ns/op x{ratio:.2f}{flag}")
+        if regressions and opts["fail_on_regression"]:
+            raise CommandError(f"{regressions} regressão(ões) acima de x{opts['threshold']}")
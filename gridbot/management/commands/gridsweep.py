@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from gridbot.models import BotConfig
+from gridbot.candle_store import default_store
+from gridbot.management.commands.backtest import load_source
+from gridbot.sweep import SWEEP_FIELDS, parse_range, sweep
+
+INT_FIELDS = {"levels_up", "levels_down"}
+
+
+class Command(BaseCommand):
+    help = ("Varre faixas de parâmetros do BotConfig em backtests paralelos e ranqueia. "
+            "Faixas: início:fim:passo ou lista separada por vírgula.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", nargs="?", help="velas t,o,h,l,c (.csv, .json ou .npz)")
+        parser.add_argument("--store", metavar="SYMBOL:INTERVAL", help="lê as velas do store local")
+        parser.add_argument("--config", type=int, help="BotConfig base (padrão: o mais recente)")
+        for f in SWEEP_FIELDS:
+            parser.add_argument(f"--{f.replace('_', '-')}", dest=f)
+        parser.add_argument("--workers", type=int)
+        parser.add_argument("--start", type=int, default=0)
+        parser.add_argument("--top", type=int, default=10)
+        parser.add_argument("--save", action="store_true", help="grava o vencedor como novo BotConfig")
+
+    def handle(self, *args, **opts):
+        base = BotConfig.objects.filter(pk=opts["config"]).first() if opts["config"] \
+            else BotConfig.objects.order_by("-id").first()
+        if base is None:
+            raise CommandError("BotConfig não encontrado")
+        try:
+            ranges = {f: parse_range(opts[f], int if f in INT_FIELDS else float) for f in SWEEP_FIELDS if opts[f]}
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not ranges:
+            raise CommandError("informe ao menos uma faixa (ex.: --grid-step 0.3:1.2:0.1)")
+        candles = load_source(opts)
+        store_src = None
+        if opts["store"]:
+            symbol, _, interval = opts["store"].partition(":")
+            store_src = (default_store().root, symbol.upper(), interval or "1m")
+
+        results, rate = sweep(base, candles, ranges, workers=opts["workers"], start=opts["start"],
+                              store_src=store_src)
+        self.stdout.write(f"{len(results)} configs | {rate:.1f} configs/s")
+        for fields, res in results[:opts["top"]]:
+            params = " ".join(f"{k}={fields[k]}" for k in ranges)
+            self.stdout.write(f"{res['ret_pct']:+8.2f}% (hold {res['hold_pct']:+.2f}%) "
+                              f"trades={res['trades']} stops={res['stops']} | {params}")
+
+        if opts["save"] and results:
+            best = results[0][0]
+            cfg = BotConfig.objects.create(**best)
+            self.stdout.write(self.style.SUCCESS(f"Vencedor salvo como {cfg}"))
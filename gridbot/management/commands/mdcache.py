@@ -0,0 +1,36 @@
+import signal, threading
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from gridbot.mdcache import CacheServer, LocalCache, running
+
+
+class Command(BaseCommand):
+    help = ("Sobe o cache de mercado compartilhado (velas, sync do store) no socket unix, para os "
+            "workers web e o runner dividirem as buscas na corretora. O runbot já sobe um se não houver.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socket", help="socket unix (padrão: MARKET_CACHE_SOCKET)")
+        parser.add_argument("--size", type=int, default=None, help="entradas antes do LRU (padrão: MARKET_CACHE_SIZE)")
+
+    def handle(self, *args, **opts):
+        path = opts["socket"] or getattr(settings, "MARKET_CACHE_SOCKET", "")
+        if not path:
+            raise CommandError("MARKET_CACHE_SOCKET vazio: informe --socket")
+        size = opts["size"] or getattr(settings, "MARKET_CACHE_SIZE", 1024)
+        if running(path):
+            raise CommandError(f"já tem um cache no ar em {path}")
+        server = CacheServer(path, LocalCache(size))
+        server.bind()
+        done = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *a: done.set())
+        signal.signal(signal.SIGINT, lambda *a: done.set())
+        server.start()
+        self.stdout.write(f"[mdcache] {path} | {size} entradas")
+        try:
+            while not done.wait(60):
+                m = server.cache.metrics()
+                self.stdout.write(f"[mdcache] {m['size']} entradas | {m['hits']} hits | {m['misses']} buscas | "
+                                  f"{m['waits']} esperas | {m['evictions']} descartes | {server.clients} clientes")
+        finally:
+            server.stop()
+            self.stdout.write("[mdcache] parado")
@@ -0,0 +1,59 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from gridbot.models import BotSignal, SignalRollup
+
+
+def _merge(f, a, b):
+    vals = [x for x in (a, b) if x is not None]
+    return f(vals) if vals else None
+
+def rollup_and_prune(keep_days, batch=5000, rollup=True, now=None):
+    """Resume por dia/símbolo/tipo e apaga os BotSignal mais velhos que
+    `keep_days`, em lotes por id (transações curtas com o runner gravando).
+    Devolve (linhas resumidas, linhas apagadas)."""
+    cutoff = (now or timezone.now()) - timedelta(days=keep_days)
+    # created_at cresce com o id: o corte vira um intervalo de ids
+    edge = BotSignal.objects.filter(created_at__lt=cutoff).aggregate(m=Max("id"))["m"]
+    if edge is None:
+        return 0, 0
+    rolled = 0
+    if rollup:
+        # ids até o último já resumido não entram de novo (execução interrompida antes de apagar)
+        done = SignalRollup.objects.aggregate(m=Max("last_id"))["m"] or 0
+        groups = (BotSignal.objects.filter(id__gt=done, id__lte=edge)
+                  .annotate(day=TruncDate("created_at")).values("day", "symbol", "kind")
+                  .annotate(n=Count("id"), lo=Min("price"), hi=Max("price"), a=Min("id"), b=Max("id")))
+        with transaction.atomic():
+            for g in groups:
+                r, _ = SignalRollup.objects.get_or_create(day=g["day"], symbol=g["symbol"], kind=g["kind"])
+                r.count += g["n"]
+                r.min_price = _merge(min, r.min_price, g["lo"])
+                r.max_price = _merge(max, r.max_price, g["hi"])
+                r.first_id = _merge(min, r.first_id, g["a"])
+                r.last_id = _merge(max, r.last_id, g["b"])
+                r.save()
+                rolled += g["n"]
+    deleted = 0
+    start = BotSignal.objects.aggregate(m=Min("id"))["m"] or 0
+    while start <= edge:
+        stop = min(edge, start + batch - 1)
+        deleted += BotSignal.objects.filter(id__gte=start, id__lte=stop).delete()[0]
+        start = stop + 1
+    return rolled, deleted
+
+
+class Command(BaseCommand):
+    help = "Retenção de BotSignal: resume em SignalRollup (por dia) e apaga os mais antigos que --keep-days."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep-days", type=int, default=30)
+        parser.add_argument("--batch", type=int, default=5000, help="ids apagados por transação")
+        parser.add_argument("--no-rollup", action="store_true", help="apaga sem resumir")
+
+    def handle(self, *args, **opts):
+        rolled, deleted = rollup_and_prune(opts["keep_days"], batch=opts["batch"], rollup=not opts["no_rollup"])
+        self.stdout.write(f"{rolled} sinais resumidos, {deleted} apagados (mantidos {opts['keep_days']} dias)")
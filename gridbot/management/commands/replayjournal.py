@@ -0,0 +1,53 @@
+import json, time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from gridbot import journal
+
+
+class Command(BaseCommand):
+    help = ("Refaz, no GridBotThread real e com o relógio gravado, os sinais do diário de um símbolo e "
+            "compara com os que o runner emitiu.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbol", nargs="?", help="símbolo (lê JOURNAL_DIR/SYMBOL/*.gbj)")
+        parser.add_argument("--file", action="append", help="arquivo(s) .gbj em vez do símbolo (repetível)")
+        parser.add_argument("--from", dest="start", metavar="AAAA-MM-DD", help="primeiro dia")
+        parser.add_argument("--to", dest="end", metavar="AAAA-MM-DD", help="último dia")
+        parser.add_argument("--dir", help="raiz dos diários (padrão: JOURNAL_DIR)")
+        parser.add_argument("--signals", action="store_true", help="imprime cada sinal refeito (jsonl)")
+        parser.add_argument("--dump", action="store_true", help="só lista os registros (jsonl), sem replay")
+
+    def handle(self, *args, **opts):
+        paths = opts["file"] or []
+        if not paths:
+            if not opts["symbol"]:
+                raise CommandError("informe o símbolo ou --file")
+            root = opts["dir"] or getattr(settings, "JOURNAL_DIR", "")
+            paths = journal.files(root, opts["symbol"], opts["start"], opts["end"])
+        if not paths:
+            raise CommandError("nenhum diário encontrado")
+
+        if opts["dump"]:
+            for kind, ts, data in journal.records(paths):
+                self.stdout.write(json.dumps({"type": journal.NAMES[kind], "ts": ts, "data": data},
+                                             ensure_ascii=False))
+            return
+
+        t0 = time.perf_counter()
+        try:
+            out = journal.replay(journal.records(paths))
+        except journal.ReplayError as e:
+            raise CommandError(f"diário inconsistente: {e}")
+        elapsed = time.perf_counter() - t0
+        if opts["signals"]:
+            for s in out["replayed"]:
+                self.stdout.write(json.dumps(s, ensure_ascii=False))
+        self.stdout.write(json.dumps({"files": len(paths), "sessions": out["sessions"], "ticks": out["ticks"],
+                                      "errors": out["errors"], "recorded": len(out["recorded"]),
+                                      "replayed": len(out["replayed"]), "elapsed_s": round(elapsed, 3),
+                                      "ticks_per_s": int(out["ticks"] / max(elapsed, 1e-9))}))
+        d = journal.diff(out["recorded"], out["replayed"])
+        if d is not None:
+            i, a, b = d
+            raise CommandError(f"sinal #{i} diverge:\n  gravado: {a}\n  refeito: {b}")
+        self.stdout.write("sinais idênticos")
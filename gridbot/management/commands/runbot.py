@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from gridbot import mdcache
+from gridbot.bot_runner import DEFAULT_SYMBOL
+from gridbot.models import latest_configs
+from gridbot.supervisor import BACKOFF_MAX, EngineSupervisor, Supervisor
+
+
+class Command(BaseCommand):
+    help = ("Roda os bots fora do web: todos os símbolos num loop com ticker em lote (padrão) ou, com "
+            "--workers, um processo por símbolo; reinício com backoff se cair, config nova aplicada ao "
+            "vivo (aviso do painel via socket) e parada limpa em SIGTERM.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbols", nargs="*", help="padrão: todos os símbolos com BotConfig")
+        parser.add_argument("--socket", help="socket unix de notificações (padrão: RUNNER_SOCKET)")
+        parser.add_argument("--backoff-max", type=float, default=BACKOFF_MAX)
+        parser.add_argument("--workers", action="store_true",
+                            help="um processo por símbolo (isolamento; preços pelo cache de mercado)")
+
+    def handle(self, *args, **opts):
+        symbols = [s.upper() for s in opts["symbols"]] or list(latest_configs()) or [DEFAULT_SYMBOL]
+        # cache de mercado da máquina, a não ser que um `manage.py mdcache` já esteja no ar
+        server = mdcache.serve()
+        try:
+            cls = Supervisor if opts["workers"] else EngineSupervisor
+            cls(symbols, socket_path=opts["socket"], backoff_max=opts["backoff_max"]).run()
+        finally:
+            if server is not None:
+                server.stop()
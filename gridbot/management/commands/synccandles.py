@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from gridbot.candle_store import default_store
+
+
+class Command(BaseCommand):
+    help = "Sincroniza o store local de velas (só a cauda que falta desde a última gravada)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbol")
+        parser.add_argument("intervals", nargs="*", default=["1m"])
+        parser.add_argument("--backfill", type=int, default=1000, help="velas iniciais quando o store está vazio")
+
+    def handle(self, *args, **opts):
+        store = default_store()
+        symbol = opts["symbol"].upper()
+        for interval in opts["intervals"]:
+            added, _ = store.sync(symbol, interval, backfill=opts["backfill"])
+            self.stdout.write(f"{symbol} {interval}: +{added} velas (total {store.count(symbol, interval)})")
@@ -0,0 +1,230 @@
+import os, ssl, json, time, base64, socket, struct, hashlib, threading
+from urllib.parse import urlsplit
+from .bot_runner import now_iso
+
+# stream combinado da Binance; o cliente assina os streams via SUBSCRIBE
+WS_URL = "wss://stream.binance.com:9443/stream"
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONT, OP_TEXT, OP_BIN, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+# --- frames RFC 6455 (cliente mascara, servidor não) ---
+def _recv_exact(sock, n):
+    buf = b""
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("conexão fechada")
+        buf += chunk
+    return buf
+
+def write_frame(sock, opcode, payload=b"", mask=True):
+    n = len(payload)
+    mbit = 0x80 if mask else 0
+    hdr = bytes([0x80 | opcode])
+    if n < 126:
+        hdr += bytes([mbit | n])
+    elif n < 65536:
+        hdr += bytes([mbit | 126]) + struct.pack(">H", n)
+    else:
+        hdr += bytes([mbit | 127]) + struct.pack(">Q", n)
+    if mask:
+        key = os.urandom(4)
+        hdr += key
+        payload = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+    sock.sendall(hdr + payload)
+
+def read_frame(sock):
+    # devolve (opcode, payload) já juntando fragmentos
+    opcode, data = None, b""
+    while True:
+        b0, b1 = _recv_exact(sock, 2)
+        fin, op = b0 & 0x80, b0 & 0x0F
+        n = b1 & 0x7F
+        if n == 126:
+            n = struct.unpack(">H", _recv_exact(sock, 2))[0]
+        elif n == 127:
+            n = struct.unpack(">Q", _recv_exact(sock, 8))[0]
+        key = _recv_exact(sock, 4) if b1 & 0x80 else None
+        payload = _recv_exact(sock, n) if n else b""
+        if key:
+            payload = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+        if op >= OP_CLOSE:  # frames de controle podem vir no meio de uma mensagem
+            return op, payload
+        if op != OP_CONT:
+            opcode = op
+        data += payload
+        if fin:
+            return opcode, data
+
+def ws_accept_key(key):
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+
+def ws_connect(url, timeout=10):
+    u = urlsplit(url)
+    secure = u.scheme == "wss"
+    port = u.port or (443 if secure else 80)
+    sock = socket.create_connection((u.hostname, port), timeout=timeout)
+    if secure:
+        sock = ssl.create_default_context().wrap_socket(sock, server_hostname=u.hostname)
+    key = base64.b64encode(os.urandom(16)).decode()
+    path = (u.path or "/") + (f"?{u.query}" if u.query else "")
+    sock.sendall((f"GET {path} HTTP/1.1\r\n"
+                  f"Host: {u.hostname}:{port}\r\n"
+                  "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+    head = b""
+    while b"\r\n\r\n" not in head:
+        chunk = sock.recv(1024)
+        if not chunk:
+            raise ConnectionError("handshake interrompido")
+        head += chunk
+    status, *lines = head.split(b"\r\n\r\n", 1)[0].decode("latin-1").split("\r\n")
+    headers = {k.strip().lower(): v.strip() for k, _, v in (l.partition(":") for l in lines)}
+    if " 101 " not in status + " " or headers.get("sec-websocket-accept") != ws_accept_key(key):
+        sock.close()
+        raise ConnectionError(f"handshake recusado: {status}")
+    return sock
+
+
+class MarketStream(threading.Thread):
+    """Cliente de stream estilo Binance (`<symbol>@trade` / `<symbol>@kline_<i>`).
+
+    Reconecta com backoff e reassina todos os streams a cada conexão. O último
+    preço de cada símbolo fica em `last`; quem consome usa `wait_price()` ou
+    registra callbacks `on_tick(symbol, price, ts_ms)` / `on_kline(symbol, interval, k)`.
+    """
+
+    def __init__(self, symbols=(), kinds=("trade",), url=WS_URL, on_tick=None, on_kline=None,
+                 idle_timeout=60, max_backoff=30):
+        super().__init__(daemon=True)
+        self.url = url
+        self.kinds = tuple(kinds)
+        self.on_tick = on_tick
+        self.on_kline = on_kline
+        self.idle_timeout = idle_timeout
+        self.max_backoff = max_backoff
+        self.streams = set()
+        self.last = {}          # symbol -> (price, ts_ms, seq)
+        self.connected = False
+        self.reconnects = 0
+        self._seq = 0
+        self._req_id = 0
+        self._sock = None
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._stop_evt = threading.Event()
+        self.subscribe(symbols)
+
+    def stop(self):
+        self._stop_evt.set()
+        self._close()
+
+    def stopped(self): return self._stop_evt.is_set()
+
+    def _streams_for(self, symbol):
+        return {f"{symbol.lower()}@{k}" for k in self.kinds}
+
+    def subscribe(self, symbols):
+        new = set()
+        for s in symbols:
+            new |= self._streams_for(s)
+        new -= self.streams
+        if not new:
+            return
+        self.streams |= new
+        if self.connected:
+            self._send_subscribe(sorted(new))
+
+    def _send_subscribe(self, streams):
+        with self._lock:
+            self._req_id += 1
+            msg = json.dumps({"method": "SUBSCRIBE", "params": streams, "id": self._req_id})
+            write_frame(self._sock, OP_TEXT, msg.encode())
+
+    def _close(self):
+        sock, self._sock = self._sock, None
+        self.connected = False
+        if sock:
+            try:
+                sock.close()
+            except Exception:
+                pass
+
+    # --- consumo ---
+    def latest(self, symbol, max_age=None):
+        p = self.last.get(symbol)
+        if not p or (max_age is not None and time.time() * 1000 - p[1] > max_age * 1000):
+            return None
+        return p[0]
+
+    def wait_price(self, symbol, after_seq=0, timeout=None):
+        # bloqueia até chegar um tick mais novo que after_seq; devolve (price, seq) ou None
+        with self._cond:
+            ok = self._cond.wait_for(lambda: self.last.get(symbol, (0, 0, 0))[2] > after_seq or self.stopped(),
+                                     timeout=timeout)
+            if not ok or self.stopped():
+                return None
+            price, _, seq = self.last[symbol]
+            return price, seq
+
+    def _handle(self, raw):
+        msg = json.loads(raw)
+        data = msg.get("data", msg)  # stream combinado ou raw
+        ev = data.get("e") if isinstance(data, dict) else None
+        if ev == "trade":
+            self._push(data["s"], float(data["p"]), data.get("T") or data.get("E"))
+        elif ev == "kline":
+            k = data["k"]
+            self._push(data["s"], float(k["c"]), data.get("E") or k["T"])
+            if self.on_kline:
+                self.on_kline(data["s"], k["i"], {"t": k["t"], "o": float(k["o"]), "h": float(k["h"]),
+                                                  "l": float(k["l"]), "c": float(k["c"]),
+                                                  "v": float(k.get("v", 0)), "closed": bool(k["x"])})
+
+    def _push(self, symbol, price, ts):
+        with self._cond:
+            self._seq += 1
+            self.last[symbol] = (price, ts or int(time.time() * 1000), self._seq)
+            self._cond.notify_all()
+        if self.on_tick:
+            self.on_tick(symbol, price, ts)
+
+    def _session(self):
+        self._sock = ws_connect(self.url)
+        self._sock.settimeout(self.idle_timeout)
+        self.connected = True
+        if self.streams:
+            self._send_subscribe(sorted(self.streams))
+        while not self.stopped():
+            op, payload = read_frame(self._sock)
+            if op == OP_TEXT:
+                try:
+                    self._handle(payload)
+                except Exception as e:
+                    print(f"[{now_iso()}] Stream: msg inválida: {e}")
+            elif op == OP_PING:
+                with self._lock:
+                    write_frame(self._sock, OP_PONG, payload)
+            elif op == OP_CLOSE:
+                raise ConnectionError("servidor fechou o stream")
+
+    def run(self):
+        backoff = min(1, self.max_backoff)
+        while not self.stopped():
+            started = time.time()
+            try:
+                self._session()
+            except Exception as e:
+                if not self.stopped():
+                    print(f"[{now_iso()}] Stream caiu: {e}")
+            self._close()
+            if self.stopped():
+                break
+            self.reconnects += 1
+            if time.time() - started > 60:
+                backoff = min(1, self.max_backoff)  # conexão durou: volta ao backoff mínimo
+            self._stop_evt.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+        with self._cond:
+            self._cond.notify_all()
@@ -0,0 +1,341 @@
+import os, time, pickle, socket, struct, threading
+from collections import OrderedDict
+from django.conf import settings
+from .metrics import REGISTRY
+
+MISSING = object()
+LEASE_SEC = 15.0        # um fill demorando mais que isso é dado como morto; outro assume
+_LEN = struct.Struct("<I")
+
+
+class LocalCache:
+    """Cache de dados de mercado em memória: TTL por chave, LRU em `max_items`
+    e single-flight: com vários pedidos da mesma chave ausente, só o primeiro
+    busca (recebe a "vez" em `acquire`), os outros esperam o `release` dele e
+    leem o valor. Serve um processo sozinho, os testes e o CacheServer.
+    """
+
+    def __init__(self, max_items=1024, clock=time.monotonic, lease_sec=LEASE_SEC):
+        self.max_items = max_items
+        self.clock = clock
+        self.lease_sec = lease_sec
+        self.items = OrderedDict()      # chave -> (expira_em, valor), do menos para o mais usado
+        self.flights = {}               # chave -> (Event, prazo da vez)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.waits = self.evictions = self.expired = 0
+
+    def _get(self, key, now):
+        item = self.items.get(key)
+        if item is None:
+            return MISSING
+        if item[0] <= now:
+            del self.items[key]
+            self.expired += 1
+            return MISSING
+        self.items.move_to_end(key)
+        return item[1]
+
+    def get(self, key):
+        with self._lock:
+            v = self._get(key, self.clock())
+            if v is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return v
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def _set(self, key, value, ttl):
+        self.items[key] = (self.clock() + ttl, value)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+            self.evictions += 1
+
+    def acquire(self, key):
+        """(valor, False) se está no cache; (MISSING, True) se é a vez do chamador buscar."""
+        waited = False
+        while True:
+            with self._lock:
+                now = self.clock()
+                v = self._get(key, now)
+                if v is not MISSING:
+                    self.hits += 1
+                    return v, False
+                flight = self.flights.get(key)
+                if flight is None or flight[1] <= now:
+                    self.flights[key] = (threading.Event(), now + self.lease_sec)
+                    self.misses += 1
+                    return MISSING, True
+                if not waited:
+                    self.waits += 1
+                    waited = True
+            flight[0].wait(max(0.0, flight[1] - now))
+
+    def release(self, key, value=MISSING, ttl=0):
+        # fim da vez: grava (se houver valor) e acorda quem esperava
+        with self._lock:
+            if value is not MISSING and ttl > 0:
+                self._set(key, value, ttl)
+            flight = self.flights.pop(key, None)
+        if flight is not None:
+            flight[0].set()
+
+    def get_or_fill(self, key, ttl, fill):
+        """Valor da chave; ausente, `fill()` roda uma vez para todos. None não é guardado."""
+        v, mine = self.acquire(key)
+        if not mine:
+            return v
+        try:
+            v = fill()
+        except BaseException:
+            self.release(key)
+            raise
+        self.release(key, v if v is not None else MISSING, ttl)
+        return v
+
+    def metrics(self):
+        with self._lock:
+            size, flights = len(self.items), len(self.flights)
+        return {"size": size, "in_flight": flights, "hits": self.hits, "misses": self.misses, "waits": self.waits,
+                "evictions": self.evictions, "expired": self.expired}
+
+
+# --- entre processos: socket unix ---
+def _send(sock, obj):
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_LEN.pack(len(data)) + data)
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise EOFError("conexão fechada")
+        buf += chunk
+    return bytes(buf)
+
+def _recv(sock):
+    n, = _LEN.unpack(_recv_exact(sock, _LEN.size))
+    return pickle.loads(_recv_exact(sock, n))
+
+
+class CacheServer(threading.Thread):
+    """Daemon do cache: um LocalCache atrás de um socket unix (modo 0600, só
+    o mesmo usuário; as mensagens são pickle). Runner e workers web da
+    máquina pedem a mesma chave e uma única busca na corretora serve todos.
+    Cliente que cai no meio da sua vez libera a chave para o próximo.
+    """
+
+    def __init__(self, path, cache=None):
+        super().__init__(daemon=True, name="mdcache")
+        self.path = str(path)
+        self.cache = cache or LocalCache(getattr(settings, "MARKET_CACHE_SIZE", 1024))
+        self.sock = None
+        self.ready = threading.Event()
+        self._stop_evt = threading.Event()
+        self.clients = 0
+
+    def bind(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.sock.listen(64)
+        self.ready.set()
+
+    def run(self):
+        if self.sock is None:
+            self.bind()
+        while not self._stop_evt.is_set():
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        leases = set()
+        self.clients += 1
+        try:
+            while True:
+                op, key, *args = _recv(conn)
+                if op == "acquire":
+                    v, mine = self.cache.acquire(key)
+                    if mine:
+                        leases.add(key)
+                        _send(conn, ("fill",))
+                    else:
+                        _send(conn, ("hit", v))
+                elif op == "release":
+                    value, ttl = args
+                    leases.discard(key)
+                    self.cache.release(key, MISSING if value is None else value, ttl)
+                    _send(conn, ("ok",))
+                elif op == "get":
+                    v = self.cache.get(key)
+                    _send(conn, ("miss",) if v is MISSING else ("hit", v))
+                elif op == "set":
+                    self.cache.set(key, *args)
+                    _send(conn, ("ok",))
+                elif op == "metrics":
+                    _send(conn, ("ok", self.cache.metrics()))
+                else:
+                    _send(conn, ("error", f"operação desconhecida: {op}"))
+        except (EOFError, OSError, pickle.UnpicklingError, ValueError):
+            pass
+        finally:
+            self.clients -= 1
+            for key in leases:
+                self.cache.release(key)
+            conn.close()
+
+    def stop(self):
+        self._stop_evt.set()
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class _Down(Exception):
+    pass
+
+
+class SocketCache:
+    """Cliente do CacheServer, com a mesma interface do LocalCache. Uma
+    conexão por thread; sem daemon no ar, cai num LocalCache do processo e
+    tenta de novo depois de `retry_sec`."""
+
+    def __init__(self, path, fallback=None, retry_sec=5.0, timeout=LEASE_SEC + 5):
+        self.path = str(path)
+        self.fallback = fallback or LocalCache()
+        self.retry_sec = retry_sec
+        self.timeout = timeout
+        self._local = threading.local()
+        self._down_until = 0.0
+        self.hits = self.fills = self.fallbacks = 0
+
+    def _conn(self):
+        s = getattr(self._local, "sock", None)
+        if s is not None:
+            return s
+        if time.monotonic() < self._down_until:
+            raise _Down()
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.settimeout(self.timeout)
+        try:
+            s.connect(self.path)
+        except OSError:
+            s.close()
+            self._down_until = time.monotonic() + self.retry_sec
+            raise _Down()
+        self._local.sock = s
+        return s
+
+    def _call(self, *msg):
+        s = self._conn()
+        try:
+            _send(s, msg)
+            return _recv(s)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            s.close()
+            self._local.sock = None
+            self._down_until = time.monotonic() + self.retry_sec
+            raise _Down()
+
+    def get(self, key):
+        try:
+            r = self._call("get", key)
+        except _Down:
+            self.fallbacks += 1
+            return self.fallback.get(key)
+        return r[1] if r[0] == "hit" else MISSING
+
+    def set(self, key, value, ttl):
+        try:
+            self._call("set", key, value, ttl)
+        except _Down:
+            self.fallbacks += 1
+            self.fallback.set(key, value, ttl)
+
+    def get_or_fill(self, key, ttl, fill):
+        try:
+            r = self._call("acquire", key)
+        except _Down:
+            self.fallbacks += 1
+            return self.fallback.get_or_fill(key, ttl, fill)
+        if r[0] == "hit":
+            self.hits += 1
+            return r[1]
+        self.fills += 1
+        try:
+            v = fill()
+        except BaseException:
+            self._release(key, None, 0)
+            raise
+        self._release(key, v, ttl)
+        return v
+
+    def _release(self, key, value, ttl):
+        try:
+            self._call("release", key, value, ttl)
+        except _Down:
+            pass        # daemon caiu: a vez some com a conexão
+
+    def metrics(self):
+        out = {"hits": self.hits, "fills": self.fills, "fallbacks": self.fallbacks}
+        try:
+            out["server"] = self._call("metrics", None)[1]
+        except _Down:
+            out["local"] = self.fallback.metrics()
+        return out
+
+
+def running(path):
+    # algum processo já atende no socket?
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(str(path))
+            return True
+        except OSError:
+            return False
+
+def serve(path=None):
+    """Sobe o CacheServer em MARKET_CACHE_SOCKET, a não ser que outro processo já sirva
+    ali. Devolve o servidor (thread já rodando) ou None."""
+    path = path or getattr(settings, "MARKET_CACHE_SOCKET", "")
+    if not path or running(path):
+        return None
+    server = CacheServer(path)
+    server.bind()
+    server.start()
+    return server
+
+
+_cache = None
+_lock = threading.Lock()
+
+def default_market_cache():
+    """Cache compartilhado da máquina (SocketCache em MARKET_CACHE_SOCKET) ou, com
+    a configuração vazia, um LocalCache só deste processo."""
+    global _cache
+    with _lock:
+        if _cache is None:
+            path = getattr(settings, "MARKET_CACHE_SOCKET", "")
+            size = getattr(settings, "MARKET_CACHE_SIZE", 1024)
+            _cache = SocketCache(path, LocalCache(size)) if path else LocalCache(size)
+            REGISTRY.collector("gridbot_mdcache", _cache.metrics)
+        return _cache
@@ -0,0 +1,240 @@
+import os, glob, json, time, threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# segundos: de 1ms (gravação local) a 10s (rede lenta / loop atrasado)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SNAPSHOT_MAX_AGE = 60
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # último = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v):
+        self.counts[bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def quantile(self, q):
+        # limite superior do balde onde cai o quantil (estimativa de Prometheus sem interpolar)
+        if not self.count:
+            return None
+        rank, acc = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def to_dict(self):
+        return {"buckets": list(self.buckets), "counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+    @classmethod
+    def from_dict(cls, d):
+        h = cls(d["buckets"])
+        h.counts, h.sum, h.count = list(d["counts"]), d["sum"], d["count"]
+        return h
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Registry:
+    """Contadores, gauges e histogramas do processo, com rótulos.
+
+    O runner grava um snapshot JSON (`flush_every`) que o processo web lê para
+    servir /metrics e o painel; `collectors` são chamados no snapshot e viram
+    gauges (fila do StateWriter, do Notifier etc.).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.hists = {}
+        self.collectors = {}
+        self.path = None        # worker do runbot: um arquivo por símbolo (metrics_file(symbol))
+        self._last_flush = 0.0
+
+    def inc(self, name, value=1, **labels):
+        k = _key(name, labels)
+        with self._lock:
+            self.counters[k] = self.counters.get(k, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        k = _key(name, labels)
+        with self._lock:
+            h = self.hists.get(k)
+            if h is None:
+                h = self.hists[k] = Histogram()
+            h.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def collector(self, prefix, fn):
+        # fn() -> dict; valores numéricos viram gauges "<prefix>_<chave>"
+        self.collectors[prefix] = fn
+
+    def snapshot(self):
+        for prefix, fn in list(self.collectors.items()):
+            try:
+                for k, v in fn().items():
+                    if isinstance(v, (int, float)):
+                        self.set(f"{prefix}_{k}", v)
+            except Exception:
+                pass
+        with self._lock:
+            return {"pid": os.getpid(), "ts": time.time(),
+                    "counters": [[n, dict(l), v] for (n, l), v in self.counters.items()],
+                    "gauges": [[n, dict(l), v] for (n, l), v in self.gauges.items()],
+                    "histograms": [[n, dict(l), h.to_dict()] for (n, l), h in self.hists.items()]}
+
+    def write(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def flush_every(self, seconds=5.0, path=None):
+        # chamado do loop do bot: grava no máximo a cada `seconds`
+        now = time.monotonic()
+        if now - self._last_flush < seconds:
+            return False
+        self._last_flush = now
+        try:
+            self.write(path or self.path or metrics_file())
+        except OSError as e:
+            from .bot_runner import now_iso     # bot_runner importa este módulo
+            print(f"[{now_iso()}] Falha ao gravar métricas: {e}")
+        return True
+
+
+class NullRegistry(Registry):
+    # backtest/sweep: mesma interface, custo zero
+    def inc(self, name, value=1, **labels): pass
+    def set(self, name, value, **labels): pass
+    def observe(self, name, value, **labels): pass
+
+    @contextmanager
+    def timer(self, name, **labels):
+        yield
+
+    def flush_every(self, seconds=5.0, path=None): return False
+
+
+REGISTRY = Registry()
+NULL = NullRegistry()
+
+
+def metrics_file(tag=None):
+    from django.conf import settings
+    path = str(getattr(settings, "METRICS_FILE", None) or os.path.join(settings.BASE_DIR, "metrics.json"))
+    if tag:
+        base, ext = os.path.splitext(path)
+        path = f"{base}.{tag}{ext}"
+    return path
+
+def read_snapshot(path=None, max_age=SNAPSHOT_MAX_AGE):
+    # snapshot do runner (outro processo); None se ausente ou velho demais
+    try:
+        with open(path or metrics_file(), encoding="utf-8") as f:
+            snap = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return snap if time.time() - snap.get("ts", 0) <= max_age else None
+
+def snapshots():
+    # este processo + os do runner (arquivo único ou um por worker do runbot), cada um
+    # com seu rótulo `process`: "web", "runner" ou o símbolo do worker (metrics.<SYM>.json)
+    own = REGISTRY.snapshot()
+    own.setdefault("process", "web")
+    out = [own]
+    base, ext = os.path.splitext(metrics_file())
+    for path in [metrics_file()] + sorted(glob.glob(f"{glob.escape(base)}.*{ext}")):
+        other = read_snapshot(path)
+        if other and other.get("pid") != os.getpid():
+            other.setdefault("process", os.path.splitext(path)[0][len(base) + 1:] or "runner")
+            out.append(other)
+    return out
+
+
+def _labels(labels, **extra):
+    items = {**labels, **extra}
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in sorted(items.items())) + "}"
+
+def _series(snaps):
+    # junta os snapshots por série (nome + rótulos, com `process` se o snapshot tiver):
+    # contadores e histogramas somam, gauge fica o último; nenhuma série sai repetida
+    counters, gauges, hists = {}, {}, {}
+    for s in snaps:
+        extra = {"process": s["process"]} if s.get("process") else {}
+        for n, l, v in s["counters"]:
+            k = _key(n, {**l, **extra})
+            counters[k] = counters.get(k, 0) + v
+        for n, l, v in s["gauges"]:
+            gauges[_key(n, {**l, **extra})] = v
+        for n, l, d in s["histograms"]:
+            k = _key(n, {**l, **extra})
+            h = hists.get(k)
+            if h is None:
+                hists[k] = Histogram.from_dict(d)
+            elif list(h.buckets) == list(d["buckets"]):
+                h.counts = [a + b for a, b in zip(h.counts, d["counts"])]
+                h.sum += d["sum"]
+                h.count += d["count"]
+    return counters, gauges, hists
+
+def render(snaps):
+    """Formato texto do Prometheus (0.0.4)."""
+    kinds, lines = {}, {}
+    counters, gauges, hists = _series(snaps)
+    for (n, l), v in counters.items():
+        kinds[n] = "counter"
+        lines.setdefault(n, []).append(f"{n}{_labels(dict(l))} {v}")
+    for (n, l), v in gauges.items():
+        kinds[n] = "gauge"
+        lines.setdefault(n, []).append(f"{n}{_labels(dict(l))} {v}")
+    for (n, l), h in hists.items():
+        kinds[n] = "histogram"
+        l, acc, out = dict(l), 0, lines.setdefault(n, [])
+        for b, c in zip(list(h.buckets) + ["+Inf"], h.counts):
+            acc += c
+            out.append(f"{n}_bucket{_labels(l, le=b)} {acc}")
+        out.append(f"{n}_sum{_labels(l)} {h.sum}")
+        out.append(f"{n}_count{_labels(l)} {h.count}")
+    text = []
+    for n in sorted(lines):
+        text.append(f"# TYPE {n} {kinds[n]}")
+        text.extend(lines[n])
+    return "\n".join(text) + "\n"
+
+def summary(snaps):
+    """Resumo para o painel: média/p50/p95 por histograma, contadores e gauges."""
+    counters, gauges, hists = _series(snaps)
+    return {"histograms": [{"name": n, "labels": dict(l), "count": h.count,
+                            "avg_ms": round(h.sum / h.count * 1000, 2) if h.count else None,
+                            "p50_ms": _ms(h.quantile(0.5)), "p95_ms": _ms(h.quantile(0.95))}
+                           for (n, l), h in hists.items()],
+            "counters": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in counters.items()],
+            "gauges": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in gauges.items()]}
+
+def _ms(v):
+    return None if v is None else (round(v * 1000, 1) if v != float("inf") else "inf")
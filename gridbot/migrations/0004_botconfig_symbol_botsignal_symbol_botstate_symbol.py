@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gridbot', '0003_botconfig_atr_interval_botconfig_atr_k_grid_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='botconfig',
+            name='symbol',
+            field=models.CharField(default='POLUSDT', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='botsignal',
+            name='symbol',
+            field=models.CharField(default='POLUSDT', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='botstate',
+            name='symbol',
+            field=models.CharField(default='POLUSDT', max_length=20),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gridbot', '0004_botconfig_symbol_botsignal_symbol_botstate_symbol'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SignalRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('symbol', models.CharField(max_length=20)),
+                ('kind', models.CharField(max_length=32)),
+                ('count', models.IntegerField(default=0)),
+                ('min_price', models.FloatField(blank=True, null=True)),
+                ('max_price', models.FloatField(blank=True, null=True)),
+                ('first_id', models.BigIntegerField(blank=True, null=True)),
+                ('last_id', models.BigIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='botsignal',
+            index=models.Index(fields=['symbol', 'kind', 'id'], name='signal_sym_kind_id'),
+        ),
+        migrations.AddIndex(
+            model_name='botsignal',
+            index=models.Index(fields=['symbol', 'id'], name='signal_sym_id'),
+        ),
+        migrations.AddIndex(
+            model_name='botsignal',
+            index=models.Index(fields=['created_at'], name='signal_created'),
+        ),
+        migrations.AddConstraint(
+            model_name='signalrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'symbol', 'kind'), name='rollup_day_symbol_kind'),
+        ),
+    ]
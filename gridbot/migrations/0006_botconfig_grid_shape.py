@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gridbot', '0005_botsignal_indexes_signalrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='botconfig',
+            name='bands_k',
+            field=models.FloatField(default=2.0),
+        ),
+        migrations.AddField(
+            model_name='botconfig',
+            name='bands_len',
+            field=models.IntegerField(default=20),
+        ),
+        migrations.AddField(
+            model_name='botconfig',
+            name='grid_shape',
+            field=models.CharField(choices=[('off', 'simétrica'), ('bands', 'bandas')], default='off', max_length=8),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gridbot', '0006_botconfig_grid_shape'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='botconfig',
+            name='auto_trade',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='BotOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('symbol', models.CharField(max_length=20)),
+                ('client_id', models.CharField(max_length=40, unique=True)),
+                ('exchange_id', models.CharField(blank=True, max_length=64, null=True)),
+                ('side', models.CharField(max_length=4)),
+                ('kind', models.CharField(max_length=16)),
+                ('qty', models.FloatField()),
+                ('price', models.FloatField(blank=True, null=True)),
+                ('status', models.CharField(default='new', max_length=12)),
+                ('filled_qty', models.FloatField(default=0.0)),
+                ('avg_fill_price', models.FloatField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['symbol', 'status'], name='order_sym_status')],
+            },
+        ),
+    ]
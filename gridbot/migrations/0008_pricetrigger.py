@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gridbot', '0007_botconfig_auto_trade_botorder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceTrigger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('symbol', models.CharField(default='POLUSDT', max_length=20)),
+                ('kind', models.CharField(choices=[('alert', 'alerta'), ('take_profit', 'take profit'), ('stop', 'stop parcial')], default='alert', max_length=16)),
+                ('direction', models.CharField(choices=[('above', 'preço ≥ nível'), ('below', 'preço ≤ nível')], max_length=8)),
+                ('price', models.FloatField()),
+                ('qty', models.FloatField(blank=True, null=True)),
+                ('note', models.CharField(blank=True, default='', max_length=200)),
+                ('active', models.BooleanField(default=True)),
+                ('fired_at', models.DateTimeField(blank=True, null=True)),
+                ('fired_price', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['symbol', 'active'], name='trigger_sym_active')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gridbot', '0008_pricetrigger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='botconfig',
+            name='grid_hysteresis_pct',
+            field=models.FloatField(default=0.05),
+        ),
+        migrations.AddField(
+            model_name='botconfig',
+            name='signal_dedup_sec',
+            field=models.IntegerField(default=60),
+        ),
+        migrations.AddField(
+            model_name='botconfig',
+            name='stop_rearm_pct',
+            field=models.FloatField(default=0.5),
+        ),
+        migrations.AddField(
+            model_name='botconfig',
+            name='stop_repeat_sec',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gridbot', '0009_botconfig_signal_hysteresis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='botconfig',
+            name='adaptive_poll',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='botconfig',
+            name='poll_max_sec',
+            field=models.FloatField(default=60.0),
+        ),
+        migrations.AddField(
+            model_name='botconfig',
+            name='poll_min_sec',
+            field=models.FloatField(default=2.0),
+        ),
+    ]
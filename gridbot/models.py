@@ -2,6 +2,7 @@ from django.db import models
 
 class BotConfig(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
+    symbol = models.CharField(default="POLUSDT", max_length=20)
     qty = models.FloatField(default=0.0)
     avg = models.FloatField(default=0.0)
     grid_step = models.FloatField(default=0.6)
@@ -19,11 +20,34 @@ class BotConfig(models.Model):
     atr_refresh_sec = models.IntegerField(default=30)
     atr_interval = models.CharField(default="1m", max_length=8)
 
-    def __str__(self): return f"Config #{self.pk} (qty={self.qty}, avg={self.avg})"
+    # grade moldada por Bollinger/Donchian ("bands"): níveis e step por lado; requer use_atr
+    grid_shape = models.CharField(default="off", max_length=8, choices=[("off", "simétrica"), ("bands", "bandas")])
+    bands_len = models.IntegerField(default=20)
+    bands_k = models.FloatField(default=2.0)
+
+    # ordens de verdade pelo EXECUTION_ADAPTER; qty/avg passam a vir dos fills
+    auto_trade = models.BooleanField(default=False)
+
+    # histerese/deduplicação: stop dispara uma vez e rearma só rearm_pct% acima da linha
+    # (lembrete a cada stop_repeat_sec, 0 = nunca); célula da grade só troca grid_hysteresis_pct%
+    # além do nível; o mesmo cruzamento dentro de signal_dedup_sec não vira sinal de novo
+    stop_rearm_pct = models.FloatField(default=0.5)
+    stop_repeat_sec = models.IntegerField(default=0)
+    grid_hysteresis_pct = models.FloatField(default=0.05)
+    signal_dedup_sec = models.IntegerField(default=60)
+
+    # poll por REST (sem stream): espera entre poll_min_sec e poll_max_sec conforme a distância
+    # ao stop/nível mais perto em ATRs; desligado (padrão), usa interval fixo
+    adaptive_poll = models.BooleanField(default=False)
+    poll_min_sec = models.FloatField(default=2.0)
+    poll_max_sec = models.FloatField(default=60.0)
+
+    def __str__(self): return f"Config #{self.pk} {self.symbol} (qty={self.qty}, avg={self.avg})"
 
 
 class BotState(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
+    symbol = models.CharField(default="POLUSDT", max_length=20)
     running = models.BooleanField(default=False)
     ref_price = models.FloatField(null=True, blank=True)
     trailing_high = models.FloatField(null=True, blank=True)
@@ -38,15 +62,100 @@ class BotState(models.Model):
     eff_grid_step = models.FloatField(null=True, blank=True)
     atr_trailing_stop = models.FloatField(null=True, blank=True)
 
-    def __str__(self): return f"State running={self.running}"
+    def __str__(self): return f"State {self.symbol} running={self.running}"
 
 
 class BotSignal(models.Model):  # <<< ESTA É A CLASSE QUE FALTAVA
     created_at = models.DateTimeField(auto_now_add=True)
+    symbol = models.CharField(default="POLUSDT", max_length=20)
     kind = models.CharField(max_length=32)      # "grid" | "stop" | "ddX" | "startup"
     message = models.TextField()
     price = models.FloatField(null=True, blank=True)
     pnl_pct = models.FloatField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # filtros da API: símbolo/tipo com cursor por id, e faixa de tempo
+            models.Index(fields=["symbol", "kind", "id"], name="signal_sym_kind_id"),
+            models.Index(fields=["symbol", "id"], name="signal_sym_id"),
+            models.Index(fields=["created_at"], name="signal_created"),
+        ]
+
     def __str__(self):
         return f"[{self.created_at:%H:%M:%S}] {self.kind}"
+
+
+class SignalRollup(models.Model):
+    # resumo diário dos BotSignal já removidos pela retenção (prunesignals)
+    day = models.DateField()
+    symbol = models.CharField(max_length=20)
+    kind = models.CharField(max_length=32)
+    count = models.IntegerField(default=0)
+    min_price = models.FloatField(null=True, blank=True)
+    max_price = models.FloatField(null=True, blank=True)
+    first_id = models.BigIntegerField(null=True, blank=True)
+    last_id = models.BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["day", "symbol", "kind"], name="rollup_day_symbol_kind")]
+
+    def __str__(self): return f"{self.day} {self.symbol} {self.kind} x{self.count}"
+
+
+class BotOrder(models.Model):
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    symbol = models.CharField(max_length=20)
+    client_id = models.CharField(max_length=40, unique=True)
+    exchange_id = models.CharField(max_length=64, null=True, blank=True)
+    side = models.CharField(max_length=4)       # "buy" | "sell"
+    kind = models.CharField(max_length=16)      # "grid" | "stop"
+    qty = models.FloatField()
+    price = models.FloatField(null=True, blank=True)   # None = a mercado
+    status = models.CharField(max_length=12, default="new")   # new | open | partial | filled | rejected | canceled
+    filled_qty = models.FloatField(default=0.0)
+    avg_fill_price = models.FloatField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["symbol", "status"], name="order_sym_status")]
+
+    def __str__(self): return f"{self.symbol} {self.side} {self.qty} @ {self.price or 'mercado'} ({self.status})"
+
+
+class PriceTrigger(models.Model):
+    KINDS = [("alert", "alerta"), ("take_profit", "take profit"), ("stop", "stop parcial")]
+    DIRECTIONS = [("above", "preço ≥ nível"), ("below", "preço ≤ nível")]
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    symbol = models.CharField(default="POLUSDT", max_length=20)
+    kind = models.CharField(max_length=16, choices=KINDS, default="alert")
+    direction = models.CharField(max_length=8, choices=DIRECTIONS)
+    price = models.FloatField()
+    qty = models.FloatField(null=True, blank=True)   # take profit/stop parcial: quanto vender
+    note = models.CharField(max_length=200, blank=True, default="")
+    active = models.BooleanField(default=True)
+    fired_at = models.DateTimeField(null=True, blank=True)
+    fired_price = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["symbol", "active"], name="trigger_sym_active")]
+
+    def __str__(self): return f"{self.symbol} {self.kind} {self.direction} {self.price}"
+
+
+def latest_configs():
+    # config mais recente de cada símbolo: {symbol: BotConfig}
+    out = {}
+    for cfg in BotConfig.objects.order_by("-id"):
+        out.setdefault(cfg.symbol, cfg)
+    return out
+
+def state_for(symbol):
+    st = BotState.objects.filter(symbol=symbol).order_by("id").first()
+    return st or BotState.objects.create(symbol=symbol)
+
+def panel_symbol():
+    # símbolo que o painel mostra: o do BotConfig mais recente
+    cfg = BotConfig.objects.order_by("-id").only("symbol").first()
+    return cfg.symbol if cfg else BotConfig._meta.get_field("symbol").default
@@ -0,0 +1,183 @@
+import time, threading
+from collections import deque
+from django.conf import settings
+from .bot_runner import now_iso
+from .exchange import shared_session
+from .metrics import REGISTRY
+
+TELEGRAM_API = "https://api.telegram.org"
+MAX_TEXT = 4096
+
+def telegram_targets():
+    """(token, chat_id) de cada destino. TELEGRAM_CHATS aceita "chat" (usa o
+    TELEGRAM_BOT_TOKEN) ou "token@chat", separados por vírgula."""
+    token = settings.TELEGRAM_BOT_TOKEN
+    out = []
+    if token and settings.TELEGRAM_CHAT_ID:
+        out.append((token, str(settings.TELEGRAM_CHAT_ID)))
+    for item in (getattr(settings, "TELEGRAM_CHATS", "") or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        tok, _, chat = item.rpartition("@")
+        pair = (tok or token, chat)
+        if pair[0] and pair not in out:
+            out.append(pair)
+    return out
+
+
+class Notifier(threading.Thread):
+    """Despachante de alertas fora do loop de preço.
+
+    `notify()` só enfileira. Alertas com `digest_key` são juntados por
+    `digest_window` segundos numa única mensagem. Cada chat respeita um
+    intervalo mínimo entre envios; 429 usa o retry_after do Telegram e
+    outras falhas tentam de novo com backoff exponencial.
+    """
+
+    def __init__(self, targets, api=TELEGRAM_API, digest_window=5.0, per_chat_interval=1.0,
+                 max_queue=200, max_retries=5, session=None):
+        super().__init__(daemon=True)
+        self.targets = list(targets)
+        self.api = api.rstrip("/")
+        self.digest_window = digest_window
+        self.per_chat_interval = per_chat_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.session = session or shared_session()
+        self._cond = threading.Condition()
+        self._stop_evt = threading.Event()
+        self._queues = {t: deque() for t in self.targets}   # [enfileirado_em, texto, tentativas]
+        self._next_ok = {t: 0.0 for t in self.targets}
+        self._digests = {}                                  # key -> (primeiro_ts, [textos])
+        self.sent = self.failed = self.dropped = self.retries = 0
+        self.latency_sum = self.latency_max = 0.0
+
+    # --- produtores ---
+    def notify(self, text, digest_key=None):
+        now = time.time()
+        with self._cond:
+            if not self.targets:
+                print(f"[{now_iso()}] (SEM TELEGRAM) {text}")
+                return
+            if digest_key is not None:
+                first, texts = self._digests.setdefault(digest_key, (now, []))
+                texts.append(text)
+            else:
+                self._enqueue(now, text)
+            self._cond.notify()
+
+    def _enqueue(self, ts, text):
+        for t, q in self._queues.items():
+            if len(q) >= self.max_queue:
+                q.popleft()
+                self.dropped += 1
+            q.append([ts, text[:MAX_TEXT], 0])
+
+    def _flush_digests(self, now, force=False):
+        for key, (first, texts) in list(self._digests.items()):
+            if force or now - first >= self.digest_window:
+                del self._digests[key]
+                if len(texts) == 1:
+                    self._enqueue(first, texts[0])
+                else:
+                    body = f"🧾 {len(texts)} alertas ({key}) em {self.digest_window:.0f}s:\n\n" + "\n\n".join(texts)
+                    if len(body) > MAX_TEXT:
+                        body = body[:MAX_TEXT - 20] + "\n… (truncado)"
+                    self._enqueue(first, body)
+
+    # --- observabilidade ---
+    def metrics(self):
+        with self._cond:
+            depth = sum(len(q) for q in self._queues.values())
+            pending = sum(len(t) for _, t in self._digests.values())
+        return {"queue_depth": depth, "digest_pending": pending, "sent": self.sent, "failed": self.failed,
+                "dropped": self.dropped, "retries": self.retries,
+                "latency_avg_ms": round(self.latency_sum / self.sent * 1000, 1) if self.sent else 0.0,
+                "latency_max_ms": round(self.latency_max * 1000, 1)}
+
+    # --- envio ---
+    def _send(self, target, text):
+        # devolve None se ok, ou segundos de espera sugeridos (0 = backoff padrão)
+        token, chat = target
+        try:
+            r = self.session.post(f"{self.api}/bot{token}/sendMessage",
+                                  data={"chat_id": chat, "text": text}, timeout=10)
+            if r.status_code == 429:
+                try:
+                    return float(r.json().get("parameters", {}).get("retry_after", 5))
+                except Exception:
+                    return 5.0
+            if r.status_code >= 400:
+                # só o status: a URL do erro do requests traz o token do bot
+                print(f"[{now_iso()}] Telegram falhou ({chat}): HTTP {r.status_code}")
+                return 0.0
+            return None
+        except Exception as e:
+            print(f"[{now_iso()}] Telegram falhou ({chat}): {str(e).replace(token, '***')}")
+            return 0.0
+
+    def _step(self, now):
+        # um envio por chat liberado; devolve o próximo instante em que há trabalho
+        with self._cond:
+            self._flush_digests(now)
+            work = [(t, q[0]) for t, q in self._queues.items() if q and now >= self._next_ok[t]]
+        for t, item in work:
+            wait = self._send(t, item[1])
+            with self._cond:
+                q = self._queues[t]
+                if wait is None:
+                    if q and q[0] is item:
+                        q.popleft()
+                    self.sent += 1
+                    lat = time.time() - item[0]
+                    self.latency_sum += lat
+                    self.latency_max = max(self.latency_max, lat)
+                    self._next_ok[t] = time.time() + self.per_chat_interval
+                    continue
+                item[2] += 1
+                if item[2] > self.max_retries:
+                    if q and q[0] is item:
+                        q.popleft()
+                    self.failed += 1
+                    continue
+                self.retries += 1
+                self._next_ok[t] = time.time() + (wait or min(60.0, 2.0 ** item[2]))
+        with self._cond:
+            deadlines = [self._next_ok[t] for t, q in self._queues.items() if q]
+            deadlines += [first + self.digest_window for first, _ in self._digests.values()]
+        return min(deadlines) if deadlines else None
+
+    def run(self):
+        while not self._stop_evt.is_set():
+            nxt = self._step(time.time())
+            with self._cond:
+                timeout = None if nxt is None else max(0.0, nxt - time.time())
+                if not self._stop_evt.is_set() and (timeout is None or timeout > 0):
+                    self._cond.wait(timeout if timeout is not None else 1.0)
+
+    def stop(self, drain_timeout=5.0):
+        # junta os digests pendentes e tenta esvaziar a fila antes de sair
+        with self._cond:
+            self._flush_digests(time.time(), force=True)
+        deadline = time.time() + drain_timeout
+        while self.metrics()["queue_depth"] and time.time() < deadline and self.is_alive():
+            time.sleep(0.05)
+        self._stop_evt.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout=2)
+
+
+_notifier = None
+_lock = threading.Lock()
+
+def default_notifier():
+    global _notifier
+    with _lock:
+        if _notifier is None or not _notifier.is_alive():
+            _notifier = Notifier(telegram_targets(), api=getattr(settings, "TELEGRAM_API", TELEGRAM_API))
+            _notifier.start()
+            REGISTRY.collector("gridbot_notifier", _notifier.metrics)
+        return _notifier
@@ -0,0 +1,98 @@
+import time, threading
+from django.db import close_old_connections, transaction
+from .bot_runner import now_iso
+from .models import BotSignal
+
+class StateWriter(threading.Thread):
+    """Persistência write-behind do runner.
+
+    Updates de BotState são coalescidos (só o último valor de cada campo por
+    linha) e sinais acumulam para um `bulk_create`; tudo é gravado numa única
+    transação a cada `flush_interval`, e de novo no `stop()`.
+    """
+
+    def __init__(self, flush_interval=1.0, max_pending=5000):
+        super().__init__(daemon=True)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop_evt = threading.Event()
+        self._wake = threading.Event()
+        self._state = {}        # (model, pk) -> {campo: valor}
+        self._signals = []
+        self.flushes = 0
+        self.rows_written = 0
+        self.errors = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    # --- produtores (loop do bot) ---
+    def update_state(self, model, pk, **fields):
+        with self._lock:
+            self._state.setdefault((model, pk), {}).update(fields)
+
+    def add_signal(self, **fields):
+        with self._lock:
+            if len(self._signals) >= self.max_pending:
+                self._signals.pop(0)  # DB travado há muito tempo: descarta o mais antigo
+                self.dropped += 1
+            self._signals.append(BotSignal(**fields))
+            if len(self._signals) >= self.max_pending // 2:
+                self._wake.set()
+
+    def queue_depth(self):
+        with self._lock:
+            return len(self._signals) + len(self._state)
+
+    def metrics(self):
+        return {"queue_depth": self.queue_depth(), "flushes": self.flushes, "rows_written": self.rows_written,
+                "errors": self.errors, "dropped": self.dropped,
+                "last_flush_ms": round(self.last_flush_ms, 2), "max_flush_ms": round(self.max_flush_ms, 2)}
+
+    # --- gravação ---
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                state, self._state = self._state, {}
+                signals, self._signals = self._signals, []
+            if not state and not signals:
+                return 0
+            t0 = time.perf_counter()
+            try:
+                close_old_connections()
+                with transaction.atomic():
+                    if signals:
+                        BotSignal.objects.bulk_create(signals)
+                    for (model, pk), fields in state.items():
+                        model.objects.filter(pk=pk).update(**fields)
+            except Exception as e:
+                self.errors += 1
+                print(f"[{now_iso()}] Falha ao gravar lote ({len(signals)} sinais): {e}")
+                with self._lock:  # devolve para a próxima tentativa, sem atropelar valores mais novos
+                    for key, fields in state.items():
+                        self._state[key] = {**fields, **self._state.get(key, {})}
+                    self._signals[:0] = signals[-self.max_pending:]
+                return 0
+            ms = (time.perf_counter() - t0) * 1000
+            self.flushes += 1
+            self.rows_written += len(signals) + len(state)
+            self.last_flush_ms = ms
+            self.max_flush_ms = max(self.max_flush_ms, ms)
+            return len(signals) + len(state)
+
+    def stop(self):
+        self._stop_evt.set()
+        self._wake.set()
+        if self.is_alive():
+            self.join(timeout=10)
+        self.flush()
+
+    def run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stop_evt.is_set():
+                return      # o último lote é do stop(), no thread de quem para
+            self.flush()
@@ -0,0 +1,80 @@
+import re, struct
+import numpy as np
+
+UNIT_MS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000}
+# intervalos que a Binance serve (e o CandleStore guarda), do maior para o menor
+BASE_INTERVALS = (("1d", 86_400_000), ("4h", 14_400_000), ("1h", 3_600_000),
+                  ("15m", 900_000), ("5m", 300_000), ("1m", 60_000))
+BIN_MAGIC = b"KLN2"
+
+def parse_interval(spec):
+    # "1m", "7m", "2h", "3d", "1w" -> ms; ValueError se inválido
+    m = re.fullmatch(r"(\d+)([mhdw])", spec or "")
+    if not m or int(m.group(1)) <= 0:
+        raise ValueError(f"intervalo inválido: {spec}")
+    return int(m.group(1)) * UNIT_MS[m.group(2)]
+
+def base_intervals(step_ms):
+    # intervalos nativos que dividem o pedido, do maior (menos linhas para agregar) ao 1m
+    return [(name, ms) for name, ms in BASE_INTERVALS if ms <= step_ms and step_ms % ms == 0]
+
+def resample(a, step_ms):
+    """Agrega colunas {t,o,h,l,c,v} (t crescente) em baldes de `step_ms`
+    alinhados à época: open do primeiro, high/low extremos, close do último,
+    volume somado. t de cada balde é a abertura do balde."""
+    t = np.asarray(a["t"], dtype=np.int64)
+    if not len(t):
+        return {k: np.asarray(a[k])[:0] for k in ("t", "o", "h", "l", "c", "v")}
+    bucket = t - t % step_ms
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(t)] - 1
+    return {"t": bucket[starts], "o": np.asarray(a["o"])[starts],
+            "h": np.maximum.reduceat(np.asarray(a["h"]), starts),
+            "l": np.minimum.reduceat(np.asarray(a["l"]), starts),
+            "c": np.asarray(a["c"])[ends],
+            "v": np.add.reduceat(np.asarray(a["v"], dtype=np.float64), starts)}
+
+def lttb(x, y, n):
+    """Largest-Triangle-Three-Buckets: índices de `n` pontos que preservam a
+    forma da série (picos e vales) para desenhar em `n` pixels."""
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, size - 1, n - 1).astype(np.int64)   # n-2 baldes internos
+    out = np.empty(n, dtype=np.int64)
+    out[0], out[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # média do próximo balde (o último ponto, no fim)
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else size
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+def pack(a):
+    """Formato binário colunar (little-endian): "KLN2", uint32 n, 8 bytes
+    livres (alinha em 16), t,o,h,l,c como float64[n] (ms exatos e preço sem
+    perda, float32 só guarda ~7 dígitos) e v como float32[n]. No navegador:
+    new Float64Array(buf, 16, n) etc., sem parse."""
+    n = len(a["t"])
+    parts = [BIN_MAGIC, struct.pack("<I8x", n)]
+    parts += [np.asarray(a[k], dtype="<f8").tobytes() for k in ("t", "o", "h", "l", "c")]
+    parts.append(np.asarray(a["v"], dtype="<f4").tobytes())
+    return b"".join(parts)
+
+def unpack(buf):
+    if buf[:4] != BIN_MAGIC:
+        raise ValueError("formato desconhecido")
+    n, = struct.unpack_from("<I", buf, 4)
+    out = {"t": np.frombuffer(buf, dtype="<f8", count=n, offset=16).astype(np.int64)}
+    off = 16 + 8 * n
+    for k in ("o", "h", "l", "c"):
+        out[k] = np.frombuffer(buf, dtype="<f8", count=n, offset=off)
+        off += 8 * n
+    out["v"] = np.frombuffer(buf, dtype="<f4", count=n, offset=off)
+    return out
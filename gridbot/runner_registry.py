@@ -1,30 +1,117 @@
 from typing import Optional
-from .models import BotConfig, BotState
+from django.conf import settings
+from .models import BotConfig, latest_configs, state_for
 from .bot_runner import GridBotThread
+from .engine import MultiGridEngine
+from .market_stream import MarketStream
+from .persistence import StateWriter
+from .notify import default_notifier
+from .execution import current_executor, default_executor
+from .journal import default_journal
+from .timeframes import default_candle_hub
+from .metrics import REGISTRY
 
 class BotRegistry:
-    _thread: Optional[GridBotThread] = None
+    _engine: Optional[MultiGridEngine] = None
+    _stream: Optional[MarketStream] = None
+    _writer: Optional[StateWriter] = None
+
+    @classmethod
+    def _get_writer(cls):
+        if cls._writer is None or not cls._writer.is_alive():
+            cls._writer = StateWriter()
+            cls._writer.start()
+            REGISTRY.collector("gridbot_writer", cls._writer.metrics)
+        return cls._writer
+
+    @classmethod
+    def _feed(cls, symbols):
+        # stream de trades compartilhado; desligado via MARKET_STREAM=False
+        if not getattr(settings, "MARKET_STREAM", False):
+            return None
+        if cls._stream is None or not cls._stream.is_alive():
+            # trades para o preço, kline_1m para o CandleHub (todos os timeframes)
+            cls._stream = MarketStream(symbols, kinds=("trade", "kline_1m"),
+                                       on_kline=default_candle_hub().on_kline)
+            cls._stream.start()
+        else:
+            cls._stream.subscribe(symbols)
+        return cls._stream
+
+    @classmethod
+    def _bot(cls, cfg, feed):
+        return GridBotThread(cfg, state_for(cfg.symbol), writer=cls._get_writer(), notifier=default_notifier(),
+                             executor=default_executor(), candle_hub=default_candle_hub() if feed else None,
+                             journal=default_journal(cfg.symbol))
 
     @classmethod
     def start(cls):
-        if cls._thread and cls._thread.is_alive():
+        return cls.start_all()
+
+    @classmethod
+    def start_all(cls, symbols=None):
+        # todos os símbolos (ou só `symbols`) num único loop com ticker em lote
+        if cls.running():
+            return False
+        configs = latest_configs()
+        if symbols:
+            configs = {s: configs.get(s) or BotConfig.objects.create(symbol=s) for s in symbols}
+        if not configs:
+            cfg = BotConfig.objects.create()
+            configs = {cfg.symbol: cfg}
+        feed = cls._feed(list(configs))
+        e = MultiGridEngine([cls._bot(cfg, feed) for cfg in configs.values()], feed=feed)
+        e.start()
+        cls._engine = e
+        return True
+
+    @classmethod
+    def add(cls, cfg):
+        # símbolo novo com o loop no ar: entra na próxima volta
+        if not cls.running() or cfg.symbol in cls._engine.bots:
             return False
-        cfg = BotConfig.objects.order_by("-id").first() or BotConfig.objects.create()
-        state, _ = BotState.objects.get_or_create(pk=1)
-        t = GridBotThread(cfg, state)
-        t.start()
-        cls._thread = t
+        cls._engine.add(cls._bot(cfg, cls._feed([cfg.symbol])))
         return True
 
     @classmethod
     def stop(cls):
-        if cls._thread and cls._thread.is_alive():
-            cls._thread.stop()
-            cls._thread.join(timeout=5)
-            cls._thread = None
-            return True
-        return False
+        stopped = False
+        e = cls._engine
+        if e and e.is_alive():
+            e.stop()
+            e.join(timeout=5 + max((b.cfg.interval for b in cls._bots()), default=0))
+            stopped = True
+        cls._engine = None
+        if cls._stream:
+            cls._stream.stop()
+            cls._stream = None
+        if cls._writer:
+            cls._writer.stop()  # flush final
+            cls._writer = None
+        default_notifier().stop()
+        ex = current_executor()
+        if ex is not None:
+            ex.stop()
+        return stopped
+
+    @classmethod
+    def _bots(cls):
+        if cls._engine:
+            yield from list(cls._engine.bots.values())
+
+    @classmethod
+    def reload(cls, cfg):
+        # aplica a config salva no painel ao bot do mesmo símbolo, no próximo tick
+        for bot in cls._bots():
+            if bot.symbol == cfg.symbol:
+                bot.reload_config(cfg)
+
+    @classmethod
+    def reload_triggers(cls, symbol):
+        for bot in cls._bots():
+            if bot.symbol == symbol:
+                bot.reload_triggers()
 
     @classmethod
     def running(cls):
-        return bool(cls._thread and cls._thread.is_alive())
+        return bool(cls._engine and cls._engine.is_alive())
@@ -0,0 +1,68 @@
+import time
+
+
+class PollScheduler:
+    """Espera até o próximo preço por REST, pela distância ao gatilho mais perto.
+
+    A distância d até o nível da grade, stop ou gatilho mais próximo vira o
+    tempo típico de chegada de um passeio aleatório, (d/σ)², com σ² por
+    segundo vindo do ATR (atr²/timeframe) ou da volatilidade realizada entre
+    polls, o que for maior. Espera `fraction` disso (0.1: chance de ~0,2% de
+    o preço alcançar o nível antes do próximo poll), entre `min_delay` e
+    `max_delay`: perto do stop o poll fica rápido, no meio da célula espaça.
+
+    O piso acompanha o orçamento de peso (WeightBudget, o mesmo do IP): os
+    polls de preço usam no máximo `share` do limite por minuto, o piso cresce
+    quando sobra pouco e, abaixo de `reserve`, vai direto para `max_delay`.
+    """
+
+    def __init__(self, min_delay=2.0, max_delay=60.0, fraction=0.1, weight=2, budget=None, share=0.5,
+                 reserve=0.2, alpha=0.2, clock=time.time):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.fraction = fraction
+        self.weight = weight
+        self.budget = budget
+        self.share = share
+        self.reserve = reserve
+        self.alpha = alpha
+        self.clock = clock
+        self.var = None         # EWMA de Δp²/Δt entre polls (preço²/s)
+        self.last = None        # (preço, ts) do último poll
+        self.distance_atr = None
+
+    def configure(self, min_delay, max_delay):
+        self.min_delay = max(0.1, min_delay)
+        self.max_delay = max(self.min_delay, max_delay)
+
+    def observe(self, price, now=None):
+        now = self.clock() if now is None else now
+        if self.last is not None:
+            p0, t0 = self.last
+            dt = now - t0
+            if dt > 0:
+                v = (price - p0) ** 2 / dt
+                self.var = v if self.var is None else self.var + self.alpha * (v - self.var)
+        self.last = (price, now)
+
+    def floor(self, now=None):
+        b = self.budget
+        if b is None or not b.limit:
+            return self.min_delay
+        left = b.remaining(now) / b.limit
+        if left <= self.reserve:
+            return self.max_delay
+        return max(self.min_delay, 60.0 * self.weight / (b.limit * self.share) / left)
+
+    def delay(self, price, targets, atr=None, tf_sec=60, fallback=None):
+        now = self.clock()
+        lo = min(self.floor(now), self.max_delay)
+        ds = [abs(price - t) for t in targets if t is not None]
+        sigma2 = max(atr * atr / tf_sec if atr else 0.0, self.var or 0.0)
+        if not ds or sigma2 <= 0:
+            # sem volatilidade ainda: intervalo fixo
+            self.distance_atr = None
+            return min(self.max_delay, max(lo, self.max_delay if fallback is None else fallback))
+        d = min(ds)
+        self.distance_atr = d / atr if atr else None
+        return min(self.max_delay, max(lo, self.fraction * d * d / sigma2))
@@ -0,0 +1,306 @@
+import os, json, time, signal, socket, threading
+import multiprocessing as mp
+from django.conf import settings
+
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+STABLE_AFTER = 60.0     # rodou isso sem cair: zera a contagem de falhas
+STOP_TIMEOUT = 20.0
+
+
+def runner_socket():
+    return str(getattr(settings, "RUNNER_SOCKET", None) or os.path.join(settings.BASE_DIR, "runner.sock"))
+
+def _notify(msg, path=None):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as s:
+            s.sendto(json.dumps(msg).encode(), path or runner_socket())
+        return True
+    except OSError:
+        return False
+
+def notify_config_change(cfg, path=None):
+    """Avisa o runbot (se estiver no ar) que um BotConfig foi salvo. Datagrama
+    no socket unix: não bloqueia o request e some em silêncio sem runner."""
+    return _notify({"event": "config", "symbol": cfg.symbol, "id": cfg.pk}, path)
+
+def notify_triggers_change(symbol, path=None):
+    # gatilhos do símbolo criados/removidos no painel
+    return _notify({"event": "triggers", "symbol": symbol}, path)
+
+
+def worker_main(symbol, conn):
+    """Processo de um símbolo: um GridBotThread com stream, writer e notifier
+    próprios. Sem stream, o preço vem do ticker completo no cache de mercado
+    (shared_price): uma busca por janela serve todos os workers. Mensagens do supervisor chegam por `conn`: ("reload", id),
+    ("triggers",) e ("stop",)."""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "polgrid.settings")
+        django.setup()
+    from django.db import close_old_connections
+    from .bot_runner import GridBotThread
+    from .execution import default_executor
+    from .journal import default_journal
+    from .timeframes import default_candle_hub
+    from .market_stream import MarketStream
+    from .metrics import REGISTRY, metrics_file
+    from .models import BotConfig, latest_configs, state_for
+    from .notify import default_notifier
+    from .persistence import StateWriter
+
+    cfg = latest_configs().get(symbol) or BotConfig.objects.create(symbol=symbol)
+    feed = hub = None
+    if getattr(settings, "MARKET_STREAM", False):
+        hub = default_candle_hub()
+        feed = MarketStream([symbol], kinds=("trade", "kline_1m"), on_kline=hub.on_kline)
+        feed.start()
+    writer = StateWriter()
+    writer.start()
+    REGISTRY.collector("gridbot_writer", writer.metrics)
+    REGISTRY.path = metrics_file(symbol)
+    executor = default_executor()
+    journal = default_journal(symbol)
+    if journal is not None:
+        REGISTRY.collector("gridbot_journal", journal.metrics)
+    bot = GridBotThread(cfg, state_for(symbol), feed=feed, writer=writer, notifier=default_notifier(),
+                        executor=executor, candle_hub=hub, journal=journal)
+
+    def listen():
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                bot.stop()  # supervisor sumiu
+                return
+            if msg[0] == "stop":
+                bot.stop()
+                return
+            if msg[0] == "triggers":
+                bot.reload_triggers()
+            if msg[0] == "reload":
+                close_old_connections()
+                new = BotConfig.objects.filter(pk=msg[1]).first()
+                if new is not None and new.symbol == symbol:
+                    bot.reload_config(new)
+
+    signal.signal(signal.SIGTERM, lambda *a: bot.stop())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C chega ao grupo todo: quem para é o supervisor
+    threading.Thread(target=listen, daemon=True).start()
+    try:
+        bot.run()   # no thread principal; finish() grava estado e checkpoint
+    finally:
+        if feed is not None:
+            feed.stop()
+        if executor is not None:
+            executor.stop()
+        writer.stop()
+        default_notifier().stop()
+        REGISTRY.flush_every(0)
+
+
+class Worker:
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.proc = None
+        self.conn = None
+        self.started = 0.0
+        self.failures = 0
+        self.next_start = 0.0
+
+    def send(self, *msg):
+        try:
+            self.conn.send(msg)
+            return True
+        except (OSError, AttributeError):
+            return False
+
+
+class Supervisor:
+    """Um processo por símbolo, reiniciado com backoff exponencial quando cai.
+
+    Escuta o socket unix `runner_socket()`: o post_save do BotConfig manda o
+    símbolo e o id, e o worker recebe a config nova sem reiniciar (símbolo novo
+    ganha um worker). SIGTERM/SIGINT param todos com ("stop",), esperam o
+    finish() de cada um e só então matam o que sobrar.
+    """
+
+    def __init__(self, symbols, socket_path=None, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                 stable_after=STABLE_AFTER, spawn=None, clock=time.monotonic):
+        self.workers = {s: Worker(s) for s in symbols}
+        self.socket_path = socket_path or runner_socket()
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self.spawn = spawn or self._spawn
+        self.clock = clock
+        self.sock = None
+        self.stopping = False
+        self.restarts = 0
+
+    @staticmethod
+    def _spawn(symbol):
+        ctx = mp.get_context("spawn")   # nada de conexões/sockets herdados do pai
+        parent, child = ctx.Pipe()
+        p = ctx.Process(target=worker_main, args=(symbol, child), name=f"gridbot-{symbol}")
+        p.start()
+        child.close()
+        return p, parent
+
+    def log(self, msg):
+        print(f"[runbot] {msg}", flush=True)
+
+    # --- workers ---
+    def start_worker(self, w):
+        w.proc, w.conn = self.spawn(w.symbol)
+        w.started = self.clock()
+        self.log(f"{w.symbol}: iniciado (pid {w.proc.pid})")
+
+    def check(self):
+        now = self.clock()
+        for w in self.workers.values():
+            if w.proc is not None and not w.proc.is_alive():
+                code = w.proc.exitcode
+                # rodou tempo suficiente: a queda não conta como reincidência
+                w.failures = 0 if now - w.started >= self.stable_after else w.failures + 1
+                delay = min(self.backoff_max, self.backoff_base * (2 ** max(0, w.failures - 1)))
+                w.proc, w.conn, w.next_start = None, None, now + delay
+                self.restarts += 1
+                self.log(f"{w.symbol}: saiu (código {code}), reinicia em {delay:.0f}s")
+            if w.proc is None and not self.stopping and now >= w.next_start:
+                self.start_worker(w)
+
+    # --- notificações ---
+    def bind(self):
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.socket_path)
+
+    def handle(self, msg):
+        if msg.get("event") not in ("config", "triggers") or not msg.get("symbol"):
+            return
+        w = self.workers.get(msg["symbol"])
+        if msg["event"] == "triggers":
+            if w is not None and w.send("triggers"):
+                self.log(f"{w.symbol}: gatilhos atualizados")
+            return
+        if w is None:
+            self.workers[msg["symbol"]] = Worker(msg["symbol"])
+            self.log(f"{msg['symbol']}: símbolo novo")
+        elif w.send("reload", msg["id"]):
+            self.log(f"{w.symbol}: config #{msg['id']} enviada")
+
+    def poll(self, timeout):
+        if self.sock is None:
+            time.sleep(timeout)
+            return
+        self.sock.settimeout(timeout)
+        try:
+            data = self.sock.recv(4096)
+        except (socket.timeout, InterruptedError):
+            return
+        try:
+            self.handle(json.loads(data))
+        except ValueError:
+            pass
+
+    # --- ciclo de vida ---
+    def request_stop(self, *args):
+        self.stopping = True
+
+    def shutdown(self, timeout=STOP_TIMEOUT):
+        self.stopping = True
+        alive = [w for w in self.workers.values() if w.proc is not None and w.proc.is_alive()]
+        for w in alive:
+            w.send("stop")
+        deadline = time.monotonic() + timeout
+        for w in alive:
+            w.proc.join(max(0.1, deadline - time.monotonic()))
+            if w.proc.is_alive():
+                self.log(f"{w.symbol}: não parou em {timeout:.0f}s, SIGTERM")
+                w.proc.terminate()
+                w.proc.join(5)
+                if w.proc.is_alive():
+                    w.proc.kill()
+        if self.sock is not None:
+            self.sock.close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        self.bind()
+        self.log(f"supervisionando {', '.join(self.workers)} | socket {self.socket_path}")
+        try:
+            while not self.stopping:
+                self.check()
+                self.poll(0.5)
+        finally:
+            self.shutdown()
+            self.log("parado")
+
+
+class EngineSupervisor(Supervisor):
+    """Todos os símbolos num processo só: um MultiGridEngine (BotRegistry.start_all)
+    busca os preços num ticker em lote por volta, em vez de um worker pollando por
+    símbolo. Mesmo socket de notificações (config e gatilhos aplicados no bot,
+    símbolo novo entra no loop), mesmo backoff se o loop morrer e mesma parada.
+    """
+
+    def __init__(self, symbols, registry=None, **kw):
+        super().__init__(symbols, **kw)
+        if registry is None:
+            from .runner_registry import BotRegistry as registry
+        self.registry = registry
+        self.engine = Worker("engine")
+
+    def check(self):
+        w, now = self.engine, self.clock()
+        if w.started and not self.registry.running():
+            w.failures = 0 if now - w.started >= self.stable_after else w.failures + 1
+            delay = min(self.backoff_max, self.backoff_base * (2 ** max(0, w.failures - 1)))
+            w.started, w.next_start = 0.0, now + delay
+            self.restarts += 1
+            self.log(f"loop parou, reinicia em {delay:.0f}s")
+        if not w.started and not self.stopping and now >= w.next_start:
+            self.registry.start_all(list(self.workers))
+            w.started = now
+            self.log(f"loop único iniciado ({len(self.workers)} símbolos)")
+
+    def handle(self, msg):
+        if msg.get("event") not in ("config", "triggers") or not msg.get("symbol"):
+            return
+        symbol = msg["symbol"]
+        if msg["event"] == "triggers":
+            self.registry.reload_triggers(symbol)
+            return
+        from django.db import close_old_connections
+        from .models import BotConfig
+        close_old_connections()
+        cfg = BotConfig.objects.filter(pk=msg["id"]).first()
+        if cfg is None or cfg.symbol != symbol:
+            return
+        if symbol not in self.workers:
+            self.workers[symbol] = Worker(symbol)
+            self.registry.add(cfg)
+            self.log(f"{symbol}: símbolo novo")
+        else:
+            self.registry.reload(cfg)
+            self.log(f"{symbol}: config #{cfg.pk} aplicada")
+
+    def shutdown(self, timeout=STOP_TIMEOUT):
+        self.stopping = True
+        self.registry.stop()
+        if self.sock is not None:
+            self.sock.close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
@@ -0,0 +1,125 @@
+import os, time, itertools, tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from .backtest import COLS, CandleFeed, run_backtest
+
+SWEEP_FIELDS = ("grid_step", "atr_k_grid", "atr_n_stop", "levels_up", "levels_down")
+
+def config_fields(cfg):
+    # campos editáveis do BotConfig como dict (vai para os workers por pickle)
+    return {f.name: getattr(cfg, f.name) for f in type(cfg)._meta.concrete_fields
+            if not f.primary_key and f.name != "created_at"}
+
+def parse_range(spec, cast=float):
+    # "0.3:1.2:0.1" (início:fim:passo, fim incluso) ou "8,12,16"; ValueError se malformada
+    try:
+        if ":" in spec:
+            a, b, step = (float(x) for x in spec.split(":"))
+            if step <= 0 or b < a:
+                raise ValueError
+            n = int(round((b - a) / step)) + 1
+            vals = [cast(round(a + i * step, 10)) for i in range(n)]
+        else:
+            vals = [cast(x) for x in spec.split(",") if x.strip()]
+    except ValueError:
+        vals = []
+    if not vals:
+        raise ValueError(f"faixa inválida: {spec!r} (use início:fim:passo ou a,b,c)")
+    return vals
+
+def param_grid(ranges):
+    keys = [k for k in SWEEP_FIELDS if ranges.get(k)]
+    return [dict(zip(keys, vals)) for vals in itertools.product(*(ranges[k] for k in keys))]
+
+def evaluate(signals, cfg, first_price, last_price):
+    """Executa as sugestões do bot sobre a posição do config: cada nível cruzado
+    vende (⬆️) ou compra (⬇️) uma fatia de qty/levels; stop zera e encerra."""
+    qty = cfg.qty or 1.0
+    cash, pos = 0.0, qty
+    chunk = qty / max(1, min(cfg.levels_up, cfg.levels_down))
+    trades = 0
+    for s in signals:
+        p = s["price"]
+        if s["kind"] == "stop":
+            cash += pos * p
+            pos = 0.0
+            trades += 1
+            last_price = p
+            break
+        if s["kind"] != "grid":
+            continue
+        if s.get("up", s["message"] and "⬆️" in s["message"]):
+            q = min(chunk, pos)
+            cash += q * p
+            pos -= q
+        else:
+            q = min(chunk, cash / p) if cash > 0 else 0.0
+            cash -= q * p
+            pos += q
+        trades += q > 0
+    start_value = qty * first_price
+    equity = cash + pos * last_price
+    return {"equity": equity, "ret_pct": (equity - start_value) / start_value * 100.0,
+            "hold_pct": (last_price - first_price) / first_price * 100.0, "trades": trades}
+
+
+# --- workers: as velas chegam via np.load(mmap_mode="r"), sem cópia por processo ---
+_FEED = None
+_START = 0
+
+def _init_worker(source, start):
+    global _FEED, _START
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "polgrid.settings")
+        django.setup()
+    if isinstance(source, tuple):
+        # (root, symbol, interval): abre os arquivos do CandleStore direto
+        from .candle_store import CandleStore
+        root, symbol, interval = source
+        arr = CandleStore(root).read(symbol, interval)
+    else:
+        arr = {k: np.load(os.path.join(source, f"{k}.npy"), mmap_mode="r") for k in COLS}
+    _FEED = CandleFeed(arr)
+    _START = start
+
+def _run_one(fields):
+    from .models import BotConfig
+    cfg = BotConfig(**fields)
+    c = _FEED.a["c"]
+    signals = run_backtest(cfg, _FEED, _START, texts=False)
+    res = evaluate(signals, cfg, float(c[_START]), float(c[-1]))
+    res["signals"] = len(signals)
+    res["stops"] = sum(1 for s in signals if s["kind"] == "stop")
+    return fields, res
+
+def dump_candles(candles, data_dir):
+    for k in COLS:
+        np.save(os.path.join(data_dir, f"{k}.npy"), np.ascontiguousarray(candles[k]))
+
+def sweep(base_cfg, candles, ranges, workers=None, start=0, data_dir=None, store_src=None):
+    """Roda um backtest por combinação de `ranges` num pool de processos.
+    As velas vêm de `store_src` (root, symbol, interval) do CandleStore ou são
+    despejadas uma vez em .npy. Devolve (resultados ordenados pelo retorno, configs/s)."""
+    base = config_fields(base_cfg)
+    combos = [{**base, **p} for p in param_grid(ranges)]
+    tmp = None
+    if store_src is not None:
+        data_dir = store_src
+    elif data_dir is None:
+        tmp = tempfile.TemporaryDirectory(prefix="gridsweep-")
+        data_dir = tmp.name
+        dump_candles(candles, data_dir)
+    try:
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(data_dir, start)) as pool:
+            chunk = max(1, len(combos) // ((workers or os.cpu_count() or 1) * 8))
+            results = list(pool.map(_run_one, combos, chunksize=chunk))
+        elapsed = time.perf_counter() - t0
+    finally:
+        if tmp:
+            tmp.cleanup()
+    results.sort(key=lambda r: (-r[1]["ret_pct"], r[1]["stops"]))
+    return results, len(combos) / max(elapsed, 1e-9)
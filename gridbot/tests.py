@@ -1,3 +1,1835 @@
-from django.test import TestCase
+import asyncio, glob, io, json, random, socket, tempfile, threading, time
+from datetime import timedelta
+from unittest import mock
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
 
-# Create your tests here.
+from .backtest import replay, run_backtest
+from .bot_runner import Grid, GridBotThread, calc_atr, get_prices, shared_price, window_wait
+from .candle_store import CandleStore, shared_sync
+from .checkpoint import Checkpoint
+from .engine import MultiGridEngine
+from .execution import BUY, SELL, Executor, OrderIntent, PaperExchange, Position
+from .forms import BotConfigForm
+from .exchange import ExchangeClient, HostHealth, RateLimited, RequestError, WeightBudget
+from . import indicators
+from .indicators import StreamingATR, StreamingIndicators, shape_grid
+from . import journal
+from . import mdcache
+from .models import BotConfig, BotOrder, BotSignal, BotState, PriceTrigger, SignalRollup, latest_configs, state_for
+from .persistence import StateWriter
+from .notify import Notifier
+from . import bench
+from .runner_registry import BotRegistry
+from .supervisor import EngineSupervisor, Supervisor, notify_config_change
+from . import metrics
+from .resample import lttb, pack, resample, unpack
+from .scheduler import PollScheduler
+from .sweep import evaluate, param_grid, parse_range
+from .timeframes import CandleHub
+from .triggers import ABOVE, BELOW, Trigger, TriggerBook
+from .hysteresis import ARMED, REARM, REPEAT, TRIGGER, TRIGGERED, Dedup, StopLatch
+from . import views
+from .management.commands.prunesignals import rollup_and_prune
+from . import live
+from .market_stream import MarketStream, read_frame, write_frame, ws_accept_key, OP_TEXT, OP_CLOSE
+
+
+class ReplayWSServer(threading.Thread):
+    """Stand-in local de WebSocket: aceita conexões, registra os SUBSCRIBE
+    recebidos e reenvia ticks gravados. Cada item de `sessions` é a lista de
+    mensagens de uma conexão; ao fim da lista a conexão é derrubada."""
+
+    def __init__(self, sessions):
+        super().__init__(daemon=True)
+        self.sessions = list(sessions)
+        self.subscribes = []
+        self.srv = socket.socket()
+        self.srv.bind(("127.0.0.1", 0))
+        self.srv.listen()
+        self.url = f"ws://127.0.0.1:{self.srv.getsockname()[1]}/stream"
+
+    def _handshake(self, conn):
+        head = b""
+        while b"\r\n\r\n" not in head:
+            head += conn.recv(1024)
+        lines = head.decode().split("\r\n")
+        key = next(l.split(":", 1)[1].strip() for l in lines if l.lower().startswith("sec-websocket-key"))
+        conn.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {ws_accept_key(key)}\r\n\r\n").encode())
+
+    def run(self):
+        for msgs in self.sessions:
+            conn, _ = self.srv.accept()
+            self._handshake(conn)
+            op, payload = read_frame(conn)
+            self.subscribes.append(json.loads(payload))
+            for m in msgs:
+                write_frame(conn, OP_TEXT, json.dumps(m).encode(), mask=False)
+            write_frame(conn, OP_CLOSE, b"", mask=False)
+            conn.close()
+        self.srv.close()
+
+
+def trade(symbol, price, ts):
+    return {"stream": f"{symbol.lower()}@trade", "data": {"e": "trade", "s": symbol, "p": str(price), "T": ts}}
+
+
+class MarketStreamTests(SimpleTestCase):
+    def test_replays_ticks_and_resubscribes_after_drop(self):
+        srv = ReplayWSServer([
+            [trade("POLUSDT", 0.21, 1), trade("POLUSDT", 0.22, 2)],
+            [trade("POLUSDT", 0.23, 3)],
+        ])
+        srv.start()
+        got = []
+        done = threading.Event()
+
+        def on_tick(symbol, price, ts):
+            got.append((symbol, price))
+            if len(got) == 3:
+                done.set()
+
+        st = MarketStream(["POLUSDT"], url=srv.url, on_tick=on_tick, max_backoff=0.05)
+        st.start()
+        try:
+            self.assertTrue(done.wait(10))
+        finally:
+            st.stop()
+        self.assertEqual(got, [("POLUSDT", 0.21), ("POLUSDT", 0.22), ("POLUSDT", 0.23)])
+        self.assertEqual([s["params"] for s in srv.subscribes], [["polusdt@trade"], ["polusdt@trade"]])
+        self.assertGreaterEqual(st.reconnects, 1)
+        self.assertEqual(st.latest("POLUSDT"), 0.23)
+
+    def test_wait_price_returns_only_newer_ticks(self):
+        st = MarketStream(["POLUSDT"])
+        st._push("POLUSDT", 1.5, 1000)
+        price, seq = st.wait_price("POLUSDT", 0, timeout=0.1)
+        self.assertEqual(price, 1.5)
+        self.assertIsNone(st.wait_price("POLUSDT", seq, timeout=0.05))
+
+
+class StreamingATRTests(SimpleTestCase):
+    def _candles(self, n, seed=7):
+        rnd = random.Random(seed)
+        out, c = [], 0.25
+        for i in range(n):
+            o = c
+            c = max(0.01, o + rnd.uniform(-0.003, 0.003))
+            h = max(o, c) + rnd.uniform(0, 0.002)
+            l = min(o, c) - rnd.uniform(0, 0.002)
+            out.append({"t": i * 60_000, "o": o, "h": h, "l": l, "c": c})
+        return out
+
+    def test_matches_calc_atr_exactly(self):
+        ohlc = self._candles(200)
+        for length in (3, 14):
+            st = StreamingATR(length)
+            for i, c in enumerate(ohlc):
+                est = st.estimate(c)
+                st.update(c)
+                self.assertEqual(st.value, calc_atr(ohlc[:i + 1], length))
+                self.assertEqual(est, st.value)
+
+    def test_seed_then_update(self):
+        ohlc = self._candles(120)
+        st = StreamingATR(14)
+        st.seed(ohlc[:100])
+        for c in ohlc[100:]:
+            st.update(c)
+        self.assertEqual(st.value, calc_atr(ohlc, 14))
+        self.assertEqual(st.last_t, ohlc[-1]["t"])
+
+
+class GridTests(SimpleTestCase):
+    def _linear(self, levels, price):
+        for i in range(len(levels) - 1):
+            if levels[i] <= price < levels[i + 1]:
+                return i
+        return 0 if price < levels[0] else len(levels) - 2
+
+    def test_index_matches_linear_scan(self):
+        rnd = random.Random(3)
+        for step, up, down in ((0.6, 8, 8), (0.15, 300, 250), (2.5, 3, 0)):
+            g = Grid(0.2187, step, up, down)
+            probes = list(g.levels) + [rnd.uniform(g.levels[0] * 0.9, g.levels[-1] * 1.1) for _ in range(500)]
+            for p in probes:
+                self.assertEqual(g.index(p), self._linear(g.levels, p))
+
+    def test_asymmetric_steps_index_matches_linear_scan(self):
+        rnd = random.Random(5)
+        for step, step_down, up, down in ((0.6, 1.1, 8, 3), (1.3, 0.2, 4, 40), (0.4, 0.4, 6, 6)):
+            g = Grid(0.2187, step, up, down, step_down)
+            self.assertEqual(len(g), up + down + 1)
+            self.assertAlmostEqual(g.levels[0], 0.2187 * (1 - down * step_down / 100))
+            self.assertAlmostEqual(g.levels[-1], 0.2187 * (1 + up * step / 100))
+            probes = list(g.levels) + [rnd.uniform(g.levels[0] * 0.9, g.levels[-1] * 1.1) for _ in range(500)]
+            for p in probes:
+                self.assertEqual(g.index(p), self._linear(g.levels, p))
+
+    def test_crossed_reports_every_level(self):
+        g = Grid(100.0, 1.0, 5, 5)
+        self.assertEqual(g.crossed(100.5, 103.5), [6, 7, 8])
+        self.assertEqual(g.crossed(103.5, 100.5), [8, 7, 6])
+        self.assertEqual(g.crossed(100.2, 100.8), [])
+        self.assertEqual(g.cells_between(5, 8), [6, 7, 8])
+        self.assertEqual(g.cells_between(8, 5), [7, 6, 5])
+
+
+class IndicatorTests(SimpleTestCase):
+    def test_vectorized_matches_calc_atr_and_streaming(self):
+        rows = random_candles(600, seed=13)
+        a = {k: np.array([r[k] for r in rows]) for k in ("h", "l", "c")}
+        v = indicators.compute(a)
+        for t in (14, 15, 16, 300, 599):
+            ref = calc_atr(rows[:t + 1], 14)
+            if ref is None:
+                self.assertTrue(np.isnan(v["atr"][t]))
+            else:
+                self.assertAlmostEqual(v["atr"][t], ref, places=12)
+        st = StreamingIndicators()
+        for t, r in enumerate(rows):
+            st.update(r)
+            if t in (19, 20, 250, 599):
+                for k, x in st.values().items():
+                    self.assertAlmostEqual(x, v[k][t], places=9, msg=f"{k}@{t}")
+        self.assertTrue(0 < v["rsi"][-1] < 100)
+        self.assertTrue(v["bb_lower"][-1] < v["bb_mid"][-1] < v["bb_upper"][-1])
+        self.assertTrue(v["dc_low"][-1] <= a["l"][-20:].min() and v["dc_high"][-1] >= a["h"][-20:].max())
+
+    def test_batch_rows_match_single_series(self):
+        series = [random_candles(300, seed=s) for s in range(5)]
+        cols = {k: np.array([[r[k] for r in rows] for rows in series]) for k in ("h", "l", "c")}
+        batch = indicators.latest(cols)
+        for i, rows in enumerate(series):
+            one = indicators.latest({k: cols[k][i] for k in cols})
+            for k in one:
+                self.assertAlmostEqual(batch[k][i], one[k], places=12)
+
+    def test_shape_follows_room_to_the_bands(self):
+        bands = {"bb_upper": 1.05, "bb_lower": 0.99, "dc_high": 1.04, "dc_low": 0.985}
+        up_step, down_step, up, down = shape_grid(1.0, 0.8, 8, 8, bands)
+        self.assertEqual((up, down), (12, 4))           # 5% acima x 1.5% abaixo, preso em 75%
+        self.assertAlmostEqual(up_step, 5.0 / 12)
+        self.assertAlmostEqual(down_step, 0.4)          # 1.5%/4 = 0.375 → mínimo de metade do step base
+        self.assertEqual(shape_grid(1.0, 0.8, 8, 8, None), (0.8, 0.8, 8, 8))
+
+    def test_band_shape_editable_from_the_form(self):
+        data = {"qty": 100, "avg": 1.0, "grid_step": 1.0, "levels_up": 4, "levels_down": 4, "stop_from_avg": 5,
+                "interval": 15, "grid_shape": "bands", "bands_len": 30, "bands_k": 2.5, "stop_rearm_pct": 0.5,
+                "stop_repeat_sec": 0, "grid_hysteresis_pct": 0.05, "signal_dedup_sec": 60, "poll_min_sec": 2,
+                "poll_max_sec": 60}
+        form = BotConfigForm(data, instance=BotConfig())
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual((form.instance.grid_shape, form.instance.bands_len, form.instance.bands_k), ("bands", 30, 2.5))
+        self.assertFalse(BotConfigForm({**data, "grid_shape": "cone"}, instance=BotConfig()).is_valid())
+
+
+def random_candles(n, seed=7, start=0.25, vol=0.003, step_ms=60_000):
+    rnd = random.Random(seed)
+    out, c = [], start
+    for i in range(n):
+        o = c
+        c = max(0.01, o + rnd.uniform(-vol, vol))
+        h = max(o, c) + rnd.uniform(0, vol * 0.6)
+        l = min(o, c) - rnd.uniform(0, vol * 0.6)
+        out.append({"t": 1_700_000_040_000 + i * step_ms, "o": o, "h": h, "l": l, "c": c, "v": 100.0 + i % 7})
+    return out
+
+
+class BacktestTests(SimpleTestCase):
+    def _configs(self):
+        yield BotConfig(use_atr=False, avg=0.26, qty=100, grid_step=0.4, stop_from_avg=5)
+        yield BotConfig(use_atr=True, avg=0.25, qty=100, atr_len=14, atr_n_stop=2.0, atr_refresh_sec=30)
+        yield BotConfig(use_atr=True, avg=0.25, qty=50, atr_len=5, atr_interval="5m", atr_refresh_sec=150,
+                        levels_up=20, levels_down=20)
+        yield BotConfig(use_atr=True, avg=0.25, qty=100, atr_k_grid=1.5, grid_shape="bands", bands_len=20,
+                        levels_up=6, levels_down=6)
+
+    def test_vectorized_matches_live_logic(self):
+        candles = random_candles(1500, seed=11)
+        for cfg in self._configs():
+            for start in (0, 200):
+                ref = replay(cfg, candles, start=start)
+                fast = run_backtest(cfg, candles, start=start)
+                self.assertGreater(len(ref), 5)
+                self.assertEqual(fast, ref)
+
+
+def closes_to_candles(closes, step_ms=60_000):
+    return [{"t": 1_700_000_040_000 + i * step_ms, "o": closes[max(0, i - 1)], "h": max(c, closes[max(0, i - 1)]),
+             "l": min(c, closes[max(0, i - 1)]), "c": c, "v": 1.0} for i, c in enumerate(closes)]
+
+
+class SweepTests(TestCase):
+    def test_parse_range_and_grid(self):
+        self.assertEqual(parse_range("0.3:0.6:0.1"), [0.3, 0.4, 0.5, 0.6])
+        self.assertEqual(parse_range("8,12, 16", int), [8, 12, 16])
+        for bad in ("0.3:0.6", "1:0:0.1", "0.3:0.6:0", "a,b", ",", "8.5"):
+            with self.assertRaises(ValueError):
+                parse_range(bad, int if bad == "8.5" else float)
+        grid = param_grid({"levels_up": [4, 6], "grid_step": [0.5, 1.0], "atr_k_grid": []})
+        self.assertEqual(grid, [{"grid_step": 0.5, "levels_up": 4}, {"grid_step": 0.5, "levels_up": 6},
+                                {"grid_step": 1.0, "levels_up": 4}, {"grid_step": 1.0, "levels_up": 6}])
+        self.assertEqual(param_grid({}), [{}])
+
+    def test_evaluate_backtest_signals(self):
+        cfg = BotConfig(use_atr=False, avg=1.0, qty=10, grid_step=1.0, levels_up=5, levels_down=5, stop_from_avg=3,
+                        grid_hysteresis_pct=0, signal_dedup_sec=0)
+        signals = run_backtest(cfg, closes_to_candles([1.0, 1.011, 1.0, 0.989, 0.96, 0.95]), texts=False)
+        self.assertEqual([s["kind"] for s in signals][:6], ["startup", "grid", "grid", "grid", "grid", "stop"])
+        res = evaluate(signals, cfg, 1.0, 0.95)
+        # vende 2 em 1.011, recompra 2 em 1.0, o troco compra em 0.989 e o stop vende tudo em 0.96
+        self.assertAlmostEqual(res["equity"], (10 + 0.022 / 0.989) * 0.96)
+        self.assertAlmostEqual(res["hold_pct"], -4.0)
+        self.assertEqual(res["trades"], 4)
+
+    def test_command_sweeps_in_pool_and_saves(self):
+        base = BotConfig.objects.create(symbol="POLUSDT", use_atr=False, avg=0.25, qty=100, stop_from_avg=5)
+        out = io.StringIO()
+        with tempfile.TemporaryDirectory() as d:
+            path = f"{d}/candles.json"
+            with open(path, "w") as f:
+                json.dump(random_candles(600, seed=3), f)
+            call_command("gridsweep", path, "--grid-step", "0.3,0.6", "--levels-up", "4:6:2", "--workers", "2",
+                         "--save", stdout=out)
+            with self.assertRaises(CommandError):
+                call_command("gridsweep", path, "--grid-step", "1:0:0.1", stdout=io.StringIO())
+        text = out.getvalue()
+        self.assertIn("4 configs", text)
+        best = BotConfig.objects.exclude(pk=base.pk).get()
+        self.assertIn(best.grid_step, (0.3, 0.6))
+        self.assertIn(best.levels_up, (4, 6))
+        self.assertEqual((best.symbol, best.qty), ("POLUSDT", 100))
+        self.assertIn(f"grid_step={best.grid_step} levels_up={best.levels_up}", text.splitlines()[1])
+
+
+class HysteresisTests(SimpleTestCase):
+    def test_latch_and_grid_band(self):
+        latch = StopLatch(rearm_pct=1.0, repeat_sec=300)
+        events = [latch.update(p, 0.95, t) for t, p in enumerate([0.96, 0.95, 0.94, 0.951, 0.955, 0.94], start=1)]
+        self.assertEqual(events, [None, TRIGGER, None, None, None, None])
+        self.assertEqual(latch.update(0.94, 0.95, 302), REPEAT)     # 300s depois do disparo
+        self.assertEqual(latch.update(0.96, 0.95, 303), REARM)
+        self.assertEqual((latch.state, latch.update(0.95, 0.95, 304)), (ARMED, TRIGGER))
+        self.assertEqual(StopLatch(state=TRIGGERED).update(0.9, 0.95, 0), None)   # restaurado: sem repetir
+
+        g = Grid(1.0, 1.0, 2, 2)
+        last = g.index(1.0005)
+        self.assertEqual(g.settle(0.9998, last, 0.0005), last)       # dentro da banda: fica
+        self.assertEqual(g.settle(0.9990, last, 0.0005), last - 1)
+        self.assertEqual(g.settle(1.0003, last - 1, 0.0005), last - 1)
+        self.assertEqual(g.settle(1.0006, last - 1, 0.0005), last)
+        self.assertEqual(g.settle(0.9998, last, 0.0), g.index(0.9998))
+
+        d = Dedup(60)
+        self.assertEqual([d.allow("a", t) for t in (0, 30, 59, 60, 61)], [True, False, False, True, False])
+        self.assertEqual(d.suppressed, 3)
+
+    def test_long_stop_out_is_one_event(self):
+        closes = [1.0] + [0.94 + 0.002 * (i % 3 - 1) for i in range(3000)] + [0.96, 0.94]
+        candles = closes_to_candles(closes)
+        cfg = BotConfig(use_atr=False, avg=1.0, qty=100, grid_step=10, stop_from_avg=5)
+        ref = replay(cfg, candles)
+        self.assertEqual(sum(s["kind"] == "stop" for s in ref), 2)   # uma vez, rearma acima de 0.95475
+        self.assertEqual(run_backtest(cfg, candles), ref)
+
+        cfg.stop_repeat_sec = 600
+        ref = replay(cfg, candles)
+        self.assertEqual(sum(s["kind"] == "stop" for s in ref), 2 + 2999 // 10)
+        self.assertEqual(run_backtest(cfg, candles), ref)
+
+    def test_oscillation_is_deduplicated(self):
+        candles = closes_to_candles([1.0] + [0.998 if i % 2 == 0 else 1.002 for i in range(100)])
+        cfg = BotConfig(use_atr=False, avg=1.0, qty=100, grid_step=1.0, stop_from_avg=50, signal_dedup_sec=600)
+        ref = replay(cfg, candles)
+        self.assertEqual(sum(s["kind"] == "grid" for s in ref), 20)  # cada sentido uma vez a cada 10 min
+        self.assertEqual(run_backtest(cfg, candles), ref)
+        cfg.grid_hysteresis_pct = 0.5                                # banda maior que a oscilação
+        self.assertEqual(sum(s["kind"] == "grid" for s in run_backtest(cfg, candles)), 0)
+
+
+class CandleStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = CandleStore(self.tmp.name)
+        self.upstream = random_candles(3000)
+        self.calls = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fetch(self, symbol, interval, limit=300, start_time=None):
+        self.calls.append((limit, start_time))
+        rows = [r for r in self.upstream if start_time is None or r["t"] >= start_time]
+        return rows[:limit] if start_time is not None else rows[-limit:]
+
+    def test_sync_fetches_only_missing_tail(self):
+        now = self.upstream[2000]["t"] + 30_000  # vela 2000 em formação
+        self.upstream = self.upstream[:2001]
+        added, live = self.store.sync("POLUSDT", "1m", backfill=500, now_ms=now, fetch=self.fetch)
+        self.assertEqual((added, live["t"]), (499, self.upstream[2000]["t"]))
+
+        self.upstream = random_candles(3000)[:2101]
+        now = self.upstream[2100]["t"] + 1
+        self.calls.clear()
+        added, live = self.store.sync("POLUSDT", "1m", now_ms=now, fetch=self.fetch)
+        self.assertEqual(added, 100)
+        self.assertEqual(self.calls[0][1], self.upstream[2000]["t"])
+        a = self.store.read("POLUSDT", "1m")
+        self.assertEqual(len(a["t"]), 599)
+        self.assertEqual(a["c"][-1], self.upstream[2099]["c"])
+        self.assertEqual(self.store.tail("POLUSDT", "1m", 3)[-1]["t"], self.upstream[2099]["t"])
+
+    def test_torn_append_is_repaired(self):
+        self.store.append("POLUSDT", "1m", self.upstream[:10])
+        with open(self.store._file("POLUSDT", "1m", "o"), "ab") as f:
+            f.write(b"\0" * 8)  # coluna a mais de um append interrompido
+        self.assertEqual(self.store.count("POLUSDT", "1m"), 10)
+        self.assertEqual(self.store.append("POLUSDT", "1m", self.upstream[5:12]), 2)
+        a = self.store.read("POLUSDT", "1m", start=self.upstream[8]["t"])
+        self.assertEqual(a["o"].tolist(), [r["o"] for r in self.upstream[8:12]])
+
+
+class StateWriterTests(TestCase):
+    def test_coalesces_state_and_batches_signals(self):
+        st = BotState.objects.create()
+        w = StateWriter()
+        for i in range(50):
+            w.update_state(BotState, st.pk, last_level_idx=i, trailing_high=1.0 + i)
+        w.update_state(BotState, st.pk, running=True)
+        for i in range(30):
+            w.add_signal(symbol="POLUSDT", kind="grid", message=f"m{i}", price=float(i))
+        self.assertEqual(w.queue_depth(), 31)
+        with self.assertNumQueries(4):  # savepoint + bulk_create + update + release
+            self.assertEqual(w.flush(), 31)
+        st.refresh_from_db()
+        self.assertEqual((st.last_level_idx, st.trailing_high, st.running), (49, 50.0, True))
+        self.assertEqual(BotSignal.objects.count(), 30)
+        self.assertEqual(w.metrics()["queue_depth"], 0)
+        self.assertEqual(w.flush(), 0)
+
+    def test_stop_flushes_last_batch_in_caller(self):
+        w = StateWriter(flush_interval=60)
+        w.start()
+        self.addCleanup(w.stop)
+        w.add_signal(symbol="POLUSDT", kind="grid", message="m", price=1.0)
+        w.stop()
+        self.assertFalse(w.is_alive())
+        self.assertEqual((BotSignal.objects.count(), w.errors, w.flushes), (1, 0, 1))
+
+
+class CheckpointTests(SimpleTestCase):
+    def test_writes_only_on_change_and_reads_legacy(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = f"{d}/grid_state.json"
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"ref_price": 0.2187, "last_level_idx": 10, "trailing_high": 0.2227}, f)
+            cp = Checkpoint(path, legacy_symbol="POLUSDT")
+            self.assertEqual(cp.get("POLUSDT")["last_level_idx"], 10)
+            self.assertFalse(cp.save())
+            cp.put("POLUSDT", {"ref_price": 0.2187, "last_level_idx": 10, "trailing_high": 0.2227})
+            self.assertFalse(cp.save())
+            cp.put("ETHUSDT", {"ref_price": 3000.0, "last_level_idx": 4, "trailing_high": 3010.0})
+            self.assertTrue(cp.save())
+            self.assertFalse(cp.save())
+            again = Checkpoint(path)
+            self.assertEqual(again.get("ETHUSDT")["last_level_idx"], 4)
+            self.assertEqual(again.get("POLUSDT")["ref_price"], 0.2187)
+
+    def test_workers_sharing_the_file_keep_each_others_symbols(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = f"{d}/grid_state.json"
+            a, b = Checkpoint(path), Checkpoint(path)  # um por processo do runbot
+            a.put("POLUSDT", {"last_level_idx": 1})
+            b.put("ETHUSDT", {"last_level_idx": 2})
+            a.save()
+            b.save()
+            a.put("POLUSDT", {"last_level_idx": 3})
+            a.save()
+            disk = Checkpoint(path)
+            self.assertEqual((disk.get("POLUSDT"), disk.get("ETHUSDT")), ({"last_level_idx": 3}, {"last_level_idx": 2}))
+
+
+class StubExchange(ThreadingHTTPServer):
+    """Stand-in HTTP local da Binance: responde ticker com peso usado configurável."""
+
+    def __init__(self):
+        self.hits = 0
+        self.used_weight = 10
+        self.status = 200
+        outer = self
+
+        class H(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                outer.hits += 1
+                body = json.dumps({"code": -1121, "msg": "Invalid symbol."} if outer.status == 400
+                                  else {"symbol": "POLUSDT", "price": "0.2187"}).encode()
+                self.send_response(outer.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("X-MBX-USED-WEIGHT-1M", str(outer.used_weight))
+                if outer.status == 429:
+                    self.send_header("Retry-After", "30")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        super().__init__(("127.0.0.1", 0), H)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class ExchangeClientTests(SimpleTestCase):
+    def setUp(self):
+        self.srv = StubExchange()
+        dead = socket.socket()
+        dead.bind(("127.0.0.1", 0))
+        self.dead_url = f"http://127.0.0.1:{dead.getsockname()[1]}"
+        dead.close()  # porta fechada: conexão recusada
+
+    def tearDown(self):
+        self.srv.shutdown()
+        self.srv.server_close()
+
+    def test_failover_breaker_and_ordering(self):
+        cli = ExchangeClient(hosts=[self.dead_url, self.srv.url], timeout=(1, 2))
+        for _ in range(5):
+            self.assertEqual(cli.get_json("/api/v3/ticker/price", {"symbol": "POLUSDT"})["price"], "0.2187")
+        dead, good = cli.hosts
+        self.assertEqual(cli.ordered_hosts()[0].host, self.srv.url)
+        self.assertEqual(dead.errors, 1)  # depois da primeira falha o host morto vai para o fim da fila
+        self.assertEqual(good.requests, 5)
+
+    def test_breaker_opens_and_backs_off(self):
+        h = HostHealth("x", fail_threshold=3, base_cooldown=10)
+        for _ in range(3):
+            h.fail(1000.0)
+        self.assertTrue(h.is_open(1005.0))
+        self.assertFalse(h.is_open(1010.0))
+        for _ in range(3):
+            h.fail(1010.0)
+        self.assertTrue(h.is_open(1029.0))  # cooldown dobrou
+        h.ok(0.05)
+        self.assertEqual((h.consecutive, h.trips), (0, 0))
+
+    def test_weight_budget_follows_exchange_header(self):
+        cli = ExchangeClient(hosts=[self.srv.url], budget=WeightBudget(limit=100))
+        self.srv.used_weight = 95
+        cli.get_json("/api/v3/ticker/price", weight=2)
+        with self.assertRaises(RateLimited):
+            cli.get_json("/api/v3/ticker/price", weight=10)
+        self.assertEqual(self.srv.hits, 1)
+
+    def test_429_blocks_all_hosts(self):
+        cli = ExchangeClient(hosts=[self.srv.url])
+        self.srv.status = 429
+        with self.assertRaises(RateLimited):
+            cli.get_json("/api/v3/ticker/price")
+        self.srv.status = 200
+        with self.assertRaises(RateLimited):
+            cli.get_json("/api/v3/ticker/price")
+        self.assertEqual(self.srv.hits, 1)
+
+    def test_client_error_does_not_fail_hosts(self):
+        # símbolo inválido no ticker em lote: erro do pedido, sem rodar hosts nem abrir breaker
+        cli = ExchangeClient(hosts=[self.srv.url, self.srv.url])
+        self.srv.status = 400
+        for _ in range(4):
+            with self.assertRaisesRegex(RequestError, "Invalid symbol"):
+                cli.get_json("/api/v3/ticker/price", {"symbols": '["XXXUSDT"]'})
+        self.assertEqual(self.srv.hits, 4)
+        self.assertEqual([h.errors for h in cli.hosts], [0, 0])
+        self.assertFalse(any(h.is_open(time.time()) for h in cli.hosts))
+        self.srv.status = 500
+        with self.assertRaises(RuntimeError):
+            cli.get_json("/api/v3/ticker/price")
+        self.assertEqual(([h.errors for h in cli.hosts], self.srv.hits), ([1, 1], 6))
+
+
+class StubTelegram(ThreadingHTTPServer):
+    """sendMessage local: guarda (token, chat, texto) e responde 429 nas primeiras `throttle` chamadas."""
+
+    def __init__(self, throttle=0, retry_after=1, status=200):
+        self.messages = []
+        self.status = status
+        self.calls = 0
+        self.throttle = throttle
+        self.retry_after = retry_after
+        outer = self
+
+        class H(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                from urllib.parse import parse_qs
+                form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+                outer.calls += 1
+                if outer.calls <= outer.throttle:
+                    status, body = 429, {"ok": False, "parameters": {"retry_after": outer.retry_after}}
+                else:
+                    token = self.path.split("/")[1][3:]
+                    outer.messages.append((token, form["chat_id"][0], form["text"][0]))
+                    status, body = outer.status, {"ok": outer.status == 200}
+                raw = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args):
+                pass
+
+        super().__init__(("127.0.0.1", 0), H)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class NotifierTests(SimpleTestCase):
+    def wait_for(self, cond, timeout=5.0):
+        end = time.time() + timeout
+        while not cond() and time.time() < end:
+            time.sleep(0.02)
+        return cond()
+
+    def test_digest_merges_burst_per_key(self):
+        srv = StubTelegram()
+        n = Notifier([("tok", "1")], api=srv.url, digest_window=0.2, per_chat_interval=0)
+        n.start()
+        try:
+            t0 = time.perf_counter()
+            for i in range(20):
+                n.notify(f"nível {i}", digest_key="POLUSDT grid")
+            n.notify("stop")
+            self.assertLess(time.perf_counter() - t0, 0.05)  # notify nunca espera a rede
+            self.assertTrue(self.wait_for(lambda: len(srv.messages) == 2))
+        finally:
+            n.stop()
+            srv.shutdown()
+        texts = [m[2] for m in srv.messages]
+        self.assertEqual(texts[0], "stop")
+        self.assertIn("20 alertas (POLUSDT grid)", texts[1])
+        self.assertIn("nível 19", texts[1])
+
+    def test_429_waits_retry_after_and_fans_out(self):
+        srv = StubTelegram(throttle=1, retry_after=0.3)
+        n = Notifier([("tok", "1"), ("tok2", "2")], api=srv.url, per_chat_interval=0)
+        n.start()
+        try:
+            t0 = time.time()
+            n.notify("oi")
+            self.assertTrue(self.wait_for(lambda: len(srv.messages) == 2))
+        finally:
+            n.stop()
+            srv.shutdown()
+        self.assertEqual(sorted(m[:2] for m in srv.messages), [("tok", "1"), ("tok2", "2")])
+        m = n.metrics()
+        self.assertEqual((m["sent"], m["retries"], m["failed"], m["queue_depth"]), (2, 1, 0, 0))
+        self.assertGreaterEqual(m["latency_max_ms"], 300)
+        self.assertGreaterEqual(time.time() - t0, 0.3)
+
+    def test_failures_never_log_the_token(self):
+        srv = StubTelegram(status=401)
+        token = "123456:SEGREDO"
+        out = io.StringIO()
+        try:
+            with mock.patch("sys.stdout", out):
+                self.assertEqual(Notifier([(token, "1")], api=srv.url)._send((token, "1"), "oi"), 0.0)
+                # conexão recusada: a mensagem do requests traz a URL com o token
+                self.assertEqual(Notifier([(token, "1")], api="http://127.0.0.1:9")._send((token, "1"), "oi"), 0.0)
+        finally:
+            srv.shutdown()
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertRegex(lines[0], r"^\[\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\] Telegram falhou \(1\): HTTP 401$")
+        self.assertNotIn("SEGREDO", out.getvalue())
+
+    def test_queue_is_bounded(self):
+        n = Notifier([("tok", "1")], api="http://127.0.0.1:9", max_queue=3)  # não iniciado
+        for i in range(5):
+            n.notify(str(i))
+        self.assertEqual(n.metrics()["queue_depth"], 3)
+        self.assertEqual(n.metrics()["dropped"], 2)
+
+
+class LiveHubTests(SimpleTestCase):
+    def make_hub(self, **kw):
+        self.db = {"state": {f: None for f in live.STATE_FIELDS}, "signals": [], "candles": [], "reads": 0}
+
+        def fetch_state():
+            self.db["reads"] += 1
+            return dict(self.db["state"])
+
+        def fetch_signals(after_id):
+            rows = self.db["signals"]
+            return rows[-20:] if after_id is None else [s for s in rows if s["id"] > after_id]
+
+        return live.LiveHub(poll=0.01, fetch_state=fetch_state, fetch_signals=fetch_signals,
+                            fetch_candles=lambda sym, itv: list(self.db["candles"]), **kw)
+
+    @staticmethod
+    def drain(q):
+        out = []
+        while not q.empty():
+            out.append(q.get_nowait())
+        return out
+
+    async def test_deltas_fan_out_once_per_poll(self):
+        hub = self.make_hub()
+        hub._run = lambda: asyncio.sleep(0)  # poll manual
+        clients = [hub.subscribe() for _ in range(50)]
+        self.db["signals"] = [{"id": 1, "kind": "startup", "message": "on"}]
+        await hub.poll_once()
+        self.drain(clients[0])
+        for q in clients[1:]:
+            self.drain(q)
+
+        self.db["state"]["last_price"] = 0.25
+        self.db["signals"].append({"id": 2, "kind": "grid", "message": "x"})
+        self.db["candles"] = [{"t": 0, "close": 0.25}]
+        await hub.poll_once()
+        msgs = self.drain(clients[7])
+        self.assertEqual(msgs[0], 'event: state\ndata: {"last_price":0.25}\n\n')  # só o campo que mudou
+        self.assertTrue(msgs[1].startswith("id: 2\nevent: signal"))
+        self.assertTrue(msgs[2].startswith("event: candle"))
+        await hub.poll_once()
+        self.assertEqual(self.drain(clients[7]), [])  # nada mudou, nada enviado
+        self.assertEqual(self.db["reads"], 3)         # 50 clientes, uma leitura por poll
+
+        late = hub.subscribe(last_id=1)  # snapshot do cache, só sinais depois do Last-Event-ID
+        kinds = [m.split("event: ")[1].split("\n")[0] for m in self.drain(late)]
+        self.assertEqual(kinds, ["state", "signal", "candle"])
+        self.assertEqual(self.db["reads"], 3)
+
+    async def test_slow_client_is_dropped_and_poller_stops(self):
+        hub = self.make_hub(queue_size=2)
+        slow, fast = hub.subscribe(), hub.subscribe()
+        for i in range(4):
+            self.db["state"]["last_price"] = float(i)
+            await asyncio.sleep(0.03)
+            self.drain(fast)
+        self.assertNotIn(slow, hub.clients)
+        self.assertIsNone(self.drain(slow)[-1])  # fecha o stream
+        self.assertGreaterEqual(hub.dropped, 1)
+        task = hub._task
+        hub.unsubscribe(fast)
+        await asyncio.sleep(0.02)
+        self.assertTrue(task.cancelled())
+
+
+class LiveStreamViewTests(TestCase):
+    def test_wsgi_gets_204_for_polling_fallback(self):
+        self.assertEqual(self.client.get("/api/live/").status_code, 204)
+
+    async def test_asgi_streams_snapshot(self):
+        await BotSignal.objects.acreate(kind="startup", message="on")
+        live._hub = live.LiveHub(poll=0.01, fetch_candles=lambda sym, itv: [])
+        resp = await AsyncClient().get("/api/live/")
+        self.assertEqual(resp["Content-Type"], "text/event-stream")
+        chunks = resp.streaming_content.__aiter__()
+        body = ""
+        while "event: signal" not in body:
+            body += (await asyncio.wait_for(chunks.__anext__(), 2)).decode()
+        await chunks.aclose()
+        self.assertIn("event: state", body)
+
+    def test_state_follows_the_panel_symbol(self):
+        BotState.objects.create(symbol="POLUSDT", ref_price=0.25)          # linha legada (pk=1)
+        state_for("ETHUSDT")
+        BotState.objects.filter(symbol="ETHUSDT").update(ref_price=2000.0)
+        BotConfig.objects.create(symbol="ETHUSDT")
+        self.assertEqual(self.client.get("/api/state/").json()["ref_price"], 2000.0)
+        self.assertEqual(self.client.get("/api/state/", {"symbol": "polusdt"}).json()["ref_price"], 0.25)
+        self.assertEqual(live.db_state()["ref_price"], 2000.0)
+        self.assertEqual(BotState.objects.count(), 2)
+
+
+class SignalsApiTests(TestCase):
+    def setUp(self):
+        for i in range(30):
+            BotSignal.objects.create(kind="grid" if i % 3 else "stop", message=f"s{i}", price=0.2 + i / 1000,
+                                     symbol="POLUSDT" if i < 25 else "ETHUSDT")
+        self.ids = list(BotSignal.objects.order_by("id").values_list("id", flat=True))
+
+    def get(self, **params):
+        return self.client.get("/api/signals/", params)
+
+    def test_default_is_latest_20(self):
+        data = self.get().json()
+        self.assertEqual([s["id"] for s in data], self.ids[::-1][:20])
+
+    def test_cursor_filters_and_etag(self):
+        r = self.get(since_id=self.ids[20], symbol="polusdt")
+        self.assertEqual([s["id"] for s in r.json()], self.ids[21:25][::-1])
+        self.assertEqual(r["X-Last-Id"], str(self.ids[24]))
+        again = self.client.get("/api/signals/", {"since_id": self.ids[20], "symbol": "polusdt"},
+                                HTTP_IF_NONE_MATCH=r["ETag"])
+        self.assertEqual(again.status_code, 304)
+        BotSignal.objects.create(kind="grid", message="novo")
+        fresh = self.client.get("/api/signals/", {"since_id": self.ids[20], "symbol": "polusdt"},
+                                HTTP_IF_NONE_MATCH=r["ETag"])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(fresh.json()[0]["message"], "novo")
+
+        stops = self.get(kind="stop", limit=100).json()
+        self.assertEqual({s["kind"] for s in stops}, {"stop"})
+        self.assertEqual(len(stops), 10)
+        self.assertEqual(self.get(since_id="x").status_code, 400)
+
+    def test_cursor_pages_oldest_first_when_behind(self):
+        # atraso maior que limit: não pula linhas, devolve as próximas em ordem
+        data = self.get(since_id=self.ids[0], limit=5).json()
+        self.assertEqual([s["id"] for s in data], self.ids[1:6][::-1])
+
+    def test_time_range(self):
+        old = timezone.now() - timedelta(days=40)
+        BotSignal.objects.filter(id__lte=self.ids[9]).update(created_at=old)
+        cut = int((old + timedelta(days=1)).timestamp() * 1000)
+        self.assertEqual(len(self.get(to=cut, limit=100).json()), 10)
+        self.assertEqual(len(self.get(**{"from": cut, "limit": 100}).json()), 20)
+
+    def test_rollup_and_prune(self):
+        old = timezone.now() - timedelta(days=40)
+        BotSignal.objects.filter(id__lte=self.ids[9]).update(created_at=old)
+        rolled, deleted = rollup_and_prune(30, batch=3)
+        self.assertEqual((rolled, deleted), (10, 10))
+        self.assertEqual(BotSignal.objects.count(), 20)
+        self.assertEqual(sum(r.count for r in SignalRollup.objects.all()), 10)
+        grid = SignalRollup.objects.get(kind="grid")
+        self.assertAlmostEqual(grid.max_price, 0.208)
+        self.assertEqual(rollup_and_prune(30), (0, 0))
+
+
+class ResampleTests(SimpleTestCase):
+    def test_resample_matches_naive_aggregation(self):
+        rows = random_candles(500)
+        a = {k: np.array([r[k] for r in rows]) for k in ("t", "o", "h", "l", "c", "v")}
+        out = resample(a, 7 * 60_000)
+        for i, t in enumerate(out["t"].tolist()):
+            b = [r for r in rows if r["t"] - r["t"] % 420_000 == t]
+            self.assertEqual((out["o"][i], out["c"][i]), (b[0]["o"], b[-1]["c"]))
+            self.assertEqual((out["h"][i], out["l"][i]), (max(r["h"] for r in b), min(r["l"] for r in b)))
+            self.assertAlmostEqual(out["v"][i], sum(r["v"] for r in b))
+
+    def test_lttb_keeps_shape(self):
+        x = np.arange(10_000)
+        y = np.sin(x / 500.0)
+        y[6_123] = 5.0  # pico isolado tem de sobreviver
+        idx = lttb(x, y, 400)
+        self.assertEqual(len(idx), 400)
+        self.assertEqual((idx[0], idx[-1]), (0, 9_999))
+        self.assertIn(6_123, idx.tolist())
+        self.assertTrue((np.diff(idx) > 0).all())
+
+    def test_binary_roundtrip(self):
+        rows = random_candles(50)
+        a = {k: np.array([r[k] for r in rows]) for k in ("t", "o", "h", "l", "c", "v")}
+        a["c"][0] = 98_765.4321                     # preço alto: float32 perderia as casas decimais
+        buf = pack(a)
+        self.assertEqual(len(buf), 16 + 50 * (5 * 8 + 4))
+        b = unpack(buf)
+        self.assertEqual(b["t"].tolist(), a["t"].tolist())
+        self.assertEqual(b["c"].tolist(), a["c"].tolist())
+        np.testing.assert_allclose(b["v"], a["v"], rtol=1e-6)
+
+
+class KlinesProxyTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = CandleStore(self.tmp.name)
+        now = int(time.time() * 1000)
+        self.rows = random_candles(3 * 1440, step_ms=60_000)
+        t0 = now - now % 60_000 - len(self.rows) * 60_000
+        for i, r in enumerate(self.rows):
+            r["t"] = t0 + i * 60_000
+        self.store.append("POLUSDT", "1m", self.rows)
+        # corretora fora: tudo sai do store, sem dado inventado
+        self.patches = [mock.patch.object(views, "default_store", return_value=self.store),
+                        mock.patch.object(CandleStore, "sync", side_effect=RuntimeError("offline"))]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def test_multi_day_range_resampled_and_downsampled(self):
+        r = self.client.get("/api/klines/", {"interval": "15m", "start": self.rows[0]["t"], "format": "cols"})
+        k = r.json()
+        self.assertEqual(len(k["t"]), 3 * 96 + (self.rows[0]["t"] % 900_000 != 0))
+        self.assertEqual(k["c"][-1], self.rows[-1]["c"])
+        bin_ = self.client.get("/api/klines/", {"interval": "1m", "limit": 5000, "width": 600, "format": "bin"})
+        a = unpack(bin_.content)
+        self.assertEqual(len(a["t"]), 600)
+        self.assertEqual(int(a["t"][-1]), self.rows[-1]["t"])
+        self.assertEqual(a["c"][-1], self.rows[-1]["c"])
+        self.assertEqual(len(bin_.content), 16 + 600 * 44)
+
+    def test_legacy_rows_and_errors(self):
+        data = self.client.get("/api/klines/", {"limit": 3}).json()
+        self.assertEqual(data[-1], {"t": self.rows[-1]["t"], "close": self.rows[-1]["c"]})
+        self.assertEqual(self.client.get("/api/klines/", {"interval": "7x"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/klines/", {"symbol": "DOGEUSDT"}).status_code, 400)
+        BotConfig.objects.create(symbol="ETHUSDT")
+        self.assertEqual(self.client.get("/api/klines/", {"symbol": "ETHUSDT"}).status_code, 503)
+        for w in ("2", "0", "-5"):
+            self.assertEqual(self.client.get("/api/klines/", {"limit": 50, "width": w}).status_code, 400)
+        self.assertEqual(len(self.client.get("/api/klines/", {"limit": 50, "width": 3}).json()), 3)
+
+    def test_empty_store_backfills_from_requested_start(self):
+        empty = CandleStore(f"{self.tmp.name}/vazio")
+        start = int(time.time() * 1000) - 2 * 86_400_000
+        calls = []
+
+        def sync(symbol, interval, backfill=1000, **kw):
+            calls.append((interval, backfill))
+            return 0, None
+        with mock.patch.object(views, "default_store", return_value=empty), \
+                mock.patch.object(CandleStore, "sync", side_effect=sync):
+            r = self.client.get("/api/klines/", {"interval": "1m", "start": start, "end": start + 86_400_000})
+        # faixa de ontem: baixa desde o início pedido (2 dias até agora), não as últimas 1440 velas
+        self.assertEqual(calls[0][0], "1m")
+        self.assertGreaterEqual(calls[0][1], 2 * 1440)
+        self.assertEqual(r.status_code, 503)  # nada chegou da corretora: o store não cobre a faixa
+
+
+class MetricsTests(TestCase):
+    def test_histogram_and_prometheus_text(self):
+        reg = metrics.Registry()
+        for v in (0.002, 0.003, 0.004, 0.2):
+            reg.observe("gridbot_stage_seconds", v, stage="db", symbol="POLUSDT")
+        reg.inc("gridbot_http_requests_total", host="https://api.binance.com", outcome="error")
+        h = reg.hists[("gridbot_stage_seconds", (("stage", "db"), ("symbol", "POLUSDT")))]
+        self.assertEqual((h.quantile(0.5), h.quantile(0.95)), (0.005, 0.25))
+        text = metrics.render([reg.snapshot()])
+        self.assertIn("# TYPE gridbot_stage_seconds histogram", text)
+        self.assertIn('gridbot_stage_seconds_bucket{le="0.005",stage="db",symbol="POLUSDT"} 3', text)
+        self.assertIn('gridbot_stage_seconds_bucket{le="+Inf",stage="db",symbol="POLUSDT"} 4', text)
+        self.assertIn('gridbot_http_requests_total{host="https://api.binance.com",outcome="error"} 1', text)
+
+    def test_render_merges_duplicate_series(self):
+        a, b = metrics.Registry(), metrics.Registry()
+        for reg, q in ((a, 3), (b, 7)):
+            reg.inc("gridbot_http_requests_total", host="h", outcome="ok")
+            reg.observe("gridbot_http_seconds", 0.002, host="h")
+            reg.set("gridbot_writer_queue_depth", q)
+        text = metrics.render([a.snapshot(), b.snapshot()])
+        lines = [l for l in text.splitlines() if not l.startswith("#")]
+        self.assertEqual(len(lines), len(set(l.rsplit(" ", 1)[0] for l in lines)))  # sem série repetida
+        self.assertIn('gridbot_http_requests_total{host="h",outcome="ok"} 2', lines)
+        self.assertIn('gridbot_http_seconds_count{host="h"} 2', lines)
+        self.assertEqual(sum(l.startswith("gridbot_writer_queue_depth") for l in lines), 1)
+
+    def test_bot_tick_is_timed_per_stage(self):
+        cfg = BotConfig(use_atr=False, grid_step=1.0)
+        bot = GridBotThread(cfg, None, notifier=Notifier([("tok", "1")], api="http://127.0.0.1:9"))  # só enfileira
+        bot.metrics = reg = metrics.Registry()
+        bot._update_state = lambda **f: None
+        bot._write_signal = lambda *a: None
+        bot._save_json = lambda: None
+        bot._load_json = lambda: {}
+        bot.start_bot(1.0)
+        bot.on_tick(1.035)  # cruza 3 níveis
+        stages = {dict(l)["stage"]: h.count for (n, l), h in reg.hists.items() if n == "gridbot_stage_seconds"}
+        self.assertEqual(stages["tick"], 1)
+        self.assertEqual(stages["grid"], 1)
+        self.assertEqual(stages["alert"], 4)  # startup + 3 níveis
+        lat = reg.hists[("gridbot_tick_to_signal_seconds", (("symbol", "POLUSDT"),))]
+        self.assertEqual(lat.count, 3)
+        self.assertEqual(reg.counters[("gridbot_signals_total", (("kind", "grid"), ("symbol", "POLUSDT")))], 3)
+
+    def test_web_serves_runner_snapshot(self):
+        reg = metrics.Registry()
+        reg.observe("gridbot_loop_drift_seconds", 1.5, symbol="POLUSDT")
+        with tempfile.TemporaryDirectory() as d:
+            path = f"{d}/metrics.json"
+            snap = reg.snapshot()
+            snap["pid"] = -1  # outro processo
+            with open(path, "w") as f:
+                json.dump(snap, f)
+            with override_settings(METRICS_FILE=path):
+                text = self.client.get("/metrics").content.decode()
+                panel = self.client.get("/api/metrics/").json()
+        self.assertIn('gridbot_loop_drift_seconds_count{process="runner",symbol="POLUSDT"} 1', text)
+        drift = [h for h in panel["histograms"] if h["name"] == "gridbot_loop_drift_seconds"]
+        self.assertEqual(drift[0]["p95_ms"], 2500.0)
+
+    def test_worker_snapshots_labelled_by_symbol(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = f"{d}/metrics.json"
+            with override_settings(METRICS_FILE=path):
+                for sym, depth in (("POLUSDT", 1), ("ETHUSDT", 4)):
+                    reg = metrics.Registry()
+                    reg.set("gridbot_writer_queue_depth", depth)
+                    reg.inc("gridbot_signals_total", kind="grid", symbol=sym)
+                    snap = reg.snapshot()
+                    snap["pid"] = -1
+                    with open(metrics.metrics_file(sym), "w") as f:
+                        json.dump(snap, f)
+                text = metrics.render(metrics.snapshots())
+        self.assertIn('gridbot_writer_queue_depth{process="POLUSDT"} 1', text)
+        self.assertIn('gridbot_writer_queue_depth{process="ETHUSDT"} 4', text)
+        self.assertIn('gridbot_signals_total{kind="grid",process="ETHUSDT",symbol="ETHUSDT"} 1', text)
+        self.assertNotIn("\ngridbot_writer_queue_depth ", text)  # nenhuma amostra sem rótulo
+
+
+class FakeProc:
+    def __init__(self, pid):
+        self.pid, self.exitcode, self.alive = pid, None, True
+
+    def is_alive(self):
+        return self.alive
+
+    def die(self, code=1):
+        self.alive, self.exitcode = False, code
+
+    def join(self, timeout=None):
+        self.die(0)  # atendeu ao ("stop",)
+
+
+class FakeConn:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+
+class SupervisorTests(SimpleTestCase):
+    def make(self, symbols=("POLUSDT",), **kw):
+        self.now = 1000.0
+        self.spawned = []
+
+        def spawn(symbol):
+            self.spawned.append((symbol, FakeProc(len(self.spawned)), FakeConn()))
+            return self.spawned[-1][1:]
+        sup = Supervisor(list(symbols), socket_path=kw.pop("socket_path", "/nonexistent"), spawn=spawn,
+                         clock=lambda: self.now, **kw)
+        sup.log = lambda msg: None
+        return sup
+
+    def test_crash_restarts_with_exponential_backoff(self):
+        sup = self.make(backoff_base=1, backoff_max=8, stable_after=60)
+        sup.check()
+        delays = []
+        for _ in range(5):
+            self.spawned[-1][1].die()
+            self.now += 1
+            sup.check()
+            w = sup.workers["POLUSDT"]
+            delays.append(w.next_start - self.now)
+            self.now = w.next_start
+            sup.check()
+        self.assertEqual(delays, [1, 2, 4, 8, 8])
+        self.assertEqual(len(self.spawned), 6)
+        # rodou estável: a próxima queda volta ao backoff inicial
+        self.now += 120
+        self.spawned[-1][1].die()
+        sup.check()
+        self.assertEqual(sup.workers["POLUSDT"].next_start - self.now, 1)
+
+    def test_config_change_notification_over_socket(self):
+        with tempfile.TemporaryDirectory() as d:
+            sup = self.make(socket_path=f"{d}/runner.sock")
+            sup.bind()
+            try:
+                sup.check()
+                self.assertTrue(notify_config_change(BotConfig(pk=7, symbol="POLUSDT"), path=sup.socket_path))
+                sup.poll(1)
+                self.assertEqual(self.spawned[0][2].sent, [("reload", 7)])
+                notify_config_change(BotConfig(pk=8, symbol="ETHUSDT"), path=sup.socket_path)
+                sup.poll(1)
+                sup.check()
+                self.assertEqual([s[0] for s in self.spawned], ["POLUSDT", "ETHUSDT"])
+            finally:
+                sup.shutdown(timeout=0.1)
+        self.assertEqual(self.spawned[0][2].sent[-1], ("stop",))
+        self.assertFalse(notify_config_change(BotConfig(pk=9, symbol="POLUSDT"), path=f"{d}/runner.sock"))
+
+    def test_workers_share_one_ticker_per_window(self):
+        cache, calls, now = mdcache.LocalCache(), [], [100.1]
+
+        def get_prices(symbols):
+            calls.append(symbols)
+            return {"POLUSDT": 0.2, "ETHUSDT": 2000.0}
+        with mock.patch("gridbot.bot_runner.get_prices", get_prices):
+            got = [shared_price(s, cache, clock=lambda: now[0]) for s in ("POLUSDT", "ETHUSDT", "POLUSDT")]
+            now[0] = 102.0                                  # janela seguinte: busca de novo
+            shared_price("ETHUSDT", cache, clock=lambda: now[0])
+        self.assertEqual(got, [0.2, 2000.0, 0.2])
+        self.assertEqual(calls, [[], []])                   # ticker completo, um por janela
+        self.assertAlmostEqual(window_wait(15, clock=lambda: 100.5), 15.5)   # acorda em 116, borda da janela
+
+    def test_bot_applies_reloaded_config_between_ticks(self):
+        bot = GridBotThread(BotConfig(use_atr=False, grid_step=1.0, telegram_enabled=False), None)
+        bot.metrics = metrics.NULL
+        signals = []
+        bot._update_state = lambda **f: None
+        bot._post_signal = lambda kind, msg, **kw: signals.append(kind)
+        bot._save_json = lambda: None
+        bot._load_json = lambda: {}
+        bot._load_triggers = lambda: []
+        bot.start_bot(1.0)
+        bot.reload_config(BotConfig(pk=2, use_atr=False, grid_step=0.5, telegram_enabled=False))
+        self.assertEqual(bot.eff_grid_step, 1.0)  # só no próximo tick
+        bot.on_tick(1.002)
+        self.assertEqual((bot.cfg.pk, bot.eff_grid_step), (2, 0.5))
+        self.assertEqual(signals, ["startup"])    # remontar a grade não gera cruzamento
+        bot.on_tick(1.011)
+        self.assertEqual(signals, ["startup", "grid", "grid"])
+
+
+class BenchTests(TestCase):
+    def test_cases_run_and_regressions_are_flagged(self):
+        sizes = {"ticks": [200], "levels": [10], "e2e_ticks": [300]}
+        results = bench.run_cases(sizes, repeat=1, log=lambda r: None)
+        self.assertEqual({r["case"] for r in results}, {c[0] for c in bench.CASES})
+        self.assertTrue(all(r["ns_per_op"] > 0 for r in results))
+        self.assertEqual(BotState.objects.filter(symbol="BENCH").count(), 4)  # state_update x2 + e2e x2
+
+        with tempfile.TemporaryDirectory() as d:
+            path = f"{d}/results.jsonl"
+            base = bench.record(results, path, "abc1234")
+            slower = [{**r, "ns_per_op": r["ns_per_op"] * (2 if r["case"] == "grid_index" else 1)} for r in results]
+            bench.record(slower, path, "def5678")
+            self.assertEqual([h["commit"] for h in bench.history(path)], ["abc1234", "def5678"])
+        flagged = {c[0] for c in bench.compare(slower, base) if c[5]}
+        self.assertEqual(flagged, {"grid_index"})
+
+    def test_temp_dirs_removed_and_row_cases_capped(self):
+        before = set(glob.glob(f"{tempfile.gettempdir()}/bench-*"))
+        bench.run_cases({"e2e_ticks": [50]}, repeat=2, only={"checkpoint_save", "e2e_loop"}, log=lambda r: None)
+        self.assertEqual(set(glob.glob(f"{tempfile.gettempdir()}/bench-*")), before)
+        with mock.patch.object(bench, "ROWS_MAX", 300):
+            r = bench.run_cases({"ticks": [5000]}, repeat=1, only={"calc_atr", "streaming_atr"}, log=lambda r: None)
+        self.assertEqual([x["ops"] for x in r], [300, 300])
+
+
+class ExecutionTests(TestCase):
+    def test_paper_limits_partials_and_market(self):
+        ex = PaperExchange(max_volume_pct=0.5)
+        buy = OrderIntent("POLUSDT", BUY, 10, 1.0)
+        ex.place(buy)
+        ex.on_candle("POLUSDT", {"t": 0, "o": 1.02, "h": 1.03, "l": 1.01, "c": 1.02, "v": 100})
+        self.assertEqual(ex.fills(), [])
+        ex.on_candle("POLUSDT", {"t": 60_000, "o": 1.01, "h": 1.01, "l": 0.99, "c": 1.0, "v": 8})
+        ex.on_candle("POLUSDT", {"t": 120_000, "o": 0.98, "h": 1.0, "l": 0.97, "c": 0.99, "v": 100})
+        fills = ex.fills()
+        self.assertEqual([(f.qty, f.price) for f in fills], [(4, 1.0), (6, 0.98)])  # gap a favor: abertura
+        sell = OrderIntent("POLUSDT", SELL, 3)
+        ex.place(sell)
+        ex.replay("POLUSDT", [{"t": 180_000, "o": 1.05, "h": 1.06, "l": 1.04, "c": 1.05}])
+        self.assertEqual([(f.client_id, f.qty, f.price) for f in ex.fills()], [(sell.client_id, 3, 1.05)])
+        self.assertEqual(ex.book["POLUSDT"], {})
+
+        pos = Position(10, 1.0).apply(BUY, 10, 0.9)
+        self.assertAlmostEqual(pos.avg, 0.95)
+        pos.apply(SELL, 25, 1.0)
+        self.assertEqual(pos.qty, 0.0)
+        self.assertAlmostEqual(pos.realized, 20 * 0.05)
+
+    def test_crossings_trade_and_fills_update_position(self):
+        cfg = BotConfig.objects.create(symbol="POLUSDT", qty=100, avg=1.0, grid_step=1.0, levels_up=4,
+                                       levels_down=4, stop_from_avg=50, use_atr=False, telegram_enabled=False,
+                                       auto_trade=True)
+        ex = Executor(PaperExchange())
+        bot = GridBotThread(cfg, state_for("POLUSDT"), executor=ex)
+        with tempfile.TemporaryDirectory() as d:
+            bot.checkpoint = Checkpoint(f"{d}/grid_state.json")
+            bot.start_bot(1.0)
+            bot.on_tick(1.015)          # cruza 1.01 para cima: vende 100/4
+            ex.step()
+            bot.on_tick(1.012)
+            self.assertEqual((bot.cfg.qty, bot.cfg.avg), (75, 1.0))
+            bot.on_tick(0.985)          # desce por 1.01, 1.00 e 0.99: três compras de 75/4
+            ex.step()
+            bot.on_tick(0.986)
+            avg = (75 * 1.0 + 56.25 * 0.985) / 131.25
+            self.assertAlmostEqual(bot.cfg.qty, 131.25)
+            self.assertAlmostEqual(bot.cfg.avg, avg)
+            cfg.refresh_from_db()
+            self.assertAlmostEqual(cfg.qty, 131.25)
+            self.assertAlmostEqual(cfg.avg, avg)
+            orders = list(BotOrder.objects.order_by("id").values_list("side", "price", "status", "avg_fill_price"))
+            self.assertEqual([o[:3] for o in orders], [("sell", 1.01, "filled"), ("buy", 1.01, "filled"),
+                                                       ("buy", 1.0, "filled"), ("buy", 0.99, "filled")])
+            self.assertEqual([o[3] for o in orders], [1.015, 0.985, 0.985, 0.985])
+
+            # stop em ticks seguidos: o latch dispara uma vez, uma venda só
+            bot.cfg.stop_from_avg = 0.5
+            bot.on_tick(0.9855)
+            bot.on_tick(0.985)
+            ex.step()
+            self.assertEqual(list(BotOrder.objects.filter(kind="stop").values_list("qty", "status")),
+                             [(131.25, "filled")])
+            self.assertEqual(ex.metrics()["skipped"], 0)
+            bot.on_tick(0.9852)
+            self.assertEqual(bot.cfg.qty, 0.0)
+
+    def test_deduplicated_crossings_place_no_orders(self):
+        cfg = BotConfig.objects.create(symbol="POLUSDT", qty=100, avg=1.0, grid_step=1.0, levels_up=4,
+                                       levels_down=4, stop_from_avg=50, use_atr=False, telegram_enabled=False,
+                                       auto_trade=True, grid_hysteresis_pct=0, signal_dedup_sec=60)
+        ex = Executor(PaperExchange())
+        bot = GridBotThread(cfg, state_for("POLUSDT"), executor=ex)
+        now = [1000.0]
+        bot.clock = lambda: now[0]
+        with tempfile.TemporaryDirectory() as d:
+            bot.checkpoint = Checkpoint(f"{d}/grid_state.json")
+            bot.start_bot(1.0)
+            for p in (1.015, 1.005, 1.015, 1.005):     # oscila em torno de 1.01 dentro da janela
+                now[0] += 5
+                bot.on_tick(p)
+            self.assertEqual([(i.side, i.price) for i in ex._intents], [("sell", 1.01), ("buy", 1.01)])
+            now[0] += 60
+            bot.on_tick(1.015)                          # janela vencida: cruza de novo e opera
+            self.assertEqual(len(ex._intents), 3)
+
+    def test_auto_trade_position_comes_from_fills_not_the_form(self):
+        cfg = BotConfig.objects.create(symbol="POLUSDT", qty=100, avg=1.0, use_atr=False, telegram_enabled=False)
+        data = {"qty": 50, "avg": 0.9, "grid_step": 1.0, "levels_up": 4, "levels_down": 4, "stop_from_avg": 5,
+                "interval": 15, "auto_trade": "on", "grid_shape": "off", "bands_len": 20, "bands_k": 2.0,
+                "stop_rearm_pct": 0.5, "stop_repeat_sec": 0,
+                "grid_hysteresis_pct": 0.05, "signal_dedup_sec": 60, "poll_min_sec": 2, "poll_max_sec": 60}
+        ex = Executor(PaperExchange(), persist=False)
+        bot = GridBotThread(cfg, state_for("POLUSDT"), executor=ex)
+        with tempfile.TemporaryDirectory() as d:
+            bot.checkpoint = Checkpoint(f"{d}/grid_state.json")
+            bot.start_bot(1.0)
+            form = BotConfigForm(data, instance=BotConfig.objects.get(pk=cfg.pk))
+            self.assertTrue(form.is_valid(), form.errors)       # ligando agora: qty/avg do painel valem
+            bot.reload_config(form.save())
+            bot.on_tick(1.0)
+            ex.step()
+            self.assertEqual((ex.positions["POLUSDT"].qty, ex.positions["POLUSDT"].avg), (50, 0.9))
+
+            BotConfig.objects.filter(pk=cfg.pk).update(qty=60, avg=0.95)    # fill gravado pelo Executor
+            bot.set_position(60, 0.95)
+            form = BotConfigForm({**data, "qty": 1, "avg": 2}, instance=BotConfig.objects.get(pk=cfg.pk))
+            self.assertTrue(form.fields["qty"].disabled and form.is_valid())
+            saved = form.save()
+            self.assertEqual((saved.qty, saved.avg), (60, 0.95))
+            bot.on_tick(1.0)
+            stale = BotConfig.objects.get(pk=cfg.pk)
+            stale.qty, stale.avg = 55, 0.97                     # lido antes de um fill
+            bot.reload_config(stale)
+            bot.on_tick(1.0)
+            self.assertEqual((bot.cfg.qty, bot.cfg.avg), (60, 0.95))
+
+    def test_stop_never_drains_alongside_a_busy_thread(self):
+        entered, release, placed = threading.Event(), threading.Event(), []
+
+        class Slow(PaperExchange):
+            def place(self, intent):
+                placed.append(threading.current_thread())
+                entered.set()
+                release.wait(5)
+                return super().place(intent)
+        ex = Executor(Slow(), persist=False)
+        ex.start()
+        ex.submit(OrderIntent("POLUSDT", BUY, 1, 1.0))
+        self.assertTrue(entered.wait(5))
+        ex.submit(OrderIntent("POLUSDT", BUY, 1, 0.9))
+        with mock.patch("gridbot.execution.STOP_TIMEOUT", 0.1):
+            ex.stop()                                   # thread preso no place(): não drena daqui
+        self.assertEqual(placed, [ex])
+        release.set()
+        ex.join(5)
+        ex.stop()                                       # parado: a drenagem final roda no chamador
+        self.assertEqual(len(placed), 2)
+
+        with mock.patch("gridbot.execution._executor", None), \
+                mock.patch("gridbot.runner_registry.default_executor") as make:
+            BotRegistry.stop()
+        make.assert_not_called()
+
+    def test_stop_cancels_open_orders_and_goes_flat(self):
+        ex = Executor(PaperExchange())
+        ex.positions["POLUSDT"] = Position(100, 1.0)
+        sell = OrderIntent("POLUSDT", SELL, 25, 1.05, "grid")
+        buy = OrderIntent("POLUSDT", BUY, 25, 0.95, "grid")
+        ex.submit(sell)
+        ex.submit(buy)
+        ex.mark("POLUSDT", 1.0)
+        ex.step()
+        self.assertEqual(ex.metrics()["open_orders"], 2)
+        ex.submit(OrderIntent("POLUSDT", SELL, 100, None, "stop"))
+        ex.mark("POLUSDT", 0.97)
+        ex.step()
+        ex.mark("POLUSDT", 0.94)    # a compra da grade teria executado aqui
+        ex.step()
+        self.assertEqual(ex.positions["POLUSDT"].qty, 0.0)
+        self.assertEqual(ex.adapter.book["POLUSDT"], {})
+        orders = dict(BotOrder.objects.values_list("client_id", "status"))
+        self.assertEqual((orders[sell.client_id], orders[buy.client_id]), ("canceled", "canceled"))
+        self.assertEqual(list(BotOrder.objects.filter(kind="stop").values_list("qty", "status")), [(100, "filled")])
+
+
+class CandleHubTests(SimpleTestCase):
+    def _feed(self, hub, rows, clock):
+        for r in rows:
+            clock[0] = (r["t"] + 30_000) / 1000
+            hub.on_kline("POLUSDT", "1m", {**r, "c": r["o"], "closed": False})   # parcial do minuto
+            clock[0] = (r["t"] + 60_000) / 1000
+            hub.on_kline("POLUSDT", "1m", {**r, "closed": True})
+
+    def test_higher_timeframes_match_resample_and_persist(self):
+        rows = random_candles(600, seed=21)
+        clock = [rows[0]["t"] / 1000]
+        with tempfile.TemporaryDirectory() as d:
+            store = CandleStore(d)
+            seeds = []
+            hub = CandleHub(history=1000, store=store, seed=lambda s, i, n: seeds.append(i) or [], clock=lambda: clock[0])
+            self.assertIsNone(hub.klines("POLUSDT", "5m", 10))      # sem stream: o bot usa o REST
+            hub.track("POLUSDT", ("1m", "5m", "15m", "1h"))
+            self._feed(hub, rows[:-1], clock)
+            clock[0] = (rows[-1]["t"] + 20_000) / 1000
+            hub.on_kline("POLUSDT", "1m", {**rows[-1], "closed": False})
+            a = {k: np.array([r[k] for r in rows]) for k in ("t", "o", "h", "l", "c", "v")}
+            for interval, step in (("1m", 60_000), ("5m", 300_000), ("15m", 900_000), ("1h", 3_600_000)):
+                got = hub.klines("POLUSDT", interval, 1000)
+                want = resample(a, step)
+                self.assertEqual(len(got), len(want["t"]), interval)
+                for k in ("t", "o", "h", "l", "c", "v"):
+                    np.testing.assert_allclose([g[k] for g in got], want[k], err_msg=f"{interval} {k}")
+                self.assertEqual(store.read("POLUSDT", interval)["t"].tolist(), [g["t"] for g in got[:-1]])
+            self.assertEqual(len(hub.klines("POLUSDT", "5m", 3)), 3)
+            self.assertEqual(seeds, ["1m", "5m", "15m", "1h"])     # um seed por timeframe, o resto pelo stream
+
+    def test_seed_merge_gap_and_stale(self):
+        rows = random_candles(40, seed=4)
+        t0 = rows[0]["t"] - rows[0]["t"] % 900_000 + 900_000
+        rows = [{**r, "t": t0 + i * 60_000} for i, r in enumerate(rows)]
+        clock = [(t0 + 7 * 60_000 + 10_000) / 1000]
+        seeded = {"t": t0, "o": 1.0, "h": 1.5, "l": 0.5, "c": 1.2, "v": 1000.0}   # 15m em formação, 7 minutos
+        hub = CandleHub(persist=False, seed=lambda s, i, n: [seeded], clock=lambda: clock[0])
+        hub.on_kline("POLUSDT", "1m", {**rows[6], "closed": True})
+        self.assertEqual(hub.klines("POLUSDT", "15m", 5), [seeded])
+        hub.on_kline("POLUSDT", "1m", {**rows[7], "h": 2.0, "v": 5.0, "closed": True})   # minuto do seed: sem volume
+        clock[0] += 60
+        hub.on_kline("POLUSDT", "1m", {**rows[8], "l": 0.1, "v": 7.0, "closed": True})
+        live = hub.klines("POLUSDT", "15m", 5)[-1]
+        self.assertEqual((live["o"], live["h"], live["l"], live["v"]), (1.0, 2.0, 0.1, 1007.0))
+
+        clock[0] += 180
+        hub.on_kline("POLUSDT", "1m", {**rows[12], "closed": True})   # pulou minutos: semeia de novo
+        self.assertEqual(hub.gaps, 1)
+        hub.klines("POLUSDT", "15m", 5)
+        self.assertEqual(hub.seeds, 2)
+        clock[0] += 600
+        self.assertIsNone(hub.klines("POLUSDT", "15m", 5))            # stream parado
+
+    def test_bots_on_different_timeframes_share_the_feed(self):
+        rows = random_candles(400, seed=9)
+        clock = [rows[0]["t"] / 1000]
+        hub = CandleHub(persist=False, seed=lambda s, i, n: [], clock=lambda: clock[0])
+        bots = [GridBotThread(BotConfig(symbol="POLUSDT", atr_interval=tf, atr_len=5), None, candle_hub=hub)
+                for tf in ("1m", "5m", "15m")]
+        hub.on_kline("POLUSDT", "1m", {**rows[0], "closed": False})
+        for bot in bots:
+            bot._fetch_klines(50)
+        self._feed(hub, rows, clock)
+        with mock.patch("gridbot.candle_store.store_klines", side_effect=AssertionError("rede")):
+            for bot in bots:
+                bot.clock = lambda: clock[0]
+                rows_tf = bot._fetch_klines(60)
+                self.assertAlmostEqual(bot._refresh_atr(), calc_atr(rows_tf, 5), places=12)
+        self.assertEqual(hub.seeds, 3)
+
+
+class TriggerTests(TestCase):
+    def test_book_fires_suffix_in_crossing_order(self):
+        book = TriggerBook([Trigger(1, "alert", ABOVE, 1.10), Trigger(2, "take_profit", ABOVE, 1.05),
+                            Trigger(3, "stop", BELOW, 0.95), Trigger(4, "alert", BELOW, 0.90),
+                            Trigger(5, "alert", ABOVE, 1.20)])
+        self.assertEqual(book.nearest(), (1.05, 0.95))
+        self.assertEqual(book.crossed(1.0), [])
+        self.assertEqual([t.id for t in book.crossed(1.10)], [2, 1])     # nível exato dispara
+        self.assertEqual(book.remove(5).id, 5)
+        self.assertIsNone(book.remove(5))
+        self.assertEqual(book.crossed(1.5), [])
+        self.assertEqual([t.id for t in book.crossed(0.80)], [3, 4])
+        self.assertEqual((len(book), book.nearest()), (0, (None, None)))
+
+        rnd = random.Random(3)
+        ts = [Trigger(i, "alert", rnd.choice((ABOVE, BELOW)), rnd.uniform(0.5, 1.5)) for i in range(2000)]
+        book = TriggerBook(ts)
+        fired = set()
+        for _ in range(200):
+            p = rnd.uniform(0.4, 1.6)
+            got = {t.id for t in book.crossed(p)}
+            want = {t.id for t in ts if t.id not in fired and
+                    (p >= t.price if t.direction == ABOVE else p <= t.price)}
+            self.assertEqual(got, want)
+            fired |= got
+        self.assertEqual(len(book), 2000 - len(fired))
+
+    def test_reload_before_writer_flush_does_not_refire(self):
+        cfg = BotConfig.objects.create(symbol="POLUSDT", avg=1.0, grid_step=5.0, stop_from_avg=50, use_atr=False,
+                                       telegram_enabled=False)
+        tp = PriceTrigger.objects.create(symbol="POLUSDT", kind="alert", direction="above", price=1.02)
+        writer = StateWriter()                              # sem start(): nada sai da fila até o flush
+        bot = GridBotThread(cfg, state_for("POLUSDT"), writer=writer)
+        bot.metrics = metrics.NULL
+        with tempfile.TemporaryDirectory() as d:
+            bot.checkpoint = Checkpoint(f"{d}/grid_state.json")
+            bot.start_bot(1.0)
+            bot.on_tick(1.025)
+            self.assertTrue(PriceTrigger.objects.get(pk=tp.pk).active)     # active=False ainda na fila
+            bot.reload_triggers()
+            bot.on_tick(1.03)
+            self.assertEqual(len(writer._signals), 2)                   # startup + um disparo
+            writer.flush()
+            self.assertFalse(PriceTrigger.objects.get(pk=tp.pk).active)
+            bot.reload_triggers()
+            bot.on_tick(1.03)
+            self.assertEqual(bot._fired, set())
+
+    def test_bot_fires_once_through_signal_path(self):
+        cfg = BotConfig.objects.create(symbol="POLUSDT", qty=100, avg=1.0, grid_step=5.0, levels_up=2,
+                                       levels_down=2, stop_from_avg=50, use_atr=False, telegram_enabled=False,
+                                       auto_trade=True)
+        tp = PriceTrigger.objects.create(symbol="POLUSDT", kind="take_profit", direction="above", price=1.02,
+                                         qty=40, note="metade")
+        al = PriceTrigger.objects.create(symbol="POLUSDT", kind="alert", direction="below", price=0.98)
+        PriceTrigger.objects.create(symbol="BTCUSDT", kind="alert", direction="above", price=1.0)
+        ex = Executor(PaperExchange())
+        bot = GridBotThread(cfg, state_for("POLUSDT"), executor=ex)
+        bot.clock = lambda: 1_700_000_000.0
+        with tempfile.TemporaryDirectory() as d:
+            bot.checkpoint = Checkpoint(f"{d}/grid_state.json")
+            bot.start_bot(1.0)
+            self.assertEqual(len(bot.triggers), 2)
+            bot.on_tick(1.025)
+            bot.on_tick(1.03)       # já disparou: não repete
+            ex.step()
+            bot.on_tick(1.0)
+            PriceTrigger.objects.create(symbol="POLUSDT", kind="alert", direction="below", price=0.99)
+            bot.reload_triggers()
+            bot.on_tick(0.97)
+        signals = list(BotSignal.objects.filter(kind="trigger").order_by("id").values_list("message", flat=True))
+        self.assertEqual(len(signals), 3)
+        self.assertIn("Take profit POLUSDT", signals[0])
+        self.assertIn("metade", signals[0])
+        tp.refresh_from_db()
+        al.refresh_from_db()
+        self.assertEqual((tp.active, tp.fired_price), (False, 1.025))
+        self.assertEqual(tp.fired_at.timestamp(), 1_700_000_000.0)
+        self.assertEqual((al.active, al.fired_price), (False, 0.97))
+        self.assertEqual(list(BotOrder.objects.values_list("side", "qty", "kind", "status")),
+                         [("sell", 40, "take_profit", "filled")])
+        self.assertEqual(bot.cfg.qty, 60)
+
+    def test_dashboard_adds_and_removes(self):
+        BotConfig.objects.create(symbol="POLUSDT")
+        with mock.patch("gridbot.supervisor.notify_triggers_change") as notify, \
+                self.captureOnCommitCallbacks(execute=True):
+            r = self.client.post("/", {"add_trigger": "1", "kind": "stop", "price": "0.2", "qty": "", "note": ""})
+        self.assertEqual(r.status_code, 302)
+        t = PriceTrigger.objects.get()
+        self.assertEqual((t.symbol, t.direction, t.active), ("POLUSDT", "below", True))
+        notify.assert_called_once_with("POLUSDT")
+        r = self.client.post("/", {"add_trigger": "1", "kind": "alert", "price": "-1"})
+        self.assertEqual(r.status_code, 200)
+        self.assertContains(r, "Preço deve ser positivo.")
+        self.client.post("/", {"delete_trigger": t.pk})
+        self.assertFalse(PriceTrigger.objects.exists())
+
+        sup = Supervisor(["POLUSDT"], socket_path="unused", spawn=lambda s: (FakeProc(1), FakeConn()))
+        sup.check()
+        sup.handle({"event": "triggers", "symbol": "POLUSDT"})
+        self.assertEqual(sup.workers["POLUSDT"].conn.sent, [("triggers",)])
+
+
+class EngineTests(TestCase):
+    def _bot(self, sym):
+        bot = GridBotThread(BotConfig(symbol=sym, use_atr=False, avg=1.0, qty=1, grid_step=2.0, interval=5,
+                                      telegram_enabled=False, adaptive_poll=False), None)
+        bot.metrics = metrics.NULL
+        bot._update_state = lambda **f: None
+        bot._save_json = lambda: None
+        bot._load_json = lambda: {}
+        bot._load_triggers = lambda: []
+        bot._post_signal = lambda *a, **kw: None
+        return bot
+
+    def test_failed_batch_fetch_backs_off(self):
+        now, calls, down = [0.0], [], [False]
+
+        def get_prices(symbols):
+            calls.append(list(symbols))
+            if down[0]:
+                raise RuntimeError("Falha ao obter preços (rede bloqueada?)")
+            return {s: 1.0 for s in symbols}
+        with mock.patch("gridbot.engine.get_prices", get_prices), \
+                mock.patch("gridbot.engine.REGISTRY", metrics.Registry()):
+            engine = MultiGridEngine([self._bot("POLUSDT"), self._bot("ETHUSDT")], clock=lambda: now[0])
+            engine._start_bots()
+            down[0] = True
+            # 2 minutos fora: tenta em 5, 10, 20, 40, 80 (esperas 5, 10, 20, 40, 60) e não a cada volta
+            for t in range(5, 125):
+                now[0] = t
+                engine.tick()
+            failed = len(calls) - 1
+            self.assertEqual(failed, 5)
+            self.assertEqual(engine.fetch_failures, 5)
+            self.assertEqual(engine.next_due["POLUSDT"], 80 + 60)
+            self.assertEqual(sorted(calls[-1]), ["ETHUSDT", "POLUSDT"])
+            down[0] = False
+            now[0] = 195
+            self.assertEqual(engine.tick(), 2)
+            self.assertEqual((engine.fetch_failures, engine.next_due["POLUSDT"]), (0, 200))
+
+    def test_bot_added_while_running_joins_the_batch(self):
+        now, calls = [0.0], []
+
+        def get_prices(symbols):
+            calls.append(sorted(symbols))
+            return {s: 1.0 for s in symbols}
+        with mock.patch("gridbot.engine.get_prices", get_prices), \
+                mock.patch("gridbot.engine.REGISTRY", metrics.Registry()):
+            engine = MultiGridEngine([self._bot("POLUSDT")], clock=lambda: now[0])
+            engine._start_bots()
+            engine.add(self._bot("ETHUSDT"))
+            engine.add(self._bot("POLUSDT"))            # já no loop: ignorado
+            now[0] = 2
+            engine._start_new()
+            self.assertEqual((sorted(engine.bots), engine.next_due["ETHUSDT"]), (["ETHUSDT", "POLUSDT"], 7))
+            now[0] = 7
+            self.assertEqual(engine.tick(), 2)              # os dois vencidos num request só
+            self.assertEqual(calls, [["POLUSDT"], ["ETHUSDT"], ["ETHUSDT", "POLUSDT"]])
+
+    def test_engine_supervisor_restarts_loop_and_routes_notifications(self):
+        class Registry:
+            alive, started, added, reloaded, triggers = False, [], [], [], []
+            start_all = classmethod(lambda c, symbols: (c.started.append(symbols), setattr(c, "alive", True)))
+            running = classmethod(lambda c: c.alive)
+            add = classmethod(lambda c, cfg: c.added.append(cfg.symbol))
+            reload = classmethod(lambda c, cfg: c.reloaded.append(cfg.pk))
+            reload_triggers = classmethod(lambda c, symbol: c.triggers.append(symbol))
+            stop = classmethod(lambda c: setattr(c, "alive", False))
+        now = [1000.0]
+        sup = EngineSupervisor(["POLUSDT"], registry=Registry, socket_path="/nonexistent", backoff_base=1,
+                               clock=lambda: now[0])
+        sup.log = lambda msg: None
+        sup.check()
+        Registry.alive = False                          # loop morreu
+        now[0] += 1
+        sup.check()
+        self.assertEqual((len(Registry.started), sup.restarts), (1, 1))
+        now[0] += 1
+        sup.check()
+        self.assertEqual(Registry.started, [["POLUSDT"], ["POLUSDT"]])
+
+        pol = BotConfig.objects.create(symbol="POLUSDT")
+        eth = BotConfig.objects.create(symbol="ETHUSDT")
+        sup.handle({"event": "config", "symbol": "POLUSDT", "id": pol.pk})
+        sup.handle({"event": "config", "symbol": "ETHUSDT", "id": eth.pk})
+        sup.handle({"event": "triggers", "symbol": "ETHUSDT"})
+        self.assertEqual((Registry.reloaded, Registry.added, Registry.triggers), ([pol.pk], ["ETHUSDT"], ["ETHUSDT"]))
+        sup.shutdown()
+        self.assertFalse(Registry.alive)
+
+    def test_get_prices_single_sorted_request(self):
+        client = mock.Mock()
+        client.get_json.return_value = [{"symbol": "ETHUSDT", "price": "2000.5"}, {"symbol": "POLUSDT", "price": "0.2"}]
+        with mock.patch("gridbot.bot_runner.default_client", return_value=client):
+            self.assertEqual(get_prices(["POLUSDT", "ETHUSDT", "POLUSDT"]), {"ETHUSDT": 2000.5, "POLUSDT": 0.2})
+        path, params = client.get_json.call_args[0]
+        self.assertEqual((path, params), ("/api/v3/ticker/price", {"symbols": '["ETHUSDT","POLUSDT"]'}))
+        client.get_json.side_effect = OSError("rede")
+        with mock.patch("gridbot.bot_runner.default_client", return_value=client):
+            with self.assertRaises(RuntimeError):
+                get_prices(["POLUSDT"])
+
+    def test_latest_configs_and_state_for(self):
+        BotConfig.objects.create(symbol="POLUSDT", qty=1)
+        newest = BotConfig.objects.create(symbol="POLUSDT", qty=2)
+        eth = BotConfig.objects.create(symbol="ETHUSDT")
+        self.assertEqual(latest_configs(), {"POLUSDT": newest, "ETHUSDT": eth})
+        st = state_for("POLUSDT")
+        self.assertEqual(state_for("POLUSDT").pk, st.pk)
+        self.assertEqual(BotState.objects.filter(symbol="POLUSDT").count(), 1)
+
+
+class PollSchedulerTests(SimpleTestCase):
+    def test_delay_follows_distance_and_budget(self):
+        now = [0.0]
+        budget = WeightBudget(limit=100)
+        s = PollScheduler(min_delay=2, max_delay=60, budget=budget, share=1.0, clock=lambda: now[0])
+        self.assertEqual(s.delay(1.0, [0.97], fallback=15), 15)         # sem volatilidade: fixo
+        atr = 0.002                                                      # por vela de 1m
+        self.assertEqual(s.delay(1.0, [0.97, None], atr=atr), 60)       # 15 ATRs: máximo
+        self.assertAlmostEqual(s.delay(1.0, [0.996, 1.01], atr=atr), 0.1 * 2 ** 2 * 60)   # 2 ATRs
+        self.assertAlmostEqual(s.distance_atr, 2.0)
+        self.assertEqual(s.delay(1.0, [0.999], atr=atr), 2)              # meio ATR: mínimo
+        budget.acquire(40, now=0)                                        # sobra 60%: piso 1.2s / 0.6
+        self.assertAlmostEqual(s.floor(0), 2.0)
+        budget.acquire(45, now=0)
+        self.assertEqual(s.delay(1.0, [0.999], atr=atr), 60)             # abaixo da reserva
+        now[0] = 60.0
+        self.assertEqual(s.delay(1.0, [0.999], atr=atr), 2)              # minuto novo
+        for t, p in enumerate([1.0, 1.01, 1.0, 1.01], start=1):          # volatilidade realizada
+            s.observe(p, now=t)
+        self.assertLess(s.delay(1.0, [0.95]), 60)
+
+    def test_adaptive_poll_is_opt_in_from_the_form(self):
+        self.assertFalse(BotConfig().adaptive_poll)         # bots existentes seguem o interval do painel
+        data = {"qty": 100, "avg": 1.0, "grid_step": 1.0, "levels_up": 4, "levels_down": 4, "stop_from_avg": 5,
+                "interval": 15, "grid_shape": "off", "bands_len": 20, "bands_k": 2.0, "stop_rearm_pct": 0.5,
+                "stop_repeat_sec": 0, "grid_hysteresis_pct": 0.05,
+                "signal_dedup_sec": 60, "adaptive_poll": "on", "poll_min_sec": 2, "poll_max_sec": 30}
+        form = BotConfigForm(data, instance=BotConfig())
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual((form.instance.adaptive_poll, form.instance.poll_max_sec), (True, 30))
+        self.assertFalse(BotConfigForm({**data, "poll_min_sec": 40}, instance=BotConfig()).is_valid())
+
+    def _simulate(self, adaptive, symbols=4, seconds=7200):
+        def path(seed, cross_at):
+            rnd, p, out = random.Random(seed), 1.0, []
+            for t in range(seconds):
+                p += rnd.gauss(0, 2e-5) - (0.05 / 900 if cross_at <= t < cross_at + 900 else 0)
+                out.append(p)
+            return out
+        paths = {f"S{i}USDT": path(i, 3000 + 700 * i) for i in range(symbols)}
+        now, polls, stops, bots = [0.0], [0], {}, []
+        budget = WeightBudget(1000)
+        for sym in paths:
+            bot = GridBotThread(BotConfig(symbol=sym, use_atr=False, avg=1.0, qty=1, grid_step=2.0, levels_up=4,
+                                          levels_down=4, stop_from_avg=3, telegram_enabled=False,
+                                          adaptive_poll=adaptive), None)
+            bot.metrics, bot.clock, bot.poll.budget = metrics.NULL, lambda: now[0], budget
+            bot._update_state = lambda **f: None
+            bot._save_json = lambda: None
+            bot._load_json = lambda: {}
+            bot._load_triggers = lambda: []
+            bot._post_signal = lambda kind, msg, sym=sym, **kw: kind == "stop" and stops.setdefault(sym, now[0])
+            bots.append(bot)
+
+        def get_prices(symbols):
+            polls[0] += len(symbols)
+            return {s: paths[s][int(now[0])] for s in symbols}
+        with mock.patch("gridbot.engine.get_prices", get_prices):
+            engine = MultiGridEngine(bots, clock=lambda: now[0])
+            engine._start_bots()
+            for t in range(1, seconds):
+                now[0] = t
+                engine.tick()
+        crossed = {s: next(t for t, p in enumerate(ps) if p <= 0.97) for s, ps in paths.items()}
+        return polls[0], max(stops[s] - crossed[s] for s in paths)
+
+    def test_simulated_clock_fewer_polls_faster_stops(self):
+        fixed_polls, fixed_latency = self._simulate(adaptive=False)
+        polls, latency = self._simulate(adaptive=True)
+        self.assertEqual(fixed_polls, 4 * 480)
+        self.assertLess(polls, fixed_polls / 2)
+        self.assertLessEqual(latency, 2)
+        self.assertLess(latency, fixed_latency)
+
+
+class JournalTests(SimpleTestCase):
+    def _record(self, root, ticks=1000):
+        candles = random_candles(ticks // 4 + 200, seed=5)
+        t0 = candles[0]["t"] / 1000.0
+        now, fail, triggers = [t0 + 100 * 60], [False], [Trigger(1, "alert", ABOVE, 0.26, None, "topo")]
+
+        def fetch(limit):
+            if fail[0]:
+                fail[0] = False
+                raise RuntimeError("rede")
+            i = int((now[0] - t0) // 60)
+            return [dict(c) for c in candles[max(0, i - limit + 1):i + 1]]
+
+        cfg = BotConfig(pk=3, symbol="POLUSDT", avg=0.25, qty=100, atr_len=14, atr_refresh_sec=30,
+                        stop_from_avg=2, telegram_enabled=False)
+        bot = GridBotThread(cfg, None, journal=journal.Journal(root, "POLUSDT"))
+        bot.metrics, bot.clock = metrics.NULL, lambda: now[0]
+        bot._update_state = lambda **f: None
+        bot._save_json = lambda: None
+        bot._load_json = lambda: {"ref_price": 0.251}
+        bot._load_triggers = lambda: list(triggers)
+        bot._write_signal = lambda *a: None
+        bot._update_trigger = lambda tid, **f: None
+        bot._fetch_klines = fetch
+        price = lambda: candles[int((now[0] - t0) // 60)]["c"]
+        bot.start_bot(price())
+        for k in range(ticks):
+            now[0] += 15
+            if k == 300:
+                bot.reload_config(BotConfig(pk=4, symbol="POLUSDT", avg=0.25, qty=100, atr_len=14, atr_k_grid=1.2,
+                                            atr_refresh_sec=30, stop_from_avg=2, telegram_enabled=False))
+            if k == 400:
+                fail[0] = True
+            if k == 500:
+                bot.set_position(120, 0.245)
+            if k == 700:
+                triggers[:] = [Trigger(2, "stop", BELOW, 0.24, 10, "")]
+                bot.reload_triggers()
+            bot.on_tick(price())
+        bot.finish()
+        return bot
+
+    def test_replay_reproduces_signals_across_rotation(self):
+        with tempfile.TemporaryDirectory() as d:
+            bot = self._record(d)
+            paths = journal.files(d, "POLUSDT")
+            self.assertEqual([p[-14:] for p in paths], ["2023-11-14.gbj", "2023-11-15.gbj"])   # virou o dia UTC
+            self.assertLess(bot.journal.bytes / 1000, 160)               # por tick: 17 bytes + velas do ATR + sinais
+            recs = list(journal.records(paths))
+            kinds = {journal.NAMES[k] for k, _, _ in recs}
+            self.assertEqual(kinds, set(journal.NAMES.values()))
+            self.assertIn(None, [d[1] for k, _, d in recs if k == journal.KLINES])   # a falha também fica
+
+            out = journal.replay(recs)
+            self.assertEqual((out["sessions"], out["ticks"]), (1, 1000))
+            self.assertGreater(len(out["recorded"]), 20)
+            self.assertIn("trigger", {s["kind"] for s in out["recorded"]})
+            self.assertIsNone(journal.diff(out["recorded"], out["replayed"]))
+
+            # queda no meio de um registro: o resto do arquivo continua legível
+            with open(paths[-1], "ab") as f:
+                f.write(bytes([journal.SIGNAL]) + b"\x00" * 12)
+            self.assertEqual(len(list(journal.records(paths))), len(recs))
+
+            stdout = io.StringIO()
+            call_command("replayjournal", "POLUSDT", dir=d, stdout=stdout)
+            self.assertIn("sinais idênticos", stdout.getvalue())
+            self.assertEqual(json.loads(stdout.getvalue().splitlines()[0])["ticks"], 1000)
+
+            # estado inicial diferente do gravado: o replay acusa a divergência
+            start = next(i for i, r in enumerate(recs) if r[0] == journal.START)
+            state = dict(recs[start][2], state={"ref_price": 0.2})
+            out = journal.replay(recs[:start] + [(journal.START, recs[start][1], state)] + recs[start + 1:])
+            self.assertIsNotNone(journal.diff(out["recorded"], out["replayed"]))
+
+
+    def test_replay_is_exact_when_the_clock_moves_inside_a_tick(self):
+        candles = random_candles(300, seed=7)
+        t0 = candles[0]["t"] / 1000.0
+        tick, reads = [t0 + 100 * 60], [0]
+
+        def clock():
+            reads[0] += 1
+            return tick[0] + 0.01 * reads[0]     # cada leitura anda um pouco, como no loop ao vivo
+        ref = candles[100]["c"]
+        cfg = BotConfig(symbol="POLUSDT", avg=ref, qty=100, atr_len=14, atr_refresh_sec=30, grid_step=0.5,
+                        stop_from_avg=0.2, stop_rearm_pct=0.1, stop_repeat_sec=30, grid_hysteresis_pct=0,
+                        signal_dedup_sec=30, telegram_enabled=False)
+        with tempfile.TemporaryDirectory() as d:
+            bot = GridBotThread(cfg, None, journal=journal.Journal(d, "POLUSDT"))
+            bot.metrics, bot.clock = metrics.NULL, clock
+            bot._update_state = lambda **f: None
+            bot._save_json = lambda: None
+            bot._load_json = lambda: {"ref_price": ref}
+            bot._load_triggers = lambda: []
+            bot._write_signal = lambda *a: None
+            bot._fetch_klines = lambda limit: [dict(c) for c in candles[:int((tick[0] - t0) // 60) + 1][-limit:]]
+            bot.start_bot(ref)
+            for k in range(400):
+                tick[0] += 15                               # janelas de 30s vencem bem na borda do tick
+                bot.on_tick(ref * (1.004 if k % 2 else 0.997))
+            bot.finish()
+            out = journal.replay(list(journal.records(journal.files(d, "POLUSDT"))))
+        kinds = [s["kind"] for s in out["recorded"]]
+        self.assertGreater(kinds.count("grid"), 10)
+        self.assertGreater(kinds.count("stop"), 10)
+        self.assertIsNone(journal.diff(out["recorded"], out["replayed"]))
+
+class MarketCacheTests(SimpleTestCase):
+    def test_ttl_and_lru(self):
+        now = [0.0]
+        c = mdcache.LocalCache(max_items=2, clock=lambda: now[0])
+        c.set("a", 1, 10)
+        c.set("b", 2, 5)
+        self.assertEqual(c.get("a"), 1)         # "a" vira o mais recente
+        c.set("c", 3, 10)                       # estoura: sai o menos usado, "b"
+        self.assertIs(c.get("b"), mdcache.MISSING)
+        now[0] = 11
+        self.assertIs(c.get("a"), mdcache.MISSING)
+        self.assertIs(c.get("c"), mdcache.MISSING)
+        m = c.metrics()
+        self.assertEqual((m["evictions"], m["expired"], m["size"]), (1, 2, 0))
+
+    def test_single_flight_in_process(self):
+        c = mdcache.LocalCache()
+        calls, out = [], []
+
+        def fill():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"c": 1.5}
+
+        ts = [threading.Thread(target=lambda: out.append(c.get_or_fill("k", 5, fill))) for _ in range(8)]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+        self.assertEqual((len(calls), out), (1, [{"c": 1.5}] * 8))
+        self.assertEqual(c.metrics()["waits"], 7)
+        # erro e None não ficam no cache nem prendem a chave
+        with self.assertRaises(RuntimeError):
+            c.get_or_fill("x", 5, mock.Mock(side_effect=RuntimeError("offline")))
+        self.assertIsNone(c.get_or_fill("x", 5, lambda: None))
+        self.assertEqual(c.get_or_fill("x", 5, lambda: 2), 2)
+
+    def test_daemon_shared_between_clients(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/md.sock"
+            server = mdcache.CacheServer(path, mdcache.LocalCache())
+            server.bind()
+            server.start()
+            try:
+                a, b = mdcache.SocketCache(path), mdcache.SocketCache(path)
+                calls, out = [], []
+
+                def fill():
+                    calls.append(1)
+                    time.sleep(0.1)
+                    return np.arange(3)
+
+                ts = [threading.Thread(target=lambda c=c: out.append(c.get_or_fill("kl", 5, fill))) for c in (a, b) * 3]
+                for t in ts:
+                    t.start()
+                for t in ts:
+                    t.join()
+                self.assertEqual(len(calls), 1)
+                self.assertTrue(all(list(v) == [0, 1, 2] for v in out))
+                self.assertEqual(a.metrics()["server"]["size"], 1)
+                self.assertEqual((a.fallbacks, b.fallbacks), (0, 0))
+
+                # cliente cai no meio da sua vez: a chave é liberada, sem esperar o prazo
+                dead = mdcache.SocketCache(path)
+                self.assertEqual(dead._call("acquire", "sync"), ("fill",))
+                dead._local.sock.close()
+                t0 = time.monotonic()
+                self.assertEqual(b.get_or_fill("sync", 5, lambda: 7), 7)
+                self.assertLess(time.monotonic() - t0, 2)
+            finally:
+                server.stop()
+
+    def test_falls_back_without_daemon(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            c = mdcache.SocketCache(f"{tmp}/nada.sock")
+            self.assertEqual(c.get_or_fill("k", 5, lambda: 1), 1)
+            self.assertEqual(c.get_or_fill("k", 5, lambda: 2), 1)   # o cache local do processo atende
+            self.assertEqual(c.fallbacks, 2)
+            self.assertIn("local", c.metrics())
+
+    def test_shared_sync_fetches_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store, cache = CandleStore(tmp), mdcache.LocalCache()
+            live_row = {"t": 0, "o": 1, "h": 1, "l": 1, "c": 1, "v": 0}
+            with mock.patch.object(CandleStore, "sync", return_value=(0, live_row)) as sync:
+                for _ in range(3):
+                    self.assertEqual(shared_sync("POLUSDT", "1m", 10, store=store, cache=cache), (0, live_row))
+            self.assertEqual(sync.call_count, 1)
@@ -0,0 +1,192 @@
+import time, threading
+from collections import deque
+from .bot_runner import now_iso
+from .resample import parse_interval
+from .metrics import REGISTRY
+
+BASE = "1m"
+BASE_MS = 60_000
+TIMEFRAMES = ("1m", "5m", "15m", "1h", "4h")
+HISTORY = 500           # velas fechadas por timeframe na memória
+STALE_AFTER = 3 * BASE_MS
+
+
+def _merge(live, c, volume=True):
+    live["h"] = max(live["h"], c["h"])
+    live["l"] = min(live["l"], c["l"])
+    live["c"] = c["c"]
+    if volume:
+        live["v"] = live.get("v", 0.0) + c.get("v", 0.0)
+
+
+class _Frame:
+    __slots__ = ("step", "limit", "closed", "live", "seeded_at")
+
+    def __init__(self, step, limit, history):
+        self.step = step
+        self.limit = limit      # quantas velas o seed pediu
+        self.closed = deque(maxlen=history)
+        self.live = None        # vela em formação: soma dos minutos fechados do balde
+        self.seeded_at = None   # minuto do seed: volume até ele já veio na vela semeada
+
+
+class CandleHub:
+    """Velas de todos os timeframes a partir de um único feed de 1m por símbolo.
+
+    O MarketStream (stream kline_1m) chama `on_kline`; cada minuto fechado
+    entra no 1m e é somado ao balde de cada timeframe maior, que fecha junto
+    com seu último minuto. Um timeframe é semeado uma vez do CandleStore
+    (`seed`, só a cauda vai à rede) e daí em diante só cresce pelo stream, então
+    N bots em M timeframes custam um feed. Velas fechadas vão para o
+    CandleStore (`persist`), onde o proxy do painel e os próximos seeds já as
+    encontram. Buraco no stream (reconexão) descarta o símbolo para novo seed.
+    """
+
+    def __init__(self, history=HISTORY, store=None, persist=True, seed=None, clock=time.time):
+        self.history = history
+        self.store = store
+        self.persist = persist
+        self.seed = seed or self._seed
+        self.clock = clock
+        self.frames = {}        # symbol -> {interval: _Frame}
+        self.base_live = {}     # symbol -> vela de 1m em formação
+        self.last_update = {}   # symbol -> ts (s) da última mensagem
+        self.last_closed = {}   # symbol -> abertura do último minuto fechado
+        self._lock = threading.Lock()
+        self.closes = self.gaps = self.seeds = 0
+
+    def _store(self):
+        if self.store is None:
+            from .candle_store import default_store
+            self.store = default_store()
+        return self.store
+
+    def _seed(self, symbol, interval, limit):
+        # velas fechadas do store + a em formação (só a cauda vai à rede)
+        from .candle_store import store_klines
+        return store_klines(symbol, interval, limit, store=self._store())
+
+    # --- produtor (thread do stream) ---
+    def on_kline(self, symbol, interval, k):
+        if interval != BASE:
+            return
+        closed = []
+        with self._lock:
+            self.last_update[symbol] = self.clock()
+            last = self.last_closed.get(symbol)
+            if last is not None and k["t"] > last + BASE_MS and (k["closed"] or k["t"] > last + 2 * BASE_MS):
+                # minutos perdidos: os baldes ficaram furados, o próximo pedido semeia de novo
+                if self.frames.pop(symbol, None) is not None:
+                    self.gaps += 1
+                self.base_live.pop(symbol, None)
+                self.last_closed.pop(symbol, None)
+                last = None
+            c = {key: k[key] for key in ("t", "o", "h", "l", "c", "v")}
+            if not k["closed"]:
+                self.base_live[symbol] = c
+                return
+            self.base_live.pop(symbol, None)
+            if last is not None and k["t"] <= last:
+                return          # repetido
+            self.last_closed[symbol] = k["t"]
+            frames = self.frames.get(symbol, {})
+            for interval, fr in frames.items():
+                bucket = c["t"] - c["t"] % fr.step
+                if fr.closed and fr.closed[-1]["t"] >= bucket:
+                    continue    # já veio fechada no seed
+                if fr.step == BASE_MS:
+                    fr.closed.append(c)
+                    closed.append((interval, c))
+                    continue
+                if fr.live is not None and fr.live["t"] != bucket:
+                    fr.closed.append(fr.live)   # balde anterior sem o último minuto (buraco curto)
+                    closed.append((interval, fr.live))
+                    fr.live = None
+                if fr.live is None:
+                    fr.live = {**c, "t": bucket}
+                else:
+                    _merge(fr.live, c, volume=fr.seeded_at is None or c["t"] > fr.seeded_at)
+                if c["t"] + BASE_MS == bucket + fr.step:
+                    fr.closed.append(fr.live)
+                    closed.append((interval, fr.live))
+                    fr.live = None
+            self.closes += len(closed)
+        if self.persist and closed:
+            try:
+                for interval, c in closed:
+                    self._store().append(symbol, interval, [c])
+            except OSError as e:
+                print(f"[{now_iso()}] Falha ao gravar velas de {symbol}: {e}")
+
+    # --- consumidores (bots) ---
+    def fresh(self, symbol):
+        ts = self.last_update.get(symbol)
+        return ts is not None and self.clock() - ts <= STALE_AFTER / 1000
+
+    def _ensure(self, symbol, interval, limit):
+        with self._lock:
+            fr = self.frames.get(symbol, {}).get(interval)
+            if fr is not None and (limit <= fr.limit or len(fr.closed) >= min(limit - 1, self.history)):
+                return fr
+        step = parse_interval(interval)
+        rows = self.seed(symbol, interval, max(limit, 2))
+        now_ms = int(self.clock() * 1000)
+        # a fonte deu menos do que o pedido: não adianta semear de novo por tamanho
+        fr = _Frame(step, limit if len(rows) >= limit else float("inf"), self.history)
+        for r in rows:
+            if r["t"] + step <= now_ms:
+                fr.closed.append(dict(r))
+            else:
+                fr.live = dict(r)
+                fr.seeded_at = now_ms - now_ms % BASE_MS
+        if step == BASE_MS:
+            fr.live = None      # o minuto em formação vem do stream
+        with self._lock:
+            self.frames.setdefault(symbol, {})[interval] = fr
+            self.seeds += 1
+        return fr
+
+    def klines(self, symbol, interval, limit):
+        """Últimas `limit` velas no formato de get_klines (a última em formação),
+        ou None se o stream deste símbolo está parado."""
+        if not self.fresh(symbol):
+            return None
+        fr = self._ensure(symbol, interval, limit)
+        with self._lock:
+            out = list(fr.closed)[-(limit - 1):] if limit > 1 else []
+            base = self.base_live.get(symbol)
+            live = dict(fr.live) if fr.live is not None else None
+            if base is not None:
+                if live is None:
+                    live = {**base, "t": base["t"] - base["t"] % fr.step}
+                else:
+                    _merge(live, base, volume=fr.seeded_at is None or base["t"] > fr.seeded_at)
+            if live is not None:
+                out.append(live)
+        return out[-limit:]
+
+    def track(self, symbol, intervals=TIMEFRAMES, limit=100):
+        # semeia os timeframes padrão: as velas fechadas de todos vão para o store do painel
+        for interval in intervals:
+            try:
+                self._ensure(symbol, interval, limit)
+            except Exception as e:
+                print(f"[{now_iso()}] Falha ao semear {symbol} {interval}: {e}")
+
+    def metrics(self):
+        with self._lock:
+            frames = sum(len(f) for f in self.frames.values())
+        return {"symbols": len(self.frames), "frames": frames, "closes": self.closes, "gaps": self.gaps,
+                "seeds": self.seeds}
+
+
+_hub = None
+_lock = threading.Lock()
+
+def default_candle_hub():
+    global _hub
+    with _lock:
+        if _hub is None:
+            _hub = CandleHub()
+            REGISTRY.collector("gridbot_candles", _hub.metrics)
+        return _hub
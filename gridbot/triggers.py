@@ -0,0 +1,71 @@
+from bisect import bisect_left, insort
+
+ABOVE, BELOW = "above", "below"
+KIND_LABEL = {"alert": "🔔 Alerta", "take_profit": "🎯 Take profit", "stop": "🛑 Stop parcial"}
+
+
+class Trigger:
+    __slots__ = ("id", "kind", "direction", "price", "qty", "note")
+
+    def __init__(self, id, kind, direction, price, qty=None, note=""):
+        self.id = id
+        self.kind = kind
+        self.direction = direction
+        self.price = price
+        self.qty = qty
+        self.note = note or ""
+
+    @classmethod
+    def from_model(cls, t):
+        return cls(t.pk, t.kind, t.direction, t.price, t.qty, t.note)
+
+
+class TriggerBook:
+    """Gatilhos de um símbolo em duas listas ordenadas, arrumadas para que os
+    disparados fiquem sempre no fim: `above` guarda (-preço, id) e dispara com
+    preço >= nível, `below` guarda (preço, id) e dispara com preço <= nível.
+    Cada tick é um bisect por lista e um corte do sufixo: O(log n + k).
+    Gatilhos disparam uma vez e saem do livro.
+    """
+
+    def __init__(self, triggers=()):
+        self.above = []
+        self.below = []
+        self.by_id = {}
+        for t in triggers:
+            self.add(t)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def add(self, t):
+        self.by_id[t.id] = t
+        if t.direction == ABOVE:
+            insort(self.above, (-t.price, t.id))
+        else:
+            insort(self.below, (t.price, t.id))
+
+    def remove(self, tid):
+        t = self.by_id.pop(tid, None)
+        if t is not None:
+            lst, key = (self.above, (-t.price, t.id)) if t.direction == ABOVE else (self.below, (t.price, t.id))
+            i = bisect_left(lst, key)
+            if i < len(lst) and lst[i] == key:
+                del lst[i]
+        return t
+
+    def crossed(self, price):
+        # gatilhos alcançados por `price`, do nível mais próximo ao mais distante
+        out = []
+        for lst, key in ((self.above, -price), (self.below, price)):
+            i = bisect_left(lst, (key, float("-inf")))
+            if i < len(lst):
+                out += [self.by_id.pop(tid) for _, tid in reversed(lst[i:])]
+                del lst[i:]
+        return out
+
+    def nearest(self):
+        # (gatilho acima mais baixo, gatilho abaixo mais alto): o que o próximo tick pode cruzar
+        up = -self.above[-1][0] if self.above else None
+        down = self.below[-1][0] if self.below else None
+        return up, down
@@ -5,8 +5,11 @@ urlpatterns = [
     path("", views.dashboard, name="dashboard"),
     path("ping/", views.ping, name="ping"),
     path("test-telegram/", views.test_telegram, name="test_telegram"),
+    path("metrics", views.metrics_view, name="metrics"),
     # APIs
     path("api/state/", views.state_json, name="state_json"),
     path("api/signals/", views.signals_json, name="signals_json"),
     path("api/klines/", views.klines_proxy, name="klines_proxy"),
+    path("api/live/", views.live_stream, name="live_stream"),
+    path("api/metrics/", views.metrics_json, name="metrics_json"),
 ]
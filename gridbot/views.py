@@ -1,32 +1,58 @@
-import random, time, requests
-from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest
+import time, asyncio, hashlib
+import numpy as np
+from datetime import datetime, timezone as dt_timezone
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest, HttpResponseNotModified, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.shortcuts import render, redirect
 from django.views.decorators.http import require_GET, require_POST
 from django.contrib import messages
-from django.core.cache import cache
 from django.conf import settings
 
-from .models import BotConfig, BotState, BotSignal
-from .forms import BotConfigForm
+from .models import BotConfig, BotSignal, PriceTrigger, panel_symbol, state_for
+from .forms import BotConfigForm, PriceTriggerForm
+from .candle_store import default_store, shared_sync
+from .exchange import shared_session
+from .mdcache import default_market_cache
+from .live import KEEPALIVE, default_hub, signal_payload, state_payload
+from . import metrics
+from .resample import base_intervals, lttb, pack, parse_interval, resample
 
 def ping(request): 
     return HttpResponse("pong gridbot")
 
 def dashboard(request):
     cfg = BotConfig.objects.order_by("-id").first() or BotConfig.objects.create()
-    state, _ = BotState.objects.get_or_create(pk=1)
+    state = state_for(cfg.symbol)
 
+    form = BotConfigForm(instance=cfg)
+    trigger_form = PriceTriggerForm()
     if request.method == "POST" and "save_config" in request.POST:
         form = BotConfigForm(request.POST, instance=cfg)
         if form.is_valid():
             form.save()
             messages.success(request, "Configuração salva.")
             return redirect("dashboard")
-    else:
-        form = BotConfigForm(instance=cfg)
+    elif request.method == "POST" and "add_trigger" in request.POST:
+        trigger_form = PriceTriggerForm(request.POST)
+        if trigger_form.is_valid():
+            t = trigger_form.save(commit=False)
+            t.symbol = cfg.symbol
+            last = default_store().read(cfg.symbol, "1m", limit=1)["c"]   # último fechamento local, sem rede
+            t.direction = trigger_form.direction_for(float(last[-1]) if len(last) else None)
+            t.save()
+            messages.success(request, f"Gatilho criado: {t.get_kind_display()} @ {t.price}.")
+            return redirect("dashboard")
+    elif request.method == "POST" and "delete_trigger" in request.POST:
+        PriceTrigger.objects.filter(pk=request.POST.get("delete_trigger")).delete()
+        messages.success(request, "Gatilho removido.")
+        return redirect("dashboard")
 
     return render(request, "gridbot/dashboard.html", {
         "form": form,
+        "trigger_form": trigger_form,
+        "triggers": PriceTrigger.objects.filter(symbol=cfg.symbol).order_by("-active", "price")[:50],
         "state": state,
         # sem threads no web: status é o que o processo runbot gravar
         "is_running": bool(state.running),
@@ -40,7 +66,7 @@ def _send_telegram(text: str):
     if not token or not chat_id:
         raise RuntimeError("TELEGRAM_BOT_TOKEN/TELEGRAM_CHAT_ID ausentes do .env")
     url = f"https://api.telegram.org/bot{token}/sendMessage"
-    r = requests.post(url, data={"chat_id": chat_id, "text": text}, timeout=10)
+    r = shared_session().post(url, data={"chat_id": chat_id, "text": text}, timeout=10)
     r.raise_for_status()
     return r.json()
 
@@ -55,71 +81,182 @@ def test_telegram(request):
 
 # --- APIs para painel ---
 def state_json(request):
-    st, _ = BotState.objects.get_or_create(pk=1)
-    return JsonResponse({
-        "running": st.running,
-        "ref_price": st.ref_price,
-        "trailing_high": st.trailing_high,
-        "last_level_idx": st.last_level_idx,
-        "last_kind": st.last_kind,
-        "last_message": st.last_message,
-        "last_price": st.last_price,
-        "last_pnl_pct": st.last_pnl_pct,
-        "atr": st.atr,
-        "eff_grid_step": st.eff_grid_step,
-        "atr_trailing_stop": st.atr_trailing_stop,
-    })
+    # ?symbol=ETHUSDT; padrão: o símbolo do painel
+    st = state_for((request.GET.get("symbol") or panel_symbol()).upper())
+    return JsonResponse(state_payload(st))
+
+def _parse_when(v):
+    # epoch em ms ou ISO 8601; None se vazio, ValueError se inválido
+    if not v:
+        return None
+    if v.isdigit():
+        return datetime.fromtimestamp(int(v) / 1000, tz=dt_timezone.utc)
+    d = parse_datetime(v)
+    if d is None:
+        raise ValueError(v)
+    return d if timezone.is_aware(d) else timezone.make_aware(d)
 
+@require_GET
 def signals_json(request):
-    qs = BotSignal.objects.order_by("-id")[:20]
-    data = [{
-        "t": s.created_at.strftime("%H:%M:%S"),
-        "kind": s.kind,
-        "message": s.message,
-        "price": s.price,
-        "pnl_pct": s.pnl_pct,
-    } for s in qs]
-    return JsonResponse(data, safe=False)
+    """Sinais mais recentes primeiro. Filtros: since_id (só os novos),
+    before_id (página anterior), kind (lista por vírgula), symbol, from/to
+    (ms ou ISO) e limit. Responde ETag e 304 quando nada mudou."""
+    g = request.GET
+    try:
+        since_id = int(g["since_id"]) if g.get("since_id") else None
+        before_id = int(g["before_id"]) if g.get("before_id") else None
+        limit = max(1, min(int(g.get("limit", "20")), 500))
+        t_from, t_to = _parse_when(g.get("from")), _parse_when(g.get("to"))
+    except ValueError:
+        return HttpResponseBadRequest("parâmetros inválidos")
+
+    qs = BotSignal.objects.all()
+    if g.get("symbol"):
+        qs = qs.filter(symbol=g["symbol"].upper())
+    kinds = [k for k in g.get("kind", "").split(",") if k]
+    if kinds:
+        qs = qs.filter(kind__in=kinds)
+    if since_id is not None:
+        qs = qs.filter(id__gt=since_id)
+    if before_id is not None:
+        qs = qs.filter(id__lt=before_id)
+    if t_from:
+        qs = qs.filter(created_at__gte=t_from)
+    if t_to:
+        qs = qs.filter(created_at__lt=t_to)
+    if since_id is not None:
+        # cursor: os mais antigos depois dele primeiro, senão um atraso maior que limit pularia linhas
+        rows = list(qs.order_by("id")[:limit])[::-1]
+    else:
+        rows = list(qs.order_by("-id")[:limit])
+
+    etag = '"%s"' % hashlib.md5(
+        (request.GET.urlencode() + "|" + ",".join(str(s.id) for s in rows)).encode()).hexdigest()[:16]
+    if etag in request.headers.get("If-None-Match", ""):
+        resp = HttpResponseNotModified()
+    else:
+        resp = JsonResponse([signal_payload(s) for s in rows], safe=False)
+    resp["ETag"] = etag
+    # próximo cursor: o maior id visto (ou o que o cliente já tinha)
+    resp["X-Last-Id"] = str(max([s.id for s in rows], default=since_id or 0))
+    return resp
+
+# --- Push (SSE): estado, sinais e vela num único stream por aba ---
+@require_GET
+async def live_stream(request):
+    if not isinstance(request, ASGIRequest):
+        # WSGI não segura conexão longa: 204 faz o EventSource desistir e o painel volta ao polling
+        return HttpResponse(status=204)
+    last = request.headers.get("Last-Event-ID", "")
+    hub = default_hub()
+    q = hub.subscribe(int(last) if last.isdigit() else None)
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    msg = await asyncio.wait_for(q.get(), KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if msg is None:
+                    return
+                yield msg
+        finally:
+            hub.unsubscribe(q)
+
+    resp = StreamingHttpResponse(events(), content_type="text/event-stream")
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"
+    return resp
+
+# --- Métricas: este processo + snapshot do runner ---
+@require_GET
+def metrics_view(request):
+    return HttpResponse(metrics.render(metrics.snapshots()), content_type="text/plain; version=0.0.4")
+
+@require_GET
+def metrics_json(request):
+    return JsonResponse(metrics.summary(metrics.snapshots()))
 
 # --- Proxy de klines (evita bloqueios/CORS) ---
-BINANCE_HOSTS = ["https://api.binance.com", "https://api1.binance.com", "https://api2.binance.com"]
 ALLOWED_SYMBOLS = {"POLUSDT"}
-ALLOWED_INTERVALS = {"1m","5m","15m","1h"}
+MAX_BARS = 20_000      # velas nativas lidas por resposta
+MAX_BACKFILL = 20_000  # velas nativas baixadas de uma vez com o store vazio
 
 @require_GET
 def klines_proxy(request):
-    symbol = (request.GET.get("symbol") or "POLUSDT").upper()
-    interval = request.GET.get("interval","1m")
+    """Velas do store local, reamostradas para qualquer `interval` (ex.: 7m,
+    2h, 3d). Faixa: start/end em ms ou as últimas `limit`; `width` reduz por
+    LTTB para caber em tantos pixels. `format`: rows ([{t, close}], padrão),
+    cols (JSON colunar t/o/h/l/c/v) ou bin (ver resample.pack)."""
+    g = request.GET
+    symbol = (g.get("symbol") or "POLUSDT").upper()
+    fmt = g.get("format", "rows")
     try:
-        limit = max(1, min(int(request.GET.get("limit","200")), 500))
+        step = parse_interval(g.get("interval", "1m"))
+        limit = max(1, min(int(g.get("limit", "200")), MAX_BARS))
+        width = int(g["width"]) if g.get("width") else None
+        start = int(g["start"]) if g.get("start") else None
+        end = int(g["end"]) if g.get("end") else None
     except ValueError:
-        return HttpResponseBadRequest("limit inválido")
-
-    if symbol not in ALLOWED_SYMBOLS or interval not in ALLOWED_INTERVALS:
+        return HttpResponseBadRequest("parâmetros inválidos")
+    # width < 3: o LTTB precisa das duas pontas e de um ponto no meio
+    if fmt not in ("rows", "cols", "bin") or step > parse_interval("1w") or (width is not None and width < 3):
+        return HttpResponseBadRequest("parâmetros não permitidos")
+    if symbol not in ALLOWED_SYMBOLS and not BotConfig.objects.filter(symbol=symbol).exists():
         return HttpResponseBadRequest("parâmetros não permitidos")
 
-    ck = f"kl_{symbol}_{interval}_{limit}"
-    if (cached := cache.get(ck)):
-        return JsonResponse(cached, safe=False)
+    # o formato fica fora da chave: rows/cols/bin reaproveitam as mesmas colunas
+    # cache da máquina (mdcache): os workers web dividem a mesma busca; None não é guardado
+    ck = f"kl:{default_store().root}:{symbol}_{step}_{start}_{end}_{limit}_{width}"
+    a = default_market_cache().get_or_fill(ck, 8, lambda: _klines(symbol, step, start, end, limit, width))
+    if a is None:
+        # sem fallback inventado: o gráfico mostra o erro em vez de dados falsos
+        return JsonResponse({"error": "sem velas locais e corretora indisponível"}, status=503)
 
-    for host in BINANCE_HOSTS:
-        try:
-            r = requests.get(f"{host}/api/v3/klines",
-                             params={"symbol": symbol, "interval": interval, "limit": limit},
-                             timeout=8, headers={"User-Agent": "polgrid-bot/1.0"})
-            r.raise_for_status()
-            data = [{"t": k[0], "close": float(k[4])} for k in r.json()]
-            cache.set(ck, data, 8)
-            return JsonResponse(data, safe=False)
-        except Exception:
-            continue
-
-    # fallback offline simples
-    rows = []
-    base = 0.25
-    t0 = int(time.time() - limit*60) * 1000
-    price = base
-    for i in range(limit):
-        price += random.uniform(-0.002, 0.002)
-        rows.append({"t": t0 + i*60_000, "close": round(max(price, 0.01), 6)})
-    return JsonResponse(rows, safe=False)
+    if fmt == "bin":
+        return HttpResponse(pack(a), content_type="application/octet-stream")
+    if fmt == "cols":
+        return JsonResponse({k: a[k].tolist() for k in ("t", "o", "h", "l", "c", "v")})
+    return JsonResponse([{"t": t, "close": c} for t, c in zip(a["t"].tolist(), a["c"].tolist())], safe=False)
+
+def _klines(symbol, step, start, end, limit, width):
+    now = int(time.time() * 1000)
+    end = end or now + step
+    last_n = start is None  # sem start: as últimas `limit` velas do intervalo pedido
+    start = start if start is not None else end - limit * step
+    start -= start % step
+
+    store = default_store()
+    best = None
+    for i, (base, base_ms) in enumerate(base_intervals(step)):
+        live = None
+        if i == 0:
+            try:
+                # só a cauda que falta vai à Binance. Store vazio baixa do início pedido até
+                # agora (o store só cresce pela cauda), não as últimas velas da faixa
+                want = (max(now, end) - start) // base_ms + 1
+                _, live = shared_sync(symbol, base, backfill=min(MAX_BACKFILL, max(want, 2)), store=store)
+            except Exception:
+                pass  # rede fora: serve o que já está gravado
+        a = {k: np.asarray(v) for k, v in store.read(symbol, base, start=start, end=end, limit=MAX_BARS).items()}
+        if live and start <= live["t"] < end:
+            a = {k: np.append(a[k], live[k]) for k in a}
+        if len(a["t"]) and (best is None or a["t"][0] < best[1]["t"][0]):
+            best = (base_ms, a)
+        # cobre o início pedido: não precisa descer para um intervalo mais fino
+        if len(a["t"]) and a["t"][0] <= start + base_ms:
+            break
+    if best is None:
+        return None
+    base_ms, a = best
+    if base_ms != step:
+        a = resample(a, step)
+    if last_n:
+        a = {k: v[-limit:] for k, v in a.items()}
+    if width and len(a["t"]) > width:
+        idx = lttb(a["t"], a["c"], width)
+        a = {k: v[idx] for k, v in a.items()}
+    return a
@@ -48,7 +48,8 @@ TEMPLATES = [
 WSGI_APPLICATION = "polgrid.wsgi.application"
 
 DATABASES = {
-    "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": BASE_DIR / "db.sqlite3"}
+    "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": BASE_DIR / "db.sqlite3",
+                "OPTIONS": {"timeout": 20}}
 }
 
 AUTH_PASSWORD_VALIDATORS = []
@@ -66,3 +67,46 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Telegram (lido no runner)
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+# destinos extras: "chat" ou "token@chat", separados por vírgula
+TELEGRAM_CHATS = os.getenv("TELEGRAM_CHATS", "")
+
+# painel ao vivo (SSE em /api/live/, exige servidor ASGI): intervalo do poller por processo
+LIVE_POLL_SEC = float(os.getenv("LIVE_POLL_SEC", "1"))
+
+# snapshot de métricas gravado pelo runner e lido pelo web (/metrics)
+METRICS_FILE = os.getenv("METRICS_FILE", str(BASE_DIR / "metrics.json"))
+
+# manage.py runbot: socket unix por onde o painel avisa que um BotConfig mudou
+RUNNER_SOCKET = os.getenv("RUNNER_SOCKET", str(BASE_DIR / "runner.sock"))
+
+# manage.py benchmark: histórico de resultados por commit
+BENCH_DIR = os.getenv("BENCH_DIR", str(BASE_DIR / "benchmarks"))
+
+# execução de ordens (bots com auto_trade): "" só sugere no Telegram, "paper" usa o
+# simulador local, ou o caminho pontuado de uma subclasse de gridbot.execution.ExchangeAdapter
+EXECUTION_ADAPTER = os.getenv("EXECUTION_ADAPTER", "")
+
+# Preços via WebSocket (REST continua como fallback)
+MARKET_STREAM = os.getenv("MARKET_STREAM", "True") == "True"
+
+# Cache local de velas (arquivos colunares por símbolo/intervalo)
+CANDLE_STORE_DIR = os.getenv("CANDLE_STORE_DIR", str(BASE_DIR / "candles"))
+
+# Cache de mercado compartilhado entre o runner e os workers web (velas, sync do store):
+# daemon no socket unix (sobe com manage.py runbot ou manage.py mdcache); vazio = cache
+# só do processo. MARKET_CACHE_SIZE: entradas guardadas antes de descartar as mais antigas (LRU)
+MARKET_CACHE_SOCKET = os.getenv("MARKET_CACHE_SOCKET", str(BASE_DIR / "mdcache.sock"))
+MARKET_CACHE_SIZE = int(os.getenv("MARKET_CACHE_SIZE", "1024"))
+
+# runbot --workers sem stream: os workers leem o ticker completo do cache de mercado nas
+# bordas desta janela (s), uma busca na corretora por janela para todos
+PRICE_WINDOW_SEC = float(os.getenv("PRICE_WINDOW_SEC", "2"))
+
+# Diário binário do runner (preços, velas do ATR, sinais), um arquivo por símbolo/dia;
+# vazio desliga. manage.py replayjournal refaz os sinais a partir dele
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", str(BASE_DIR / "journal"))
+
+# Orçamento de peso da API da Binance por minuto (o limite do IP é 1200)
+BINANCE_WEIGHT_LIMIT = int(os.getenv("BINANCE_WEIGHT_LIMIT", "1000"))
+# fração desse orçamento que os polls de preço adaptativos (sem stream) podem usar
+POLL_WEIGHT_SHARE = float(os.getenv("POLL_WEIGHT_SHARE", "0.5"))